@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+'''
+    Compares the current implementation of greenado.generator against the
+    implementation from greenado 0.2.5, using chains of nested generator
+    functions that each yield many times.
+
+    Usage: python generator_bench.py [depth] [yields] [iterations]
+'''
+
+from __future__ import print_function
+
+from functools import wraps
+import sys
+import time
+import types
+
+import greenado
+import greenlet
+
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+
+
+def old_generator(f):
+    '''greenado.generator as of 0.2.5'''
+
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+
+        assert greenlet.getcurrent().parent is not None
+
+        try:
+            result = f(*args, **kwargs)
+        except (gen.Return, StopIteration) as e:
+            result = getattr(e, 'value', None)
+        else:
+            if isinstance(result, types.GeneratorType):
+                try:
+                    future = next(result)
+
+                    while True:
+                        try:
+                            value = greenado.gyield(future)
+                        except Exception:
+                            result.throw(*sys.exc_info())
+                        else:
+                            future = result.send(value)
+
+                except (gen.Return, StopIteration) as e:
+                    return getattr(e, 'value', None)
+
+        return result
+
+    return wrapper
+
+
+def _done_future(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def _pending_future(value):
+    future = Future()
+    IOLoop.current().add_callback(future.set_result, value)
+    return future
+
+
+def make_chain(decorator, depth, yields):
+    '''Returns a function that calls a chain of `depth` generators'''
+
+    @decorator
+    def leaf():
+        total = 0
+        for i in range(yields):
+            total += yield _done_future(1)
+        total += yield _pending_future(1)
+        raise gen.Return(total)
+
+    fn = leaf
+    for _ in range(depth - 1):
+        def _make(inner):
+            @decorator
+            def node():
+                value = yield _done_future(0)
+                raise gen.Return(value + inner())
+            return node
+        fn = _make(fn)
+
+    return fn
+
+
+def run(decorator, depth, yields, iterations):
+    chain = make_chain(decorator, depth, yields)
+
+    @greenado.groutine
+    def _main():
+        for _ in range(iterations):
+            chain()
+
+    start = time.time()
+    IOLoop.current().run_sync(_main, timeout=600)
+    return time.time() - start
+
+
+def main():
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    yields = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    iterations = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+
+    print("depth=%d yields=%d iterations=%d" % (depth, yields, iterations))
+
+    for name, decorator in (('0.2.5', old_generator),
+                            ('current', greenado.generator)):
+        elapsed = run(decorator, depth, yields, iterations)
+        print("%-8s %.3fs" % (name, elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+'''
+    Measures the memory used by parked groutines as their number grows.
+    Each groutine calls a few frames deep and then waits on a future that
+    is shared by all of them. Each size is measured in a separate process,
+    so that memory freed by one run doesn't hide the cost of the next.
+
+    Reads RSS from /proc, so it only works on Linux.
+
+    Usage: python stack_bench.py [max_groutines] [depth] [prewarm]
+'''
+
+from __future__ import print_function
+
+import gc
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import greenado
+
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+
+
+def rss():
+    with open('/proc/self/statm') as fp:
+        return int(fp.read().split()[1]) * resource.getpagesize()
+
+
+def park(future, depth):
+    if depth:
+        return park(future, depth - 1)
+    return greenado.gyield(future)
+
+
+def run(count, depth, prewarm):
+
+    @greenado.groutine
+    def _main():
+        future = Future()
+
+        gc.collect()
+        before = rss()
+        start = time.time()
+
+        children = [greenado.gcall(park, future, depth) for _ in range(count)]
+
+        elapsed = time.time() - start
+        after = rss()
+        usage = greenado.stack_usage()
+
+        future.set_result(None)
+        for child in children:
+            greenado.gyield(child)
+
+        return after - before, usage, elapsed
+
+    if prewarm:
+        greenado.prewarm(count)
+
+    return IOLoop.current().run_sync(_main, timeout=3600)
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        count, depth, prewarm = [int(arg) for arg in sys.argv[2:5]]
+        print(*run(count, depth, prewarm))
+        return
+
+    max_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    depth = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    prewarm = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+
+    print("depth=%d prewarm=%d" % (depth, prewarm))
+    print("%10s %10s %12s %12s %10s" % ("groutines", "rss", "rss/each",
+                                       "stack/each", "spawn"))
+
+    count = 1000
+    while count <= max_count:
+        output = subprocess.check_output([sys.executable, __file__, '--child',
+                                          str(count), str(depth), str(prewarm)],
+                                         env=dict(os.environ))
+        grown, usage, elapsed = output.split()
+        grown, usage, elapsed = int(grown), int(usage), float(elapsed)
+
+        print("%10d %8.1fMB %10.0fB %10.0fB %9.3fs" % (
+              count, grown / 1048576.0, grown / float(count),
+              usage / float(count), elapsed))
+        count *= 10
+
+
+if __name__ == '__main__':
+    main()
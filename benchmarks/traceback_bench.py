@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+'''
+    Measures the memory kept alive by failed groutine futures under each
+    traceback mode (see greenado.set_traceback_mode). Each groutine fails
+    several frames deep, with a moderately sized local variable in each
+    frame, and the failed futures are all kept, as a cache or a retry loop
+    might do.
+
+    Requires Python 3.4+ for tracemalloc.
+
+    Usage: python traceback_bench.py [futures] [depth]
+'''
+
+from __future__ import print_function
+
+import gc
+import sys
+import time
+import tracemalloc
+
+import greenado
+
+from tornado.ioloop import IOLoop
+
+
+def fail(depth):
+    payload = list(range(100))
+    if depth:
+        return fail(depth - 1) + len(payload)
+    raise ValueError("backend unavailable")
+
+
+def run(mode, count, depth):
+
+    @greenado.groutine
+    def _main():
+        futures = []
+        for _ in range(count):
+            futures.append(greenado.gcall(fail, depth))
+        for future in futures:
+            future.exception()
+        return futures
+
+    greenado.set_traceback_mode(mode)
+    try:
+        gc.collect()
+        tracemalloc.start()
+        start = time.time()
+
+        futures = IOLoop.current().run_sync(_main)
+
+        elapsed = time.time() - start
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        greenado.set_traceback_mode('full')
+
+    del futures
+    return current, peak, elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    depth = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    print("futures=%d depth=%d" % (count, depth))
+    print("%-14s %12s %12s %10s" % ("mode", "retained", "peak", "time"))
+
+    for mode in ('full', 'clear_locals', 'compact'):
+        current, peak, elapsed = run(mode, count, depth)
+        print("%-14s %10.1fMB %10.1fMB %9.3fs" % (mode, current / 1048576.0,
+                                                  peak / 1048576.0, elapsed))
+
+
+if __name__ == '__main__':
+    main()
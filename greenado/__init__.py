@@ -1,3 +1,10 @@
-
-from .concurrent import gcall, generator, gmoment, groutine, gsleep, gyield, TimeoutError
+from .concurrent import add_hook, CancelledError, checkpoint, configure_priorities, gcall, gcall_priority, generator, giter, gmap, GreenletHook, gmoment, gperiodic, groutine, gsleep, gyield, prewarm, remove_hook, set_stack_budget, set_time_slice, set_traceback_mode, stack_usage, StackBudgetExceeded, TimeoutError
+from .concurrent import PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
+from .cache import cached
+from .hedging import hedged
+from .iterators import aiter_from, iter_from
+from .loader import BatchLoader
+from .ratelimit import KeyedRateLimiter, RateLimiter
+from .resilience import circuit_breaker, CircuitOpenError, retry, RetryBudget
+from .threads import LoopGroup, submit_threadsafe
 from .version import __version__
@@ -0,0 +1,228 @@
+#
+# Copyright 2014-2016 Dustin Spicuzza
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+'''
+    Detection of blocking calls made from groutines.
+
+    A groutine that calls :func:`time.sleep`, connects a blocking socket or
+    waits on a subprocess stalls the IOLoop, and every other groutine with
+    it. :class:`BlockingDetector` reports such calls when they are made
+    from a greenlet created by greenado, along with the function that the
+    groutine was started with::
+
+        detector = BlockingDetector(mode='warn')
+        detector.start()
+
+    Calls are detected with :func:`sys.addaudithook` on Python 3.8+, and by
+    replacing a few functions such as :func:`time.sleep` with wrappers on
+    versions that don't raise an audit event for them. Calls made outside
+    of groutines are only checked for whether a detector is running, which
+    is a single global lookup.
+
+    .. versionadded:: 0.3.0
+'''
+
+from collections import defaultdict
+from functools import wraps
+import socket
+import sys
+import time
+import traceback
+
+import greenlet
+
+from .concurrent import _Groutine
+
+import logging
+logger = logging.getLogger('greenado')
+
+
+class BlockingCallError(Exception):
+    '''
+        Raised by blocking calls made from groutines while a
+        :class:`BlockingDetector` is running with ``mode='raise'``
+    '''
+
+
+#: Audit events that are reported by default
+DEFAULT_EVENTS = frozenset([
+    'time.sleep',
+    'socket.connect',
+    'socket.getaddrinfo',
+    'socket.gethostbyname',
+    'socket.gethostbyaddr',
+    'subprocess.Popen',
+    'os.system',
+    'open',
+])
+
+_has_audit = hasattr(sys, 'addaudithook')
+
+# (object, attribute, event, python version that added the audit event)
+_wrappable = [
+    (time, 'sleep', 'time.sleep', (3, 11)),
+    (socket.socket, 'connect', 'socket.connect', (3, 8)),
+    (socket, 'getaddrinfo', 'socket.getaddrinfo', (3, 8)),
+    (socket, 'gethostbyname', 'socket.gethostbyname', (3, 8)),
+    (socket, 'gethostbyaddr', 'socket.gethostbyaddr', (3, 8)),
+]
+
+# the detector that is running, if any. Audit hooks can't be removed, so
+# the hook is installed once and does nothing while this is None.
+_detector = None
+_hook_installed = False
+
+
+def _audit(event, args):
+    detector = _detector
+    if detector is None or event not in detector.events:
+        return
+
+    gr = greenlet.getcurrent()
+    if gr.__class__ is _Groutine and gr.fn is not None:
+        detector._found(event, args, gr)
+
+
+def _wrap(fn, event):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if _detector is not None:
+            _audit(event, args)
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def _name(fn):
+    fn = getattr(fn, 'func', fn)
+    return getattr(fn, '__qualname__', None) or getattr(fn, '__name__', None) or repr(fn)
+
+
+class BlockingDetector(object):
+    '''
+        Reports blocking calls made from greenlets created by greenado
+
+        :param mode:        What to do when a blocking call is found:
+
+                            * 'warn': log a warning with the stack, once for
+                              each place that the call is made from
+                            * 'count': only count it, see :attr:`counts`
+                            * 'raise': raise :exc:`BlockingCallError` instead
+                              of making the call
+
+                            Calls are counted in every mode.
+        :param events:      Names of the audit events to report, defaults to
+                            :data:`DEFAULT_EVENTS`. 'open' and
+                            'subprocess.Popen' can only be detected on
+                            Python 3.8+.
+        :param stack_depth: Number of frames to include in warnings
+
+        Only one detector can run at a time.
+    '''
+
+    def __init__(self, mode='warn', events=None, stack_depth=5):
+        if mode not in ('warn', 'count', 'raise'):
+            raise ValueError("mode must be 'warn', 'count' or 'raise'")
+
+        self.mode = mode
+        self.events = frozenset(DEFAULT_EVENTS if events is None else events)
+        self.stack_depth = stack_depth
+
+        #: (name of the groutine's function, event): number of calls
+        self.counts = defaultdict(int)
+
+        self._warned = set()
+        self._reporting = False
+        self._originals = []
+
+    def start(self):
+        '''Starts reporting blocking calls'''
+        global _detector, _hook_installed
+
+        if _detector is self:
+            return
+        if _detector is not None:
+            raise RuntimeError("another BlockingDetector is already running")
+
+        if _has_audit and not _hook_installed:
+            sys.addaudithook(_audit)
+            _hook_installed = True
+
+        for obj, attr, event, audited in _wrappable:
+            if event in self.events and (not _has_audit or sys.version_info < audited):
+                fn = getattr(obj, attr)
+                self._originals.append((obj, attr, fn))
+                setattr(obj, attr, _wrap(fn, event))
+
+        _detector = self
+
+    def stop(self):
+        '''Stops reporting blocking calls'''
+        global _detector
+
+        if _detector is not self:
+            return
+
+        _detector = None
+        for obj, attr, fn in reversed(self._originals):
+            setattr(obj, attr, fn)
+        del self._originals[:]
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _found(self, event, args, gr):
+        # sockets used by tornado are non-blocking, and connecting them is fine
+        if event == 'socket.connect' and args and args[0].gettimeout() == 0.0:
+            return
+
+        # logging may open files or sockets itself
+        if self._reporting:
+            return
+
+        name = _name(gr.fn)
+        self.counts[(name, event)] += 1
+
+        if self.mode == 'raise':
+            raise BlockingCallError("%s called from groutine %s" % (event, name))
+
+        if self.mode == 'warn':
+            self._reporting = True
+            try:
+                self._warn(event, args, name)
+            finally:
+                self._reporting = False
+
+    def _warn(self, event, args, name):
+        # skip _warn, _found, _audit and the wrapper if there is one
+        frame = sys._getframe(3)
+        while frame is not None and frame.f_globals.get('__name__') == __name__:
+            frame = frame.f_back
+
+        if frame is None:
+            return
+
+        key = (name, event, frame.f_code.co_filename, frame.f_lineno)
+        if key in self._warned:
+            return
+        self._warned.add(key)
+
+        stack = traceback.format_stack(frame, limit=self.stack_depth)
+        logger.warning("Blocking call %s%r in groutine %s\n%s", event,
+                       tuple(args), name, ''.join(stack).rstrip('\n'))
@@ -0,0 +1,177 @@
+#
+# Copyright 2014-2016 Dustin Spicuzza
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+'''
+    Memoization for functions that are called from groutines.
+'''
+
+from collections import namedtuple, OrderedDict
+from functools import wraps
+
+from tornado.ioloop import IOLoop
+
+from .concurrent import gcall, gyield
+
+import logging
+logger = logging.getLogger('greenado')
+
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'coalesced', 'stale',
+                                     'maxsize', 'currsize'])
+
+_kwd_mark = object()
+
+
+class _Cache(object):
+
+    def __init__(self, fn, maxsize, ttl, stale_ttl):
+        self.fn = fn
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+
+        # key: (value, expires)
+        self.entries = OrderedDict()
+        # key: future
+        self.inflight = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stale = 0
+
+    def get(self, args, kwargs):
+        key = args
+        if kwargs:
+            key += (_kwd_mark,) + tuple(sorted(kwargs.items()))
+
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            value, expires = entry
+
+            if expires is None or IOLoop.current().time() < expires:
+                self.entries[key] = entry
+                self.hits += 1
+                return value
+
+            if self.stale_ttl and IOLoop.current().time() < expires + self.stale_ttl:
+                self.entries[key] = entry
+                self.stale += 1
+                if key not in self.inflight:
+                    IOLoop.current().add_future(self._load(key, args, kwargs),
+                                                _log_refresh_error)
+                return value
+
+        future = self.inflight.get(key)
+        if future is None:
+            self.misses += 1
+            future = self._load(key, args, kwargs)
+        else:
+            self.coalesced += 1
+
+        return gyield(future)
+
+    def _load(self, key, args, kwargs):
+
+        def _call():
+            try:
+                value = self.fn(*args, **kwargs)
+            finally:
+                self.inflight.pop(key, None)
+
+            self._store(key, value)
+            return value
+
+        future = gcall(_call)
+        if not future.done():
+            self.inflight[key] = future
+
+        return future
+
+    def _store(self, key, value):
+        expires = None
+        if self.ttl is not None:
+            expires = IOLoop.current().time() + self.ttl
+
+        self.entries.pop(key, None)
+        self.entries[key] = (value, expires)
+
+        if self.maxsize is not None and len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.coalesced, self.stale,
+                         self.maxsize, len(self.entries))
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = self.coalesced = self.stale = 0
+
+
+def _log_refresh_error(future):
+    try:
+        future.result()
+    except Exception:
+        logger.warning("cached() background refresh failed", exc_info=True)
+
+
+def cached(maxsize=128, ttl=None, stale_ttl=None):
+    '''
+        A decorator that memoizes the results of a function that is called
+        from a groutine, similar to :func:`functools.lru_cache`. The
+        decorated function may use :func:`gyield <greenado.concurrent.gyield>`,
+        and must only be called from functions that either have a
+        :func:`@greenado.groutine <greenado.concurrent.groutine>` decorator,
+        or functions that are children of functions that have the decorator
+        applied.
+
+        If the function is called while a call with the same arguments is
+        already in progress, the caller waits for the in-progress call to
+        finish instead of calling the function again. Exceptions are raised
+        to all of the waiting callers, and are not cached.
+
+        The decorated function has ``cache_info()`` and ``cache_clear()``
+        functions, similar to those of :func:`functools.lru_cache`.
+        ``cache_info()`` returns a :class:`CacheInfo` tuple containing
+        ``hits``, ``misses``, ``coalesced`` (callers that waited on an
+        in-progress call), ``stale`` (stale results returned),
+        ``maxsize`` and ``currsize``.
+
+        :param maxsize:   Maximum number of results to keep, the least
+                          recently used results are discarded first. If
+                          None, the cache is unbounded.
+        :param ttl:       Number of seconds that a result is valid for. If
+                          None, results never expire.
+        :param stale_ttl: Number of seconds after a result expires that it
+                          may still be returned. When a stale result is
+                          returned, the function is called in the background
+                          to refresh the cached result.
+
+        .. versionadded:: 0.3.0
+    '''
+
+    def decorator(f):
+        cache = _Cache(f, maxsize, ttl, stale_ttl)
+
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            return cache.get(args, kwargs)
+
+        wrapper.cache_info = cache.info
+        wrapper.cache_clear = cache.clear
+        return wrapper
+
+    return decorator
@@ -14,9 +14,16 @@
 # limitations under the License.
 #
 
-from functools import wraps
+from collections import deque
+from functools import partial, wraps
+import heapq
+import random
 import sys
+import threading
+import time
+import traceback
 import types
+import weakref
 
 import greenlet
 
@@ -30,18 +37,615 @@ try:
 except ImportError:
     from tornado.concurrent import Future as _Future
 
+try:
+    from tornado.concurrent import is_future
+except ImportError:
+    def is_future(x):
+        return isinstance(x, _Future)
+
 try:
     from tornado.concurrent import future_set_exc_info
 except ImportError:
     def future_set_exc_info(future, exc_info):
         future.set_exc_info(exc_info)
 
+try:
+    from tornado.concurrent import chain_future
+except ImportError:
+    def chain_future(a, b):
+        def copy(future):
+            if future.exception() is not None:
+                b.set_exception(future.exception())
+            else:
+                b.set_result(future.result())
+        IOLoop.current().add_future(a, copy)
+
+try:
+    from itertools import izip as _izip
+except ImportError:
+    _izip = zip
+
 import logging
 logger = logging.getLogger('greenado')
 
 class TimeoutError(Exception):
     """Exception raised by ``gyield`` in timeout."""
 
+class CancelledError(Exception):
+    """
+        Exception thrown into a groutine when a :func:`gyield` that is
+        waiting on it times out with ``cancel_on_timeout`` set.
+        
+        .. versionadded:: 0.3.0
+    """
+
+
+class GreenletHook(object):
+    '''
+        Base class for objects that are notified when greenlets created by
+        greenado are started, suspended, resumed, and finished. Register
+        hooks using :func:`add_hook`.
+        
+        Hooks are called synchronously from the greenlet in question (except
+        for :meth:`on_spawn`, which is called from the greenlet that created
+        it), so they should be fast and must not switch greenlets.
+        
+        .. versionadded:: 0.3.0
+    '''
+    
+    def on_spawn(self, gr, parent, fn):
+        '''
+            Called when :func:`gcall` or a :func:`groutine` creates a greenlet,
+            before it starts running.
+            
+            :param gr:     The new greenlet
+            :param parent: The greenlet that called :func:`gcall`
+            :param fn:     The function that the greenlet will run
+        '''
+    
+    def on_suspend(self, gr, future):
+        '''
+            Called when a greenlet is about to switch away to wait on
+            something.
+            
+            :param gr:     The greenlet being suspended
+            :param future: The future being waited on, or None if the
+                           greenlet is waiting in :func:`gsleep` or
+                           :func:`gmoment`
+        '''
+    
+    def on_resume(self, gr):
+        '''Called when a greenlet has finished waiting'''
+    
+    def on_finish(self, gr):
+        '''Called when the function run by a greenlet returns or raises'''
+
+
+# replaced rather than modified, so that greenlets in other threads can
+# iterate over it without a lock
+_hooks = ()
+_hooks_lock = threading.Lock()
+
+def add_hook(hook):
+    '''
+        Registers a :class:`GreenletHook`
+        
+        .. versionadded:: 0.3.0
+    '''
+    global _hooks
+    with _hooks_lock:
+        _hooks = _hooks + (hook,)
+
+def remove_hook(hook):
+    '''
+        Unregisters a :class:`GreenletHook`
+        
+        .. versionadded:: 0.3.0
+    '''
+    global _hooks
+    with _hooks_lock:
+        hooks = list(_hooks)
+        hooks.remove(hook)
+        _hooks = tuple(hooks)
+
+def _notify_spawn(gr, fn):
+    parent = greenlet.getcurrent()
+    for hook in _hooks:
+        hook.on_spawn(gr, parent, fn)
+
+def _notify_suspend(gr, future):
+    for hook in _hooks:
+        hook.on_suspend(gr, future)
+
+def _notify_resume(gr):
+    for hook in _hooks:
+        hook.on_resume(gr)
+
+def _notify_finish(gr):
+    for hook in _hooks:
+        hook.on_finish(gr)
+
+
+#: Priority for latency critical groutines, such as health checks
+PRIORITY_HIGH = 0
+#: Default priority of groutines
+PRIORITY_NORMAL = 1
+#: Priority for background and batch groutines
+PRIORITY_LOW = 2
+
+
+class _Groutine(greenlet.greenlet):
+    '''
+        A greenlet created by :func:`gcall`. Live instances are tracked in
+        ``_live`` so that they can be inspected by :mod:`greenado.debug`.
+        
+        ``waiting_on`` is None while the greenlet is running, otherwise it
+        is a tuple of (future or description, time suspended, timeout).
+        ``resumed_at`` is the time the greenlet last started running, which
+        is used by :func:`checkpoint`. ``future`` is the future that
+        :func:`gcall` returned for it. ``children`` is the number of
+        greenlets started by :func:`gcall` from this one that are alive.
+    '''
+    __slots__ = ('fn', 'waiting_on', 'priority', 'resumed_at', 'future',
+                 'children')
+
+_live = weakref.WeakSet()
+_live_lock = threading.Lock()
+_time = time.time
+
+def _live_greenlets():
+    '''
+        Returns a list of the greenlets in ``_live``. Greenlets are added
+        from every thread that runs an IOLoop, so the set is iterated while
+        holding the lock if possible. This may be called from a signal
+        handler that interrupted the thread holding the lock, so it never
+        waits for it, and copies the set without it instead.
+    '''
+    while True:
+        locked = _live_lock.acquire(False)
+        try:
+            return list(_live)
+        except RuntimeError:
+            # the set changed while it was being copied, by the garbage
+            # collector or by another thread
+            pass
+        finally:
+            if locked:
+                _live_lock.release()
+
+# future returned by gcall: weak reference to the greenlet running it, so
+# that gyield can cancel the greenlet behind a future that timed out
+_owners = weakref.WeakKeyDictionary()
+
+
+class _RunQueue(object):
+    '''
+        Greenlets on a single IOLoop that are ready to be resumed. They are
+        resumed from a single IOLoop callback in order of priority, and a
+        greenlet that has been ready for ``aging`` seconds is treated as if
+        it were one priority level higher, so low priority greenlets can't
+        be starved.
+    '''
+    
+    def __init__(self, io_loop):
+        self.io_loop = io_loop
+        self.heap = []
+        self.queued = set()
+        self.seq = 0
+        self.scheduled = False
+    
+    def push(self, gr):
+        if gr in self.queued:
+            return
+        
+        self.queued.add(gr)
+        self.seq += 1
+        deadline = _time() + getattr(gr, 'priority', PRIORITY_NORMAL) * _aging
+        heapq.heappush(self.heap, (deadline, self.seq, gr))
+        
+        if not self.scheduled:
+            self.scheduled = True
+            with NullContext():
+                self.io_loop.add_callback(self.drain)
+    
+    def drain(self):
+        self.scheduled = False
+        heap = self.heap
+        
+        # greenlets that become ready while draining wait for the next
+        # iteration, so that the IOLoop can't be starved either
+        count = min(len(heap), _max_resumes or len(heap))
+        try:
+            for _ in range(count):
+                gr = heapq.heappop(heap)[2]
+                self.queued.discard(gr)
+                if not gr.dead:
+                    gr.switch()
+        finally:
+            if heap and not self.scheduled:
+                self.scheduled = True
+                self.io_loop.add_callback(self.drain)
+
+
+# IOLoop: _RunQueue, for the IOLoops that run in each thread
+_run_queues_local = threading.local()
+
+# set once a groutine is created with a priority, until then greenlets are
+# resumed directly from IOLoop callbacks
+_prioritized = False
+_aging = 0.05
+_max_resumes = None
+
+# set by greenado.testing.explore to choose the order that ready greenlets
+# are resumed in
+_scheduler = None
+
+def _resume(gr):
+    '''Resumes a suspended greenlet, via the run queue if it's in use'''
+    if _scheduler is not None:
+        _scheduler.push(gr)
+    elif _prioritized:
+        io_loop = IOLoop.current()
+        run_queues = getattr(_run_queues_local, 'queues', None)
+        if run_queues is None:
+            run_queues = _run_queues_local.queues = weakref.WeakKeyDictionary()
+        run_queue = run_queues.get(io_loop)
+        if run_queue is None:
+            run_queue = run_queues[io_loop] = _RunQueue(io_loop)
+        run_queue.push(gr)
+    elif not gr.dead:
+        gr.switch()
+
+def configure_priorities(aging=None, max_resumes=None, enabled=None):
+    '''
+        Adjusts how greenlets created with a priority are scheduled.
+        
+        Ready greenlets are resumed through a run queue ordered by priority
+        once a greenlet has been created with a priority other than
+        :data:`PRIORITY_NORMAL`, and directly from IOLoop callbacks until
+        then.
+        
+        :param aging:       Number of seconds that a ready greenlet must wait
+                            before it is treated as one priority level
+                            higher. Defaults to 0.05.
+        :param max_resumes: Maximum number of greenlets to resume in a single
+                            IOLoop iteration, or 0 for no limit. Lowering it
+                            lets IO events for high priority greenlets be
+                            processed sooner. Defaults to no limit.
+        :param enabled:     True to always use the run queue, or False to
+                            stop using it until a greenlet is created with a
+                            priority again
+        
+        .. versionadded:: 0.3.0
+    '''
+    global _aging, _max_resumes, _prioritized
+    if enabled is not None:
+        _prioritized = enabled
+    if aging is not None:
+        _aging = aging
+    if max_resumes is not None:
+        _max_resumes = max_resumes
+
+_traceback_mode = 'full'
+
+def set_traceback_mode(mode):
+    '''
+        Sets how much of the traceback is kept when a groutine raises an
+        exception. The exception is stored on the future returned by
+        :func:`gcall` or the :func:`groutine`, and a full traceback keeps
+        every frame that it passed through alive, including their local
+        variables, for as long as the future is alive.
+        
+        * ``'full'``: keep the full traceback (the default)
+        * ``'clear_locals'``: keep the traceback, but clear the local
+          variables of its frames. On Python 2 this is the same as
+          ``'compact'``.
+        * ``'compact'``: discard the traceback, and store it as a string in
+          the ``greenado_traceback`` attribute of the exception instead
+        
+        .. versionadded:: 0.3.0
+    '''
+    global _traceback_mode
+    if mode not in ('full', 'clear_locals', 'compact'):
+        raise ValueError("Invalid traceback mode '%s'" % mode)
+    _traceback_mode = mode
+
+
+def _chain(value):
+    '''Returns an exception and all of the exceptions chained to it'''
+    found = {}
+    pending = [value]
+    while pending:
+        exc = pending.pop()
+        if exc is not None and id(exc) not in found:
+            found[id(exc)] = exc
+            pending.append(getattr(exc, '__cause__', None))
+            pending.append(getattr(exc, '__context__', None))
+    return list(found.values())
+
+def _trim_exc_info(exc_info):
+    typ, value, tb = exc_info
+    
+    if _traceback_mode == 'clear_locals' and hasattr(tb.tb_frame, 'clear'):
+        # the first frame is _groutine_main, which is still executing
+        tb = tb.tb_next
+        value.__traceback__ = tb
+        
+        for exc in _chain(value):
+            tb = exc.__traceback__
+            while tb is not None:
+                try:
+                    tb.tb_frame.clear()
+                except RuntimeError:
+                    pass
+                tb = tb.tb_next
+        
+        return (typ, value, value.__traceback__)
+    
+    try:
+        value.greenado_traceback = ''.join(traceback.format_exception(typ, value, tb))
+    except Exception:
+        pass
+    
+    for exc in _chain(value):
+        if getattr(exc, '__traceback__', None) is not None:
+            exc.__traceback__ = None
+    
+    return (typ, value, None)
+
+
+class StackBudgetExceeded(Exception):
+    '''
+        Set on the future returned by :func:`gcall` when the stack budget
+        set by :func:`set_stack_budget` is exceeded and ``wait`` is False
+        
+        .. versionadded:: 0.3.0
+    '''
+
+
+def stack_usage():
+    '''
+        Returns the total number of bytes of C stack that have been copied to
+        the heap for the greenlets created by greenado that are alive. A
+        greenlet's stack is saved to the heap when other greenlets need the
+        same part of the C stack, so this is mostly the cost of parked
+        greenlets.
+        
+        .. versionadded:: 0.3.0
+    '''
+    return sum(getattr(gr, '_stack_saved', 0) for gr in _live_greenlets())
+
+
+class _StackBudget(object):
+    '''
+        Defers or rejects new greenlets while the stacks of the existing
+        ones use too much memory
+    '''
+    
+    def __init__(self, max_bytes, wait, interval):
+        self.max_bytes = max_bytes
+        self.wait = wait
+        self.interval = interval
+        
+        self.usage = 0
+        self.checked = None
+        self.cost = 0
+        
+        # (io_loop, future, f, args, kwargs)
+        self.queue = deque()
+        self.draining = False
+        self.scheduled = False
+    
+    def full(self):
+        # summing the stacks visits every live greenlet, so it's done at
+        # most every interval, and less often if it's slow
+        now = _time()
+        if self.checked is None or now - self.checked >= max(self.interval, self.cost * 10):
+            self.usage = stack_usage()
+            self.cost = _time() - now
+            self.checked = now
+        return self.usage >= self.max_bytes
+    
+    def should_defer(self):
+        if self.draining:
+            return False
+        return bool(self.queue) or self.full()
+    
+    def defer(self, f, priority, args, kwargs):
+        future = _Future()
+        if not self.wait:
+            future.set_exception(StackBudgetExceeded(
+                "Greenlet stacks are using %d bytes, the budget is %d bytes" %
+                (self.usage, self.max_bytes)))
+            return future
+        
+        self.queue.append((IOLoop.current(), future, f, priority, args, kwargs))
+        self._schedule()
+        return future
+    
+    def _schedule(self):
+        if not self.scheduled:
+            self.scheduled = True
+            io_loop = IOLoop.current()
+            io_loop.add_timeout(io_loop.time() + self.interval, self._drain)
+    
+    def _drain(self):
+        self.scheduled = False
+        self.checked = None
+        
+        while self.queue and not self.full():
+            io_loop, future, f, priority, args, kwargs = self.queue.popleft()
+            if io_loop is IOLoop.current():
+                self._start(future, f, priority, args, kwargs)
+            else:
+                io_loop.add_callback(self._start, future, f, priority, args,
+                                     kwargs)
+            
+            # assume that the new greenlet will be as big as the average one
+            if _live:
+                self.usage += self.usage // len(_live)
+        
+        if self.queue:
+            self._schedule()
+    
+    def _start(self, future, f, priority, args, kwargs):
+        self.draining = True
+        try:
+            chain_future(_spawn(f, args, kwargs, priority), future)
+        finally:
+            self.draining = False
+
+_budget = None
+
+def set_stack_budget(max_bytes, wait=True, interval=0.1):
+    '''
+        Limits the memory used by the saved stacks of greenlets, as
+        measured by :func:`stack_usage`. While the budget is exceeded, new
+        calls to :func:`gcall` and functions decorated with
+        :func:`groutine` are queued and started once the usage falls below
+        the budget, or if ``wait`` is False, their future fails with
+        :exc:`StackBudgetExceeded`.
+        
+        :param max_bytes: Maximum number of bytes, or None to remove the
+                          budget
+        :param wait:      Whether to queue calls instead of failing them
+        :param interval:  Minimum number of seconds between measurements of
+                          the stack usage
+        
+        .. versionadded:: 0.3.0
+    '''
+    global _budget
+    
+    old = _budget
+    if max_bytes is None:
+        _budget = None
+    else:
+        _budget = _StackBudget(max_bytes, wait, interval)
+    
+    # anything that was waiting is started, or waits on the new budget
+    if old is not None and old.queue:
+        if _budget is None:
+            old.max_bytes = float('inf')
+            old._schedule()
+        else:
+            _budget.queue.extend(old.queue)
+            old.queue.clear()
+            _budget._schedule()
+
+
+# greenlets created ahead of time by prewarm(), per thread
+_pool_local = threading.local()
+_pooling = False
+
+def _pool_wait(gr):
+    # gcall sets the parent to its caller and switches here with the task.
+    # Anything else is a stale resume from the previous task, and is ignored
+    # like it would be by a wait.
+    while True:
+        task = gr.parent.switch()
+        if callable(task):
+            return task
+
+def _pool_worker():
+    gr = greenlet.getcurrent()
+    task = _pool_wait(gr)
+    
+    while True:
+        task()
+        task = None
+        
+        # children of the previous task would switch back into this
+        # greenlet when they finish, and could even be given it as a child
+        # of their own, so a greenlet with children is not reused
+        idle = _pool_local.idle
+        if gr.children or len(idle) >= _pool_local.size:
+            return
+        
+        with _live_lock:
+            _live.discard(gr)
+        gr.fn = gr.future = gr.waiting_on = None
+        idle.append(gr)
+        
+        task = _pool_wait(gr)
+
+def prewarm(n):
+    '''
+        Creates a pool of ``n`` greenlets ahead of time for the current
+        thread. :func:`gcall` and :func:`groutine` take greenlets from the
+        pool instead of creating new ones while it isn't empty, and the
+        greenlets return to the pool when their function finishes, so the
+        pool never holds more than ``n`` greenlets. A greenlet that started
+        groutines which are still alive is not returned to the pool.
+        ``prewarm(0)`` empties the pool.
+        
+        .. versionadded:: 0.3.0
+    '''
+    global _pooling
+    
+    idle = getattr(_pool_local, 'idle', None)
+    if idle is None:
+        idle = _pool_local.idle = []
+    _pool_local.size = n
+    
+    # idle greenlets that are dropped are killed by the garbage collector
+    del idle[n:]
+    while len(idle) < n:
+        gr = _Groutine(_pool_worker)
+        gr.fn = gr.future = gr.waiting_on = None
+        gr.children = 0
+        gr.switch()
+        idle.append(gr)
+    
+    if n:
+        _pooling = True
+
+def _pool_take(parent):
+    '''Returns an idle pooled greenlet that can be a child of parent'''
+    idle = getattr(_pool_local, 'idle', None)
+    if not idle:
+        return None
+    
+    # a greenlet can't become the child of a greenlet that descends from
+    # it, such as one created directly with greenlet.greenlet() by its
+    # previous task
+    gr = idle[-1]
+    ancestor = parent
+    while ancestor is not None:
+        if ancestor is gr:
+            return None
+        ancestor = ancestor.parent
+    
+    idle.pop()
+    gr.parent = parent
+    return gr
+
+
+def _groutine_main(f, args, kwargs, future):
+    '''
+        The function that every greenlet started by :func:`gcall` runs. The
+        profiler stops walking a greenlet's stack at this function's frame.
+    '''
+    try:
+        result = f(*args, **kwargs)
+    except Exception:
+        # the future may have been cancelled by its caller
+        if not future.done():
+            exc_info = sys.exc_info()
+            if _traceback_mode != 'full':
+                exc_info = _trim_exc_info(exc_info)
+            future_set_exc_info(future, exc_info)
+    else:
+        if not future.done():
+            future.set_result(result)
+    finally:
+        gr = greenlet.getcurrent()
+        parent = gr.parent
+        if parent.__class__ is _Groutine:
+            parent.children -= 1
+        if _hooks:
+            _notify_finish(gr)
+
+
 def gcall(f, *args, **kwargs):
     '''
         Calls a function, makes it asynchronous, and returns the result of
@@ -51,34 +655,96 @@ def gcall(f, *args, **kwargs):
         
         This is the same code that :func:`@greenado.groutine <groutine>`
         uses to wrap functions.
+        
+        The new greenlet has the same priority as the groutine that called
+        this, see :func:`gcall_priority`.
 
-        :param f:       Function to call
-        :param args:    Function arguments
-        :param kwargs:  Function keyword arguments
+        :param f:        Function to call
+        :param args:     Function arguments
+        :param kwargs:   Function keyword arguments
 
         :returns: :class:`tornado.concurrent.Future`
+        
+        .. versionchanged:: 0.3.0
+           See also :func:`prewarm` and :func:`set_stack_budget`.
 
         .. warning:: You should not discard the returned Future or exceptions
                      may be silently discarded, similar to a tornado coroutine.
                      See :func:`@gen.coroutine <tornado.gen.coroutine>` for
                      details.
     '''
+    return _spawn(f, args, kwargs, None)
+
+
+def gcall_priority(f, priority, *args, **kwargs):
+    '''
+        The same as :func:`gcall`, but the new greenlet has the given
+        priority instead of inheriting its caller's. When several greenlets
+        are ready to resume at the same time, the ones with a higher priority
+        (a lower number) are resumed first, see :func:`configure_priorities`.
+        Greenlets that the new greenlet calls :func:`gcall` from inherit its
+        priority::
+        
+            future = greenado.gcall_priority(health_check,
+                                             greenado.PRIORITY_HIGH)
+        
+        :param f:        Function to call
+        :param priority: :data:`PRIORITY_HIGH`, :data:`PRIORITY_NORMAL`,
+                         :data:`PRIORITY_LOW`, or any other non-negative
+                         integer. None inherits the caller's priority.
+        :param args:     Function arguments
+        :param kwargs:   Function keyword arguments
+
+        :returns: :class:`tornado.concurrent.Future`
+        
+        .. versionadded:: 0.3.0
+    '''
+    global _prioritized
+    if priority is not None and priority != PRIORITY_NORMAL:
+        _prioritized = True
+    return _spawn(f, args, kwargs, priority)
+
+
+def _spawn(f, args, kwargs, priority):
+    parent = greenlet.getcurrent()
+    if priority is None:
+        priority = getattr(parent, 'priority', PRIORITY_NORMAL)
     
-    # When this function gets updated, update groutine.wrapper also!
+    if _budget is not None and _budget.should_defer():
+        return _budget.defer(f, priority, args, kwargs)
     
     future = _Future()
-
-    def greenlet_base():    
-        try:
-            result = f(*args, **kwargs)
-        except Exception:
-            future_set_exc_info(future, sys.exc_info())
-        else:
-            future.set_result(result)
+    task = sc_wrap(partial(_groutine_main, f, args, kwargs, future))
+    
+    gr = None
+    if _pooling:
+        gr = _pool_take(parent)
+    
+    if gr is None:
+        gr = _Groutine(task)
+        gr.children = 0
+        task = None
+    
+    gr.fn = f
+    gr.future = future
+    gr.waiting_on = None
+    gr.priority = priority
+    gr.resumed_at = _time()
+    with _live_lock:
+        _live.add(gr)
+    _owners[future] = weakref.ref(gr)
+    
+    if parent.__class__ is _Groutine:
+        parent.children += 1
+    
+    if _hooks:
+        _notify_spawn(gr, f)
     
-    gr = greenlet.greenlet(sc_wrap(greenlet_base))
     with NullContext():
-        gr.switch()
+        if task is None:
+            gr.switch()
+        else:
+            gr.switch(task)
     
     return future
 
@@ -93,6 +759,11 @@ def generator(f):
         decorated by :func:`@gen.coroutine <tornado.gen.coroutine>`, and most
         of the tornado API as of tornado 4.0.
         
+        Similar to :func:`@gen.coroutine <tornado.gen.coroutine>`, a list or
+        dict of futures may also be yielded. They are waited on together, and
+        the result is a list or dict of their results. If any of the futures
+        fail, the first exception is raised at the yield statement.
+        
         Similar to :func:`@gen.coroutine <tornado.gen.coroutine>`, in versions
         of Python before 3.3 you must raise :class:`tornado.gen.Return` to
         return a value from this function.
@@ -102,6 +773,9 @@ def generator(f):
         are children of functions that have the decorator applied.
         
         .. versionadded:: 0.1.7
+        
+        .. versionchanged:: 0.3.0
+           Lists and dicts of futures may be yielded
 
         .. warning:: You should not discard the returned Future or exceptions
                      may be silently discarded, similar to a tornado coroutine.
@@ -115,34 +789,162 @@ def generator(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
     
-        assert greenlet.getcurrent().parent is not None, "functions decorated with generator() can only be called from functions that have the @greenado.groutine decorator in the call stack."
+        gr = greenlet.getcurrent()
+        assert gr.parent is not None, "functions decorated with generator() can only be called from functions that have the @greenado.groutine decorator in the call stack."
         
         try:
             result = f(*args, **kwargs)
         except (gen.Return, StopIteration) as e:
-            result = getattr(e, 'value', None)
-        else:
-            if isinstance(result, types.GeneratorType):
-                try:
-                    future = next(result)
-                    
-                    while True:       
-                        try:
-                            value = gyield(future)
-                        except Exception:
-                            result.throw(*sys.exc_info()) 
-                        else:
-                            future = result.send(value)
-                
-                except (gen.Return, StopIteration) as e:
-                    return getattr(e, 'value', None)
+            return getattr(e, 'value', None)
+        
+        if not isinstance(result, types.GeneratorType):
+            return result
+        
+        send = result.send
+        throw = result.throw
         
-        return result
+        try:
+            yielded = next(result)
+            
+            while True:
+                if not is_future(yielded):
+                    try:
+                        yielded = _multi(yielded)
+                    except gen.BadYieldError:
+                        yielded = throw(*sys.exc_info())
+                        continue
+                
+                # don't switch/wait if the future is already ready to go
+                if not yielded.done():
+                    _wait(gr, yielded)
+                
+                try:
+                    value = yielded.result()
+                except Exception:
+                    yielded = throw(*sys.exc_info())
+                else:
+                    yielded = send(value)
         
+        except (gen.Return, StopIteration) as e:
+            return getattr(e, 'value', None)
     
     return wrapper
 
 
+def _multi(children):
+    '''
+        Converts a list or dict of futures into a single future that resolves
+        once all of them have resolved.
+    '''
+    
+    if isinstance(children, dict):
+        keys = list(children.keys())
+        children = list(children.values())
+    elif isinstance(children, list):
+        keys = None
+    else:
+        raise gen.BadYieldError("yielded unknown object %r" % (children,))
+    
+    for child in children:
+        if not is_future(child):
+            raise gen.BadYieldError("yielded unknown object %r" % (child,))
+    
+    future = _Future()
+    pending = set(child for child in children if not child.done())
+    
+    def _finish():
+        results = [child.result() for child in children]
+        if keys is None:
+            future.set_result(results)
+        else:
+            future.set_result(dict(zip(keys, results)))
+    
+    def on_complete(child):
+        pending.discard(child)
+        try:
+            child.result()
+        except Exception:
+            if future.done():
+                logger.error("Multiple exceptions in yield list", exc_info=True)
+            else:
+                future_set_exc_info(future, sys.exc_info())
+        else:
+            if not pending and not future.done():
+                _finish()
+    
+    # check the children that are already done without any extra callbacks
+    for child in children:
+        if child.done():
+            try:
+                child.result()
+            except Exception:
+                future_set_exc_info(future, sys.exc_info())
+                break
+    else:
+        if not pending:
+            _finish()
+    
+    io_loop = IOLoop.current()
+    for child in list(pending):
+        io_loop.add_future(child, on_complete)
+    
+    return future
+
+
+def _suspend(gr, what, timeout, ready=None):
+    '''
+        Switches away from the current greenlet until ``ready()`` is true,
+        or until ``what`` is done if it is a future and ``ready`` is None,
+        recording what it waits on for the hooks and the debugging tools.
+        Switches back into the greenlet before then, such as from a child
+        greenlet that suspends, are ignored.
+    '''
+    
+    gr.waiting_on = (what, _time(), timeout)
+    if _hooks:
+        _notify_suspend(gr, what if is_future(what) else None)
+    
+    try:
+        with NullContext():
+            if ready is None:
+                # nothing but the greenlet refers to the future, so that
+                # the leak detector can tell when it can never resolve
+                while not what.done():
+                    gr.parent.switch()
+            else:
+                while not ready():
+                    gr.parent.switch()
+    finally:
+        gr.waiting_on = None
+        gr.resumed_at = _time()
+        if _hooks:
+            _notify_resume(gr)
+
+
+_internal_codes = frozenset(fn.__code__ for fn in (
+    _notify_spawn, _notify_suspend, _spawn, _suspend, gcall, gcall_priority))
+
+def _user_frame(frame):
+    '''
+        Skips greenado's spawn and suspend functions at the top of a stack,
+        so that the frame that called gcall(), gyield() or gsleep() comes
+        first
+    '''
+    while frame is not None and frame.f_code in _internal_codes:
+        frame = frame.f_back
+    return frame
+
+
+def _wait(gr, future):
+    '''
+        Switches away from the current greenlet until the future resolves.
+        The future must not be done already.
+    '''
+    
+    IOLoop.current().add_future(future, lambda f: _resume(gr))
+    _suspend(gr, future, None)
+
+
 def gmoment():
     '''
         Similar to :func:`tornado.gen.moment`, yields the IOLoop for a single
@@ -153,17 +955,84 @@ def gmoment():
     assert gr.parent is not None, "gmoment() can only be called from functions that have the @greenado.groutine decorator in the call stack."
     
     io_loop = IOLoop.current()
+    done = [False]
     
     def _finish():
-        gr.switch()
-
+        done[0] = True
+        _resume(gr)
+    
     io_loop.add_callback(_finish)
+    
+    # a child greenlet that suspends switches back to this one, so this
+    # must wait until the callback has actually run
+    _suspend(gr, 'gmoment', None, lambda: done[0])
 
-    with NullContext():
-        gr.parent.switch()
+
+_time_slice = 0.01
+
+def set_time_slice(time_slice):
+    '''
+        Sets the default time slice used by :func:`checkpoint`
+        
+        :param time_slice: Number of seconds. Defaults to 0.01.
+        
+        .. versionadded:: 0.3.0
+    '''
+    global _time_slice
+    _time_slice = time_slice
 
 
-def groutine(f):
+def checkpoint(time_slice=None):
+    '''
+        Call this regularly from long running loops in a groutine. If the
+        current greenlet has been running for longer than its time slice
+        since it last resumed, this yields the IOLoop for a single iteration
+        like :func:`gmoment`, otherwise it returns immediately.
+        
+        This is cheap enough to call on every iteration of a loop. If it is
+        not called from a greenlet created by greenado, it does nothing.
+        
+        :param time_slice: Number of seconds, defaults to the value set by
+                           :func:`set_time_slice`
+        
+        .. versionadded:: 0.3.0
+    '''
+    resumed_at = getattr(greenlet.getcurrent(), 'resumed_at', None)
+    if resumed_at is not None:
+        if time_slice is None:
+            time_slice = _time_slice
+        if _time() - resumed_at >= time_slice:
+            gmoment()
+
+
+def giter(iterable, time_slice=None):
+    '''
+        Iterates over an iterable, calling :func:`checkpoint` before each
+        item so that long loops in a groutine don't starve the IOLoop::
+        
+            for row in greenado.giter(rows):
+                process(row)
+        
+        .. versionadded:: 0.3.0
+    '''
+    for item in iterable:
+        checkpoint(time_slice)
+        yield item
+
+
+def gmap(fn, *iterables):
+    '''
+        Like :func:`map`, but returns an iterator that calls
+        :func:`checkpoint` before each call to ``fn``.
+        
+        .. versionadded:: 0.3.0
+    '''
+    for args in _izip(*iterables):
+        checkpoint()
+        yield fn(*args)
+
+
+def groutine(f=None, priority=None):
     '''
         A decorator that makes a function asynchronous and returns the result
         of the function as a :class:`tornado.concurrent.Future`. The wrapped
@@ -183,6 +1052,16 @@ def groutine(f):
         decorator. You should not use this decorator and the
         :func:`@gen.coroutine <tornado.gen.coroutine>` decorator on the same
         function.
+        
+        A priority can be given to the greenlets created by the decorated
+        function, see :func:`gcall_priority` for details::
+        
+            @greenado.groutine(priority=greenado.PRIORITY_HIGH)
+            def health_check():
+                ...
+        
+        .. versionchanged:: 0.3.0
+           Added the priority parameter
 
         .. warning:: You should not discard the returned Future or exceptions
                      may be silently discarded, similar to a tornado coroutine.
@@ -190,26 +1069,17 @@ def groutine(f):
                      details.
     '''
 
-    @wraps(f)
-    def wrapper(*args, **kwargs):
-        
-        # When this function gets updated, update gcall also!
-        
-        future = _Future()
+    if f is None:
+        return partial(groutine, priority=priority)
 
-        def greenlet_base():    
-            try:
-                result = f(*args, **kwargs)
-            except Exception:
-                future_set_exc_info(future, sys.exc_info())
-            else:
-                future.set_result(result)
-        
-        gr = greenlet.greenlet(sc_wrap(greenlet_base))
-        with NullContext():
-            gr.switch()
-        
-        return future
+    if priority is None:
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            return gcall(f, *args, **kwargs)
+    else:
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            return gcall_priority(f, priority, *args, **kwargs)
     
     return wrapper
 
@@ -235,16 +1105,197 @@ def gsleep(timeout):
 
     def on_timeout():
         done[0] = True
-        gr.switch()
+        _resume(gr)
 
     io_loop.add_timeout(io_loop.time() + timeout, on_timeout)
+    _suspend(gr, 'gsleep', timeout, lambda: done[0])
 
-    with NullContext():
-        while not done[0]:
-            gr.parent.switch()
+
+def _cancel(gr, future, cleanup):
+    '''
+        Cancels the operation behind a future that gyield() gave up on
+    '''
+    
+    if callable(cleanup):
+        try:
+            cleanup(future)
+        except Exception:
+            logger.error("Exception in gyield() cleanup callback", exc_info=True)
+    
+    ref = _owners.get(future)
+    owner = ref() if ref is not None else None
+    
+    # pooled greenlets move on to other futures once they finish
+    if owner is None or owner.future is not future:
+        future.cancel()
+        return
+    
+    # only cancel groutines that were started by this greenlet, others may
+    # have other greenlets waiting on them and are left running
+    parent = owner.parent
+    while parent is not None and parent is not gr:
+        parent = parent.parent
+    
+    if parent is not None and not owner.dead:
+        owner.throw(CancelledError("Cancelled after gyield() timed out"))
 
 
-def gyield(future, timeout=None):
+class Periodic(object):
+    '''
+        A function that is being called repeatedly by :func:`gperiodic`
+        
+        .. attribute:: future
+        
+           Future that resolves once the greenlet has exited after
+           :meth:`stop` is called
+        
+        .. attribute:: ticks
+        
+           Number of times the function has been called
+        
+        .. attribute:: missed
+        
+           Number of ticks that were skipped because the function was still
+           running
+        
+        .. attribute:: lag
+        
+           Number of seconds between when the last call was scheduled and
+           when it started
+        
+        .. attribute:: max_lag
+        
+           Largest lag seen
+        
+        .. versionadded:: 0.3.0
+    '''
+    
+    def __init__(self, interval, fn, jitter, skip_missed):
+        if interval <= 0:
+            raise ValueError("Invalid interval value '%s'" % interval)
+        
+        self.interval = interval
+        self.fn = fn
+        self.jitter = jitter
+        self.skip_missed = skip_missed
+        
+        self.ticks = 0
+        self.missed = 0
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+        
+        self._io_loop = IOLoop.current()
+        self._gr = None
+        self._ready = False
+        self._timeout = None
+        self._stopped = False
+        
+        self.future = gcall(self._run)
+    
+    @property
+    def mean_lag(self):
+        '''Mean number of seconds between when calls were scheduled and when they started'''
+        if not self.ticks:
+            return 0.0
+        return self.total_lag / self.ticks
+    
+    def stop(self):
+        '''
+            Stops calling the function. If the function is running, it is
+            allowed to finish.
+        '''
+        self._stopped = True
+        if self._timeout is not None:
+            self._io_loop.remove_timeout(self._timeout)
+            self._timeout = None
+            self._io_loop.add_callback(self._wake)
+    
+    def _wake(self):
+        self._timeout = None
+        self._ready = True
+        _resume(self._gr)
+    
+    def _is_ready(self):
+        return self._ready
+    
+    def _run(self):
+        gr = self._gr = greenlet.getcurrent()
+        io_loop = self._io_loop
+        interval = self.interval
+        
+        # each call is scheduled relative to the start instead of the last
+        # call, so the schedule doesn't drift
+        start = io_loop.time()
+        tick = 1
+        
+        while not self._stopped:
+            scheduled = start + tick * interval
+            if self.jitter:
+                scheduled += random.uniform(0, self.jitter)
+            
+            now = io_loop.time()
+            if scheduled > now:
+                # the same bound method is used for every timeout, instead of
+                # gsleep()'s per-call closures
+                self._ready = False
+                self._timeout = io_loop.add_timeout(scheduled, self._wake)
+                _suspend(gr, 'gperiodic', scheduled - now, self._is_ready)
+                
+                if self._stopped:
+                    break
+                now = io_loop.time()
+            
+            lag = now - scheduled
+            self.lag = lag
+            self.total_lag += lag
+            if lag > self.max_lag:
+                self.max_lag = lag
+            self.ticks += 1
+            
+            try:
+                self.fn()
+            except Exception:
+                logger.error("Exception in gperiodic() function %r", self.fn,
+                             exc_info=True)
+            
+            tick += 1
+            if self.skip_missed:
+                # the next tick that hasn't started yet
+                current = int((io_loop.time() - start) // interval) + 1
+                if current > tick:
+                    self.missed += current - tick
+                    tick = current
+
+
+def gperiodic(interval, fn, jitter=0, skip_missed=True):
+    '''
+        Calls a function every ``interval`` seconds from a single long-lived
+        greenlet, so the function may use :func:`gyield` and friends. Unlike
+        calling :func:`gsleep` in a loop, calls are scheduled at a fixed
+        rate that doesn't drift, no matter how long each call takes.
+        
+        Exceptions raised by the function are logged, and it continues to
+        be called.
+        
+        :param interval:    Number of seconds between calls. The first call
+                            happens after one interval.
+        :param fn:          Function to call, with no arguments
+        :param jitter:      Delay each call by a random amount of up to this
+                            many seconds, to avoid many processes calling at
+                            the same time
+        :param skip_missed: If a call takes longer than the interval, skip the
+                            calls that should have happened in the meantime.
+                            Otherwise they are made back to back to catch up.
+        
+        :returns: :class:`Periodic`, which can be used to stop the calls
+        
+        .. versionadded:: 0.3.0
+    '''
+    return Periodic(interval, fn, jitter, skip_missed)
+
+
+def gyield(future, timeout=None, cancel_on_timeout=False):
     '''
         This is functionally equivalent to the 'yield' statements used in a
         :func:`@gen.coroutine <tornado.gen.coroutine>`, but doesn't require
@@ -264,6 +1315,17 @@ def gyield(future, timeout=None):
         :param timeout: Number of seconds to wait before raising a
                         :exc:`TimeoutError`. Default is no timeout.
                         `Parameter added in version 0.1.8.`
+        :param cancel_on_timeout: If the timeout expires, cancel the
+                        operation that the future belongs to. If the future
+                        was returned by a groutine started from this greenlet,
+                        :exc:`CancelledError` is thrown into it. If it was
+                        returned by any other groutine, which other greenlets
+                        may be waiting on, the groutine is left running.
+                        Otherwise ``future.cancel()`` is called. This may
+                        also be a function, which is called with the future
+                        first so that it can release resources. Errors that
+                        the cancelled operation raises afterwards are not
+                        logged.
 
         :returns:       The result set on the future object
         :raises:        * If an exception is set on the future, the exception
@@ -278,6 +1340,9 @@ def gyield(future, timeout=None):
            If a timeout occurs, the :exc:`TimeoutError` will not be set on the
            future object, but will only be raised to the caller.
            
+        .. versionchanged:: 0.3.0
+           Added cancel_on_timeout parameter
+           
         .. note: This cannot be used with :func:`tornado.gen.moment`, use 
                  :func:`gmoment` instead
     '''
@@ -300,21 +1365,26 @@ def gyield(future, timeout=None):
             def on_complete(result):
                 if timeout_future.done():
                     # resolve the future so tornado doesn't complain
-                    try:
-                        result.result()
-                    except Exception:
-                        # If you don't want to see this error, then implement cancellation
-                        # in the thing that the future came from
-                        logger.warn("gyield() timeout expired, and this exception was ignored",
-                                    exc_info=1)
+                    if result.cancelled():
+                        pass
+                    elif cancel_on_timeout:
+                        result.exception()
+                    else:
+                        try:
+                            result.result()
+                        except Exception:
+                            # If you don't want to see this error, then implement cancellation
+                            # in the thing that the future came from
+                            logger.warn("gyield() timeout expired, and this exception was ignored",
+                                        exc_info=1)
                 else: 
                     timeout_future.set_result(True)
                     io_loop.remove_timeout(timeout_handle)
-                gr.switch()
+                    _resume(gr)
 
             def on_timeout():
                 timeout_future.set_exception(TimeoutError("Timeout after %s seconds" % timeout))
-                gr.switch()
+                _resume(gr)
 
             wait_future = timeout_future = _Future()
             timeout_handle = io_loop.add_timeout(
@@ -324,15 +1394,14 @@ def gyield(future, timeout=None):
 
         else:
             def on_complete(result):
-                gr.switch()
+                _resume(gr)
 
         io_loop.add_future(future, on_complete)
+        _suspend(gr, future, timeout,
+                 None if wait_future is future else wait_future.done)
         
-        with NullContext():
-            gr.parent.switch()
-            
-            while not wait_future.done():
-                gr.parent.switch()
+        if cancel_on_timeout and not future.done():
+            _cancel(gr, future, cancel_on_timeout)
             
         wait_future.result()
     
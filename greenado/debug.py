@@ -0,0 +1,158 @@
+#
+# Copyright 2014-2016 Dustin Spicuzza
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+'''
+    Tools for inspecting the groutines that are alive in a process.
+
+    greenado always keeps a weak reference to each greenlet created by
+    :func:`gcall <greenado.concurrent.gcall>` or a
+    :func:`groutine <greenado.concurrent.groutine>`, and records what each
+    one is waiting on while it is suspended, so this information is
+    available at any time.
+
+    .. versionadded:: 0.3.0
+'''
+
+from collections import namedtuple
+import signal
+import sys
+import traceback
+
+import greenlet
+
+from . import concurrent
+
+
+GroutineInfo = namedtuple('GroutineInfo', [
+    'greenlet',
+    'fn',
+    'stack',
+    'waiting_on',
+    'wait_start',
+    'wait_age',
+    'timeout_remaining',
+    'stack_bytes',
+])
+GroutineInfo.__doc__ = '''
+    Information about a live groutine, returned by :func:`groutines`
+
+    * ``greenlet``: the greenlet
+    * ``fn``: the function the greenlet was created for
+    * ``stack``: the greenlet's stack, as returned by
+      :func:`traceback.extract_stack`
+    * ``waiting_on``: the future the greenlet is waiting on, or 'gsleep' or
+      'gmoment'. None if the greenlet is not suspended.
+    * ``wait_start``: time the greenlet was suspended, from :func:`time.time`
+    * ``wait_age``: number of seconds the greenlet has been suspended for
+    * ``timeout_remaining``: number of seconds until the wait times out, or
+      None if there is no timeout
+    * ``stack_bytes``: number of bytes of the greenlet's C stack that have
+      been saved to the heap, see :func:`greenado.stack_usage`
+'''
+
+
+def groutines():
+    '''
+        Returns a list of :class:`GroutineInfo` for each greenlet created by
+        greenado that is still alive, sorted so that the greenlets that have
+        been waiting the longest come first.
+    '''
+
+    now = concurrent._time()
+    current = greenlet.getcurrent()
+    infos = []
+
+    for gr in concurrent._live_greenlets():
+        if gr.dead:
+            continue
+
+        if gr is current:
+            stack = traceback.extract_stack(sys._getframe(1))
+        elif gr.gr_frame is not None:
+            stack = traceback.extract_stack(concurrent._user_frame(gr.gr_frame))
+        else:
+            stack = []
+
+        waiting_on = wait_start = wait_age = timeout_remaining = None
+        if gr.waiting_on is not None:
+            waiting_on, wait_start, timeout = gr.waiting_on
+            wait_age = now - wait_start
+            if timeout is not None and timeout > 0:
+                timeout_remaining = timeout - wait_age
+
+        infos.append(GroutineInfo(gr, gr.fn, stack, waiting_on, wait_start,
+                                  wait_age, timeout_remaining,
+                                  getattr(gr, '_stack_saved', 0)))
+
+    infos.sort(key=lambda info: -1 if info.wait_age is None else info.wait_age,
+               reverse=True)
+    return infos
+
+
+def format_groutines():
+    '''
+        Returns a human readable description of all live groutines, as
+        returned by :func:`groutines`
+    '''
+
+    infos = groutines()
+    lines = ['%d live groutines' % len(infos)]
+
+    for info in infos:
+        name = getattr(info.fn, '__name__', repr(info.fn))
+        lines.append('')
+
+        if info.waiting_on is None:
+            lines.append('Groutine %s (running)' % name)
+        else:
+            lines.append('Groutine %s waiting on %r for %.3fs' % (
+                         name, info.waiting_on, info.wait_age))
+            if info.timeout_remaining is not None:
+                lines[-1] += ' (timeout in %.3fs)' % info.timeout_remaining
+
+        if info.stack_bytes:
+            lines[-1] += ' [%d stack bytes]' % info.stack_bytes
+
+        lines.extend(line.rstrip('\n') for line in traceback.format_list(info.stack))
+
+    return '\n'.join(lines) + '\n'
+
+
+def dump_groutines(file=None):
+    '''
+        Writes the output of :func:`format_groutines` to a file, which
+        defaults to :data:`sys.stderr`
+    '''
+    if file is None:
+        file = sys.stderr
+    file.write(format_groutines())
+    file.flush()
+
+
+def install_signal_handler(signum=None, file=None):
+    '''
+        Installs a signal handler that calls :func:`dump_groutines` when the
+        process receives a signal, which defaults to ``SIGUSR1``.
+
+        :returns: The previous signal handler
+    '''
+    if signum is None:
+        signum = signal.SIGUSR1
+
+    def _handler(signum, frame):
+        dump_groutines(file)
+
+    return signal.signal(signum, _handler)
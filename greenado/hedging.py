@@ -0,0 +1,267 @@
+#
+# Copyright 2014-2016 Dustin Spicuzza
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+'''
+    Hedged requests: if a call hasn't finished after a delay, the same call
+    is made again, and whichever answer arrives first is used. This cuts
+    tail latency for idempotent calls at the cost of a few extra requests.
+'''
+
+from collections import deque, namedtuple
+from functools import partial
+import sys
+import weakref
+
+from tornado.ioloop import IOLoop
+
+from .concurrent import _Future, future_set_exc_info, gyield
+
+
+HedgeInfo = namedtuple('HedgeInfo', ['calls', 'hedges', 'wins', 'losses',
+                                     'delay'])
+HedgeInfo.__doc__ = '''
+    Statistics for a function called via :func:`hedged`, returned by
+    :func:`hedge_info`
+
+    * ``calls``: number of calls to :func:`hedged`
+    * ``hedges``: number of extra requests that were sent
+    * ``wins``: number of calls where an extra request answered first
+    * ``losses``: number of calls where extra requests were sent, but the
+      original request answered first
+    * ``delay``: the adaptive delay, or None if not enough latencies have
+      been recorded yet
+'''
+
+
+class _Tracker(object):
+    '''
+        Keeps a window of recent latencies of a function and its p95
+    '''
+
+    window = 100
+    min_samples = 20
+    percentile = 95
+
+    def __init__(self):
+        self.latencies = deque(maxlen=self.window)
+        self.since_update = 0
+        self.delay = None
+
+        self.calls = 0
+        self.hedges = 0
+        self.wins = 0
+        self.losses = 0
+
+    def record(self, latency):
+        self.latencies.append(latency)
+        self.since_update += 1
+
+        # sorting the window on every call would be wasteful
+        if len(self.latencies) >= self.min_samples and \
+           (self.delay is None or self.since_update >= 10):
+            self.since_update = 0
+            latencies = sorted(self.latencies)
+            idx = min(int(len(latencies) * self.percentile / 100.0), len(latencies) - 1)
+            self.delay = latencies[idx]
+
+    def info(self):
+        return HedgeInfo(self.calls, self.hedges, self.wins, self.losses,
+                         self.delay)
+
+
+# trackers are dropped along with their function, so that lambdas and
+# partials created for each call don't pile up
+_trackers = weakref.WeakKeyDictionary()
+
+# instance: {function: tracker} for bound methods, which are created on
+# each access, so that each instance has its own latencies
+_method_trackers = weakref.WeakKeyDictionary()
+
+def _tracker_key(fn, create):
+    '''Returns the dict that keeps the tracker of fn, and its key in it'''
+    obj = getattr(fn, '__self__', None)
+    func = getattr(fn, '__func__', None)
+    if obj is None or func is None:
+        return _trackers, fn
+
+    trackers = _method_trackers.get(obj)
+    if trackers is None and create:
+        trackers = _method_trackers[obj] = {}
+    return trackers, func
+
+def _get_tracker(fn):
+    try:
+        trackers, key = _tracker_key(fn, True)
+        tracker = trackers.get(key)
+        if tracker is None:
+            tracker = trackers[key] = _Tracker()
+    except TypeError:
+        # can't be weakly referenced, so its latencies can't be kept
+        tracker = _Tracker()
+    return tracker
+
+
+class _HedgedCall(object):
+
+    def __init__(self, tracker, fn, args, kwargs, delay, max_hedges):
+        self.tracker = tracker
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.delay = delay
+        self.max_hedges = max_hedges
+
+        self.io_loop = IOLoop.current()
+        self.future = _Future()
+        self.sent = 0
+        self.pending = 0
+        self.timeout = None
+
+    def send(self):
+        self.timeout = None
+        index = self.sent
+        self.sent += 1
+        self.pending += 1
+        if index:
+            self.tracker.hedges += 1
+
+        start = self.io_loop.time()
+        try:
+            attempt = self.fn(*self.args, **self.kwargs)
+        except Exception:
+            attempt = _Future()
+            future_set_exc_info(attempt, sys.exc_info())
+
+        self.io_loop.add_future(attempt, partial(self.on_done, index, start))
+
+        if self.delay is not None and self.sent <= self.max_hedges and \
+           not self.future.done():
+            self.timeout = self.io_loop.add_timeout(start + self.delay, self.send)
+
+    def on_done(self, index, start, attempt):
+        self.pending -= 1
+
+        # losers are always resolved here, so their errors are ignored
+        # instead of being logged
+        try:
+            value = attempt.result()
+        except Exception:
+            if self.future.done():
+                return
+
+            if not self.pending:
+                self.cancel_timeout()
+                future_set_exc_info(self.future, sys.exc_info())
+            return
+
+        self.tracker.record(self.io_loop.time() - start)
+
+        if self.future.done():
+            return
+
+        self.cancel_timeout()
+        if self.sent > 1:
+            if index:
+                self.tracker.wins += 1
+            else:
+                self.tracker.losses += 1
+
+        self.future.set_result(value)
+
+    def cancel_timeout(self):
+        if self.timeout is not None:
+            self.io_loop.remove_timeout(self.timeout)
+            self.timeout = None
+
+
+def hedged(fn, *args, **kwargs):
+    '''
+        Calls a function that returns a future, and if it hasn't resolved
+        after a delay, calls it again with the same arguments. The result of
+        the first call to succeed is returned, and the other calls are
+        ignored. An exception is only raised if every call that was made
+        fails.
+
+        Only use this for idempotent calls, such as reads from a replicated
+        backend::
+
+            @greenado.groutine
+            def handler():
+                user = greenado.hedged(client.get_user, user_id)
+
+        By default the delay is the 95th percentile of the latencies recorded
+        for the function, so that roughly one in twenty calls is hedged. No
+        extra calls are made until enough latencies have been recorded.
+        Latencies of a bound method are recorded for each instance, so that
+        clients of different backends each get their own delay. Latencies
+        are forgotten once the function or instance is garbage collected.
+
+        This must only be called from functions that either have a
+        :func:`@greenado.groutine <greenado.concurrent.groutine>` decorator,
+        or functions that are children of functions that have the decorator
+        applied.
+
+        :param fn:         Function to call, which must return a future
+        :param args:       Function arguments
+        :param kwargs:     Function keyword arguments
+        :param delay:      Keyword-only. Number of seconds to wait before
+                           each extra call, or None to choose it based on the
+                           function's recent latencies.
+        :param max_hedges: Keyword-only. Maximum number of extra calls to
+                           make. Defaults to 1.
+
+        :returns: The result of the first successful call
+
+        .. versionadded:: 0.3.0
+    '''
+
+    delay = kwargs.pop('delay', None)
+    max_hedges = kwargs.pop('max_hedges', 1)
+
+    tracker = _get_tracker(fn)
+    tracker.calls += 1
+    if delay is None:
+        delay = tracker.delay
+
+    call = _HedgedCall(tracker, fn, args, kwargs, delay, max_hedges)
+    call.send()
+    return gyield(call.future)
+
+
+def hedge_info(fn):
+    '''
+        Returns a :class:`HedgeInfo` with statistics about calls to a
+        function made via :func:`hedged`, or to a bound method of the same
+        instance
+    '''
+    return _get_tracker(fn).info()
+
+
+def hedge_clear(fn=None):
+    '''
+        Forgets the latencies and statistics recorded for a function, or for
+        all functions if ``fn`` is None
+    '''
+    if fn is None:
+        _trackers.clear()
+        _method_trackers.clear()
+    else:
+        try:
+            trackers, key = _tracker_key(fn, False)
+            if trackers is not None:
+                trackers.pop(key, None)
+        except TypeError:
+            pass
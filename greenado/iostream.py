@@ -0,0 +1,307 @@
+#
+# Copyright 2014-2016 Dustin Spicuzza
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+'''
+    Blocking-style access to a :class:`tornado.iostream.IOStream` from
+    groutines.
+
+    .. versionadded:: 0.3.0
+'''
+
+from collections import deque
+import sys
+
+from tornado.ioloop import IOLoop
+from tornado.iostream import UnsatisfiableReadError
+from tornado.util import raise_exc_info
+
+from .concurrent import gyield
+
+
+class GreenStream(object):
+    '''
+        Wraps a :class:`tornado.iostream.IOStream` so that it can be read
+        from and written to in a blocking style from a groutine.
+
+        Data is read from the stream in large chunks and kept in a buffer.
+        Reads that can be satisfied from the buffer return immediately,
+        without creating a future or switching greenlets, and return
+        :class:`memoryview` slices of the buffer instead of copies.
+
+        Small writes are collected and sent to the stream together, either
+        once ``write_buffer_size`` bytes have been collected, at the end of
+        the current IOLoop iteration, or when :meth:`flush` is called. If
+        sending fails, the error is raised by the next call to :meth:`write`
+        or :meth:`flush`.
+
+        All methods except for :meth:`write` must only be called from
+        functions that either have a
+        :func:`@greenado.groutine <greenado.concurrent.groutine>` decorator,
+        or functions that are children of functions that have the decorator
+        applied.
+
+        Example::
+
+            stream = GreenStream(iostream)
+            length = struct.unpack('>I', stream.read_exactly(4))[0]
+            payload = stream.read_exactly(length)
+
+        :param stream:            A :class:`tornado.iostream.IOStream`
+        :param read_chunk_size:   Maximum number of bytes to read from the
+                                  stream at once
+        :param write_buffer_size: Number of bytes of writes to collect before
+                                  sending them to the stream
+    '''
+
+    def __init__(self, stream, read_chunk_size=65536, write_buffer_size=65536):
+        self.stream = stream
+        self.read_chunk_size = read_chunk_size
+        self.write_buffer_size = write_buffer_size
+
+        # unread data, in the chunks that it was read from the stream in.
+        # The first _pos bytes of the first chunk have already been read.
+        self._chunks = deque()
+        self._pos = 0
+        self._size = 0
+
+        self._writes = []
+        self._write_size = 0
+        self._write_scheduled = False
+        self._write_future = None
+        self._write_error = None
+
+    def _fill(self):
+        data = gyield(self.stream.read_bytes(self.read_chunk_size, partial=True))
+        self._chunks.append(data)
+        self._size += len(data)
+
+    def _take(self, n):
+        if n == 0:
+            return memoryview(b'')
+
+        chunks = self._chunks
+        first = chunks[0]
+        pos = self._pos
+        end = pos + n
+        self._size -= n
+
+        if end < len(first):
+            self._pos = end
+            return memoryview(first)[pos:end]
+
+        chunks.popleft()
+        self._pos = 0
+        if end == len(first):
+            return memoryview(first)[pos:]
+
+        # the data spans several chunks, so only it is copied
+        parts = [first[pos:] if pos else first]
+        needed = end - len(first)
+        while needed:
+            chunk = chunks[0]
+            if len(chunk) > needed:
+                parts.append(chunk[:needed])
+                self._pos = needed
+                break
+            parts.append(chunks.popleft())
+            needed -= len(chunk)
+
+        return memoryview(b''.join(parts))
+
+    def _find(self, delimiter):
+        '''Returns the offset of the delimiter in the unread data, or -1'''
+        chunks = self._chunks
+        if not chunks:
+            return -1
+
+        if len(chunks) > 1:
+            # left over from earlier reads, only happens once per call
+            data = b''.join([chunks[0][self._pos:]] + list(chunks)[1:])
+            chunks.clear()
+            chunks.append(data)
+            self._pos = 0
+
+        idx = chunks[0].find(delimiter, self._pos)
+        return idx - self._pos if idx != -1 else -1
+
+    def _tail(self, n):
+        '''Returns the last n bytes of the unread data, or all of it'''
+        n = min(n, self._size)
+        parts = []
+        for chunk in reversed(self._chunks):
+            if n <= 0:
+                break
+            part = chunk[-n:]
+            parts.append(part)
+            n -= len(part)
+        return b''.join(reversed(parts))
+
+    @property
+    def buffered(self):
+        '''Number of bytes that can be read without waiting'''
+        return self._size
+
+    def read_exactly(self, n):
+        '''
+            Reads exactly ``n`` bytes from the stream
+
+            :returns: :class:`memoryview`
+            :raises: :exc:`tornado.iostream.StreamClosedError` if the stream
+                     is closed before ``n`` bytes are read
+        '''
+        while self._size < n:
+            self._fill()
+
+        return self._take(n)
+
+    def read_until(self, delimiter, max_bytes=None):
+        '''
+            Reads from the stream until the delimiter is found
+
+            :returns: :class:`memoryview` of the data, including the delimiter
+            :raises: * :exc:`tornado.iostream.UnsatisfiableReadError` if the
+                       delimiter is not found within ``max_bytes``
+                     * :exc:`tornado.iostream.StreamClosedError` if the stream
+                       is closed before the delimiter is found
+        '''
+        length = len(delimiter)
+        idx = self._find(delimiter)
+
+        while idx == -1:
+            if max_bytes is not None and self._size > max_bytes:
+                break
+
+            # search only the new chunk, and where it joins the data before
+            # it in case the delimiter is split between them
+            tail = self._tail(length - 1)
+            searched = self._size
+            self._fill()
+            chunk = self._chunks[-1]
+
+            idx = (tail + chunk[:length - 1]).find(delimiter)
+            if idx != -1:
+                idx += searched - len(tail)
+            else:
+                idx = chunk.find(delimiter)
+                if idx != -1:
+                    idx += searched
+
+        if idx != -1:
+            size = idx + length
+            if max_bytes is None or size <= max_bytes:
+                return self._take(size)
+
+        raise UnsatisfiableReadError("delimiter %r not found within %d bytes" %
+                                     (delimiter, max_bytes))
+
+    def readline(self, max_bytes=None):
+        '''
+            Reads a line from the stream, including the trailing newline
+
+            :returns: :class:`memoryview`
+        '''
+        return self.read_until(b'\n', max_bytes)
+
+    def write(self, data):
+        '''
+            Queues data to be written to the stream. This never waits; use
+            :meth:`flush` to wait until the data has been written.
+
+            :raises: the error that sending earlier writes failed with
+        '''
+        self._raise_write_error()
+        self._writes.append(data)
+        self._write_size += len(data)
+
+        if self._write_size >= self.write_buffer_size:
+            self._send()
+        elif not self._write_scheduled:
+            self._write_scheduled = True
+            IOLoop.current().add_callback(self._send)
+
+    def _send(self):
+        self._write_scheduled = False
+        if not self._writes:
+            return
+
+        if len(self._writes) == 1:
+            data = self._writes[0]
+        else:
+            data = b''.join(self._writes)
+
+        self._writes = []
+        self._write_size = 0
+
+        try:
+            future = self.stream.write(data)
+        except Exception:
+            # when called from the IOLoop, nobody else would see this
+            self._set_write_error(sys.exc_info())
+            return
+
+        # each write's future resolves once all data before it is written,
+        # so only the last one needs to be waited on, but every one of them
+        # is checked so that errors are kept and not logged as unretrieved
+        self._write_future = future
+        IOLoop.current().add_future(future, self._on_write)
+
+    def _on_write(self, future):
+        try:
+            future.result()
+        except Exception:
+            self._set_write_error(sys.exc_info())
+
+    def _set_write_error(self, exc_info):
+        if self._write_error is None:
+            self._write_error = exc_info
+
+    def _raise_write_error(self):
+        error = self._write_error
+        if error is not None:
+            self._write_error = None
+            raise_exc_info(error)
+
+    def flush(self):
+        '''
+            Sends any queued writes to the stream, and waits until all data
+            written so far has been written to the socket
+
+            :raises: the error that sending any of the data failed with
+        '''
+        self._send()
+
+        future = self._write_future
+        if future is not None:
+            self._write_future = None
+            try:
+                gyield(future)
+            except Exception:
+                self._set_write_error(sys.exc_info())
+
+        self._raise_write_error()
+
+    def close(self):
+        '''
+            Sends any queued writes, waits until all data written so far has
+            been written to the socket, and closes the stream. The stream
+            is closed even if sending the data failed.
+
+            :raises: the error that sending any of the data failed with
+        '''
+        try:
+            self.flush()
+        finally:
+            self.stream.close()
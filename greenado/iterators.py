@@ -0,0 +1,334 @@
+#
+# Copyright 2014-2016 Dustin Spicuzza
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+'''
+    Bridges between generators that run in groutines and async iterators.
+
+    These require Python 3.5 or later, though the module can be imported on
+    any version.
+
+    .. versionadded:: 0.3.0
+'''
+
+from collections import deque
+import sys
+
+from tornado.ioloop import IOLoop
+
+from .concurrent import _Future, future_set_exc_info, gcall, gyield
+
+
+class _GeneratorAsyncIterator(object):
+    '''
+        Returned by :func:`aiter_from`
+    '''
+
+    def __init__(self, gen_fn, args, kwargs, max_buffer):
+        self.gen_fn = gen_fn
+        self.args = args
+        self.kwargs = kwargs
+        self.max_buffer = max_buffer
+
+        self.buffer = deque()
+        self.done = False
+        self.error = None
+        self.closed = False
+
+        # resolved when an item is added, or when space becomes available
+        self.item_waiter = None
+        self.space_waiter = None
+        self.producer = None
+
+    def _produce(self):
+        gen = self.gen_fn(*self.args, **self.kwargs)
+        buffer = self.buffer
+
+        try:
+            for item in gen:
+                buffer.append(item)
+                self._wake_consumer()
+
+                if len(buffer) >= self.max_buffer:
+                    self.space_waiter = _Future()
+                    gyield(self.space_waiter)
+
+                if self.closed:
+                    gen.close()
+                    break
+        except Exception:
+            self.error = sys.exc_info()
+        finally:
+            self.done = True
+            self._wake_consumer()
+
+    def _wake_consumer(self):
+        waiter = self.item_waiter
+        if waiter is not None:
+            self.item_waiter = None
+            waiter.set_result(None)
+
+    def _wake_producer(self):
+        waiter = self.space_waiter
+        if waiter is not None:
+            self.space_waiter = None
+            waiter.set_result(None)
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        if self.producer is None:
+            self.producer = gcall(self._produce)
+
+        future = _Future()
+
+        if self.buffer:
+            future.set_result(self.buffer.popleft())
+            if len(self.buffer) < self.max_buffer:
+                self._wake_producer()
+        elif self.done:
+            if self.error is not None:
+                future_set_exc_info(future, self.error)
+            else:
+                future.set_exception(StopAsyncIteration())
+        else:
+            self.item_waiter = waiter = _Future()
+            IOLoop.current().add_future(waiter, lambda _: self._next_into(future))
+
+        return future
+
+    def _next_into(self, future):
+        try:
+            result = self.__anext__().result()
+        except Exception:
+            future_set_exc_info(future, sys.exc_info())
+        else:
+            future.set_result(result)
+
+    def aclose(self):
+        '''
+            Stops the generator. Returns a future that resolves once it has
+            stopped.
+        '''
+        self.closed = True
+        self._wake_producer()
+
+        if self.producer is None:
+            future = _Future()
+            future.set_result(None)
+            return future
+        return self.producer
+
+
+def aiter_from(gen_fn, *args, **kwargs):
+    '''
+        Runs a generator function in a groutine, and returns an async
+        iterator over the items that it produces. The generator may use
+        :func:`gyield <greenado.concurrent.gyield>` between items.
+
+        The generator runs ahead of the consumer by up to ``max_buffer``
+        items, and is then suspended until the consumer catches up::
+
+            def rows():
+                for page in range(10):
+                    for row in greenado.gyield(fetch_page(page)):
+                        yield row
+
+            async def consume():
+                async for row in greenado.aiter_from(rows):
+                    ...
+
+        Exceptions raised by the generator are raised by the iterator once
+        the items produced before them have been consumed.
+
+        :param gen_fn:     Generator function
+        :param args:       Function arguments
+        :param kwargs:     Function keyword arguments
+        :param max_buffer: Keyword-only. Maximum number of items to read
+                           ahead, defaults to 64
+
+        .. versionadded:: 0.3.0
+    '''
+    max_buffer = kwargs.pop('max_buffer', 64)
+    return _GeneratorAsyncIterator(gen_fn, args, kwargs, max_buffer)
+
+
+class _AsyncIterableIterator(object):
+    '''
+        Returned by :func:`iter_from`
+    '''
+
+    def __init__(self, async_iterable, batch_size):
+        # tornado 4.3+, needed to wait on coroutines
+        from tornado.gen import convert_yielded
+        self.convert_yielded = convert_yielded
+
+        self.ait = async_iterable.__aiter__()
+        self.batch_size = batch_size
+
+        # the future of the item being read
+        self.task = None
+
+        self.io_loop = IOLoop.current()
+        self.buffer = deque()
+        self.done = False
+        self.closed = False
+        self.error = None
+        self.waiter = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        buffer = self.buffer
+        if not buffer:
+            if not self.done:
+                self._pull()
+
+                if not buffer and not self.done:
+                    # one switch for however many items arrive together
+                    self.waiter = _Future()
+                    gyield(self.waiter)
+
+            if not buffer:
+                if self.error is not None:
+                    error, self.error = self.error, None
+                    raise error[1]
+                raise StopIteration
+
+        item = buffer.popleft()
+        self._pull()
+        return item
+
+    next = __next__
+
+    def __del__(self):
+        if not self.done:
+            self.io_loop.add_callback(self.close)
+
+    def _pull(self):
+        '''
+            Reads items until one has to be waited for or the buffer is
+            full. Each item is read in a task of its own, as ``async for``
+            would, so that the async iterable can use timeouts and context
+            variables that need a current task.
+        '''
+        while self.task is None and not self.done and len(self.buffer) < self.batch_size:
+            try:
+                task = self.convert_yielded(self.ait.__anext__())
+            except BaseException:
+                self._finish(sys.exc_info())
+                return
+
+            if not task.done():
+                self.task = task
+                self.io_loop.add_future(task, self._on_item)
+                return
+
+            # items that are already available are read without waiting
+            self._take(task)
+
+    def _on_item(self, task):
+        self.task = None
+        if not self.closed:
+            self._take(task)
+            self._pull()
+
+    def _take(self, task):
+        try:
+            item = task.result()
+        except StopAsyncIteration:
+            self._finish(None)
+            return
+        except BaseException:
+            # including cancellation, which isn't an Exception on 3.8+
+            self._finish(sys.exc_info())
+            return
+
+        self.buffer.append(item)
+        self._wake()
+
+    def _finish(self, error):
+        self.error = error
+        self.done = True
+        self._wake()
+
+    def _wake(self):
+        waiter = self.waiter
+        if waiter is not None and (self.buffer or self.done):
+            self.waiter = None
+            waiter.set_result(None)
+
+    def close(self):
+        '''
+            Stops reading items, and closes the async iterable if it has an
+            ``aclose()`` method, such as an async generator. An item that is
+            being read is cancelled first.
+        '''
+        if self.closed:
+            return
+
+        self.closed = True
+        self.buffer.clear()
+        self._finish(None)
+
+        aclose = getattr(self.ait, 'aclose', None)
+        if aclose is None:
+            return
+
+        task = self.task
+        if task is None or task.done():
+            self._aclose(aclose)
+        else:
+            task.cancel()
+            self.io_loop.add_future(task, lambda _: self._aclose(aclose))
+
+    def _aclose(self, aclose):
+        # errors raised while closing are logged by the IOLoop
+        self.io_loop.add_future(self.convert_yielded(aclose()),
+                                lambda future: future.result())
+
+
+def iter_from(async_iterable, batch_size=64):
+    '''
+        Returns an iterator over an async iterable that a groutine can loop
+        over with a plain ``for`` statement.
+
+        Items are read ahead from the async iterable and collected in a
+        buffer, so the groutine is only suspended when the buffer is empty,
+        and then takes every item that arrived while it waited::
+
+            @greenado.groutine
+            def consume(cursor):
+                for row in greenado.iter_from(cursor):
+                    process(row)
+
+        This must only be used from functions that either have a
+        :func:`@greenado.groutine <greenado.concurrent.groutine>` decorator,
+        or functions that are children of functions that have the decorator
+        applied.
+
+        Each item is read in a task, as ``async for`` would. The iterator
+        has a ``close()`` method that stops reading and closes the async
+        iterable, which is also called when the iterator is garbage
+        collected before it is exhausted.
+
+        :param async_iterable: An object that supports ``async for``
+        :param batch_size:     Maximum number of items to read ahead
+
+        .. versionadded:: 0.3.0
+    '''
+    return _AsyncIterableIterator(async_iterable, batch_size)
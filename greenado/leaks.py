@@ -0,0 +1,275 @@
+#
+# Copyright 2014-2016 Dustin Spicuzza
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+'''
+    Detection of groutines that are suspended forever.
+
+    A groutine that waits on a future that is never resolved stays
+    suspended, and keeps its stack and everything that it references alive.
+    :class:`LeakDetector` periodically reports groutines that have been
+    waiting for too long, or that are waiting on a future that nothing else
+    references (so nothing can ever resolve it), along with the stack that
+    created each of them. It can also kill them to reclaim their memory::
+
+        detector = LeakDetector(max_age=300, kill=True)
+        detector.start()
+
+    .. versionadded:: 0.3.0
+'''
+
+from collections import namedtuple
+import gc
+import linecache
+import sys
+import traceback
+import weakref
+
+import greenlet
+
+from tornado.ioloop import PeriodicCallback
+
+from . import concurrent
+from .concurrent import add_hook, GreenletHook, is_future, remove_hook
+
+import logging
+logger = logging.getLogger('greenado')
+
+
+class LeakError(Exception):
+    '''
+        Set on the future of a groutine that was killed by a
+        :class:`LeakDetector`
+    '''
+
+
+Leak = namedtuple('Leak', [
+    'greenlet',
+    'fn',
+    'reason',
+    'waiting_on',
+    'wait_age',
+    'spawn_stack',
+    'stack',
+])
+Leak.__doc__ = '''
+    A groutine found by :meth:`LeakDetector.check`
+
+    * ``greenlet``: the greenlet
+    * ``fn``: the function the greenlet was created for
+    * ``reason``: 'unreachable' if nothing else references the future that
+      the greenlet is waiting on, otherwise 'age'
+    * ``waiting_on``: what the greenlet is waiting on, see
+      :class:`greenado.debug.GroutineInfo`
+    * ``wait_age``: number of seconds the greenlet has been suspended for
+    * ``spawn_stack``: the stack that created the greenlet, as returned by
+      :func:`traceback.extract_stack`, or None if the greenlet was created
+      before the detector was started
+    * ``stack``: the greenlet's current stack
+'''
+
+
+def _frames(frame):
+    while frame is not None:
+        yield frame
+        frame = frame.f_back
+
+
+class LeakDetector(GreenletHook):
+    '''
+        Periodically looks for groutines that are suspended forever
+
+        :param max_age:         Report greenlets that have been suspended for
+                                this many seconds
+        :param unreachable_age: Report greenlets that have been suspended for
+                                this many seconds on a future that nothing
+                                else references. None disables this check,
+                                which uses :func:`gc.get_referrers`.
+        :param interval:        Number of seconds between checks
+        :param kill:            If True, throw :exc:`greenlet.GreenletExit`
+                                into the reported greenlets, and set a
+                                :exc:`LeakError` on their futures
+        :param stack_depth:     Number of frames of the stack that created
+                                each greenlet to record
+        :param report:          Called with the list of :class:`Leak` found by
+                                each check, if it is not empty. By default
+                                the output of :meth:`format` is logged.
+    '''
+
+    def __init__(self, max_age=300, unreachable_age=5, interval=60,
+                 kill=False, stack_depth=10, report=None):
+        self.max_age = max_age
+        self.unreachable_age = unreachable_age
+        self.interval = interval
+        self.kill = kill
+        self.stack_depth = stack_depth
+        self.report = report
+
+        # greenlet: [(filename, lineno, name)]
+        self._spawn_stacks = weakref.WeakKeyDictionary()
+        self._periodic = None
+
+    def start(self):
+        '''Starts recording spawn stacks and checking for leaks'''
+        if self._periodic is not None:
+            return
+
+        add_hook(self)
+        self._periodic = PeriodicCallback(self._check_and_report,
+                                          self.interval * 1000)
+        self._periodic.start()
+
+    def stop(self):
+        '''Stops checking for leaks'''
+        if self._periodic is None:
+            return
+
+        self._periodic.stop()
+        self._periodic = None
+        remove_hook(self)
+        self._spawn_stacks.clear()
+
+    def on_spawn(self, gr, parent, fn):
+        # source lines are looked up only when a leak is found, since most
+        # greenlets aren't leaks
+        stack = []
+        frame = concurrent._user_frame(sys._getframe(1))
+        while frame is not None and len(stack) < self.stack_depth:
+            code = frame.f_code
+            stack.append((code.co_filename, frame.f_lineno, code.co_name))
+            frame = frame.f_back
+        stack.reverse()
+        self._spawn_stacks[gr] = stack
+
+    def _check_and_report(self):
+        leaks = self.check()
+        if leaks:
+            if self.report is None:
+                logger.warning("%s", self.format(leaks))
+            else:
+                self.report(leaks)
+
+    def check(self):
+        '''
+            Returns a list of :class:`Leak` for each greenlet that is
+            currently leaked, and kills them if ``kill`` is set
+        '''
+
+        now = concurrent._time()
+        current = greenlet.getcurrent()
+
+        found = []
+        candidates = []
+
+        for gr in concurrent._live_greenlets():
+            if gr.dead or gr is current or gr.waiting_on is None:
+                continue
+
+            waiting_on, wait_start, _ = gr.waiting_on
+            age = now - wait_start
+
+            if self.max_age is not None and age >= self.max_age:
+                found.append((gr, 'age'))
+            elif self.unreachable_age is not None and \
+                 age >= self.unreachable_age and is_future(waiting_on):
+                candidates.append(gr)
+
+        if candidates:
+            found.extend((gr, 'unreachable') for gr in self._unreachable(candidates))
+
+        leaks = [self._make_leak(gr, reason, now) for gr, reason in found]
+
+        if self.kill:
+            for leak in leaks:
+                self._kill(leak.greenlet)
+
+        return leaks
+
+    def _unreachable(self, candidates):
+        '''
+            Returns the greenlets whose future is only referenced by the
+            greenlet itself
+        '''
+
+        futures = [gr.waiting_on[0] for gr in candidates]
+        owners = dict((id(future), gr) for future, gr in zip(futures, candidates))
+
+        # the greenlets' own references to their future don't count
+        ignored = set([id(futures), id(sys._getframe())])
+        own = {}
+        for gr in candidates:
+            own[id(gr)] = set([id(gr.waiting_on)] +
+                              [id(frame) for frame in _frames(gr.gr_frame)])
+
+        reachable = set()
+        for referrer in gc.get_referrers(*futures):
+            if id(referrer) in ignored:
+                continue
+
+            for referent in gc.get_referents(referrer):
+                gr = owners.get(id(referent))
+                if gr is not None and id(referrer) not in own[id(gr)]:
+                    reachable.add(id(gr))
+
+        return [gr for gr in candidates if id(gr) not in reachable]
+
+    def _make_leak(self, gr, reason, now):
+        waiting_on, wait_start, _ = gr.waiting_on
+
+        spawn_stack = self._spawn_stacks.get(gr)
+        if spawn_stack is not None:
+            spawn_stack = [(filename, lineno, name,
+                            linecache.getline(filename, lineno).strip() or None)
+                           for filename, lineno, name in spawn_stack]
+
+        if gr.gr_frame is not None:
+            stack = traceback.extract_stack(concurrent._user_frame(gr.gr_frame))
+        else:
+            stack = []
+
+        return Leak(gr, gr.fn, reason, waiting_on, now - wait_start,
+                    spawn_stack, stack)
+
+    def _kill(self, gr):
+        future = gr.future
+
+        try:
+            gr.throw(greenlet.GreenletExit)
+        except Exception:
+            logger.error("Exception killing leaked groutine", exc_info=True)
+
+        # anything waiting on it shouldn't leak too
+        if not future.done():
+            future.set_exception(LeakError("Groutine was killed by the leak detector"))
+
+    def format(self, leaks):
+        '''Returns a human readable description of a list of leaks'''
+
+        lines = ['%d leaked groutines' % len(leaks)]
+
+        for leak in leaks:
+            name = getattr(leak.fn, '__name__', repr(leak.fn))
+            lines.append('')
+            lines.append('Groutine %s waiting on %r for %.3fs (%s)' % (
+                         name, leak.waiting_on, leak.wait_age, leak.reason))
+
+            if leak.spawn_stack is not None:
+                lines.append('Created at:')
+                lines.extend(line.rstrip('\n') for line in traceback.format_list(leak.spawn_stack))
+
+            lines.append('Suspended at:')
+            lines.extend(line.rstrip('\n') for line in traceback.format_list(leak.stack))
+
+        return '\n'.join(lines)
@@ -0,0 +1,207 @@
+#
+# Copyright 2014-2016 Dustin Spicuzza
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+'''
+    Batches together individual loads that are made by many groutines.
+'''
+
+from collections import Counter
+from functools import partial
+import sys
+
+from tornado.ioloop import IOLoop
+
+from .concurrent import _Future, _multi, future_set_exc_info, gcall, gyield, is_future
+
+
+class BatchLoader(object):
+    '''
+        Collects the keys passed to :meth:`load` by any number of groutines,
+        and loads them with a single call to ``batch_fn``. Each caller is
+        resumed with the result for its own key.
+
+        Keys are collected until the next IOLoop iteration (or until
+        ``max_delay`` seconds have passed), or until ``max_batch_size`` keys
+        have been collected, whichever comes first.
+
+        ``batch_fn`` is called as a groutine with a list of keys, and must
+        return a list of values (or a future that resolves to a list of
+        values) in the same order as the keys. If a value is an
+        :class:`Exception` instance, it is raised to the callers that
+        requested that key instead. If ``batch_fn`` raises an exception,
+        it is raised to all of the callers in the batch.
+
+        Example::
+
+            def get_users(ids):
+                rows = greenado.gyield(db.query_users(ids))
+                by_id = {row.id: row for row in rows}
+                return [by_id.get(i, KeyError(i)) for i in ids]
+
+            users = BatchLoader(get_users)
+
+            @greenado.groutine
+            def handle(user_id):
+                user = users.load(user_id)
+
+        :param batch_fn:       Function that loads a list of keys
+        :param max_batch_size: Maximum number of keys to pass to
+                               ``batch_fn`` at once. If None, there is no
+                               limit.
+        :param max_delay:      Number of seconds to wait for more keys before
+                               calling ``batch_fn``. If 0, keys are
+                               collected until the next IOLoop iteration.
+        :param cache:          If True, the result for each key is cached by
+                               this loader, and duplicate keys are only
+                               loaded once. Failed loads are not cached.
+                               Loaders that cache should usually be created
+                               per request.
+
+        .. attribute:: batch_sizes
+
+           A :class:`collections.Counter` that maps batch sizes to the number
+           of times ``batch_fn`` was called with a batch of that size
+
+        .. attribute:: cache_hits
+
+           Number of keys that were found in the cache
+
+        .. versionadded:: 0.3.0
+    '''
+
+    def __init__(self, batch_fn, max_batch_size=None, max_delay=0, cache=True):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.cache = cache
+
+        self.batch_sizes = Counter()
+        self.cache_hits = 0
+
+        self._queue = []
+        self._futures = {}
+        self._timeout = None
+        self._scheduled = False
+
+    def load(self, key):
+        '''
+            Loads a single key, and returns its value. This must only be
+            called from functions that either have a
+            :func:`@greenado.groutine <greenado.concurrent.groutine>`
+            decorator, or functions that are children of functions that have
+            the decorator applied.
+        '''
+        return gyield(self._enqueue(key))
+
+    def load_many(self, keys):
+        '''
+            Loads a list of keys, and returns a list of their values.
+        '''
+        return gyield(_multi([self._enqueue(key) for key in keys]))
+
+    def prime(self, key, value):
+        '''
+            Places a value for a key into the cache, if the key is not
+            already cached.
+        '''
+        if self.cache and key not in self._futures:
+            future = _Future()
+            future.set_result(value)
+            self._futures[key] = future
+
+    def clear(self, key):
+        '''Removes a key from the cache'''
+        self._futures.pop(key, None)
+
+    def clear_all(self):
+        '''Removes all keys from the cache'''
+        self._futures.clear()
+
+    def _enqueue(self, key):
+        if self.cache:
+            future = self._futures.get(key)
+            if future is not None:
+                self.cache_hits += 1
+                return future
+
+        future = _Future()
+        if self.cache:
+            self._futures[key] = future
+
+        self._queue.append((key, future))
+
+        if self.max_batch_size is not None and len(self._queue) >= self.max_batch_size:
+            self._dispatch()
+        elif not self._scheduled:
+            self._scheduled = True
+
+            io_loop = IOLoop.current()
+            if self.max_delay:
+                self._timeout = io_loop.add_timeout(io_loop.time() + self.max_delay,
+                                                    self._dispatch)
+            else:
+                io_loop.add_callback(self._dispatch)
+
+        return future
+
+    def _dispatch(self):
+        io_loop = IOLoop.current()
+
+        if self._timeout is not None:
+            io_loop.remove_timeout(self._timeout)
+            self._timeout = None
+        self._scheduled = False
+
+        queue, self._queue = self._queue, []
+        if not queue:
+            return
+
+        keys = [key for key, _ in queue]
+        self.batch_sizes[len(keys)] += 1
+
+        io_loop.add_future(gcall(self._call_batch_fn, keys),
+                           partial(self._resolve, queue))
+
+    def _call_batch_fn(self, keys):
+        values = self.batch_fn(keys)
+        if is_future(values):
+            values = gyield(values)
+
+        if len(values) != len(keys):
+            raise ValueError("batch_fn returned %d values for %d keys" %
+                             (len(values), len(keys)))
+        return values
+
+    def _resolve(self, queue, future):
+        try:
+            values = future.result()
+        except Exception:
+            exc_info = sys.exc_info()
+            for key, f in queue:
+                self._uncache(key, f)
+                future_set_exc_info(f, exc_info)
+            return
+
+        for (key, f), value in zip(queue, values):
+            if isinstance(value, Exception):
+                self._uncache(key, f)
+                f.set_exception(value)
+            else:
+                f.set_result(value)
+
+    def _uncache(self, key, future):
+        if self._futures.get(key) is future:
+            del self._futures[key]
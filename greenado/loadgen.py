@@ -0,0 +1,302 @@
+#
+# Copyright 2014-2016 Dustin Spicuzza
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+'''
+    A load generator that uses groutines to issue requests concurrently.
+    It can be used as a library, or from the command line::
+
+        $ greenado-loadgen -c 10 -r 100 -d 30 http://localhost:8888/
+
+    Requests are scheduled at a fixed rate, and latencies are measured from
+    the time that each request was scheduled to be sent, instead of the time
+    that it was actually sent. This corrects for coordinated omission: when
+    the server stalls, the requests that should have been sent during the
+    stall are charged for the time that they spent waiting.
+'''
+
+from __future__ import print_function
+
+import argparse
+from functools import partial
+import sys
+
+from tornado.httpclient import AsyncHTTPClient
+from tornado.ioloop import IOLoop
+
+from .concurrent import gcall, gsleep, gyield, is_future
+
+
+class Histogram(object):
+    '''
+        A latency histogram similar to HdrHistogram. Values are recorded in
+        seconds with microsecond resolution, and are stored in buckets that
+        are accurate to within 1%, so memory usage does not grow with the
+        number of recorded values.
+    '''
+
+    # number of significant bits kept for each value
+    precision = 8
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        '''Records a value, in seconds'''
+
+        value = int(value * 1000000)
+
+        shift = value.bit_length() - self.precision
+        if shift > 0:
+            bucket = (value >> shift) << shift
+        else:
+            bucket = value
+
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def mean(self):
+        '''Returns the mean of the recorded values, in seconds'''
+        if not self.count:
+            return 0.0
+        return self.total / float(self.count) / 1000000
+
+    def percentile(self, percentile):
+        '''
+            Returns the value at a percentile (0-100) of the recorded values,
+            in seconds
+        '''
+        if not self.count:
+            return 0.0
+
+        if percentile >= 100:
+            return self.max / 1000000.0
+
+        target = self.count * percentile / 100.0
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= target:
+                return min(max(bucket, self.min), self.max) / 1000000.0
+
+        return self.max / 1000000.0
+
+
+class LoadReport(object):
+    '''
+        The results of a :class:`LoadGenerator` run
+
+        .. attribute:: requests
+
+           Number of requests that were completed
+
+        .. attribute:: errors
+
+           Number of requests that raised an exception
+
+        .. attribute:: elapsed
+
+           Number of seconds the run took
+
+        .. attribute:: latency
+
+           :class:`Histogram` of the time between when each request was
+           scheduled to be sent and when it completed
+
+        .. attribute:: service_time
+
+           :class:`Histogram` of the time between when each request was
+           actually sent and when it completed
+    '''
+
+    percentiles = (50, 90, 99, 99.9, 100)
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.elapsed = 0.0
+        self.latency = Histogram()
+        self.service_time = Histogram()
+
+    @property
+    def throughput(self):
+        '''Completed requests per second'''
+        if not self.elapsed:
+            return 0.0
+        return self.requests / self.elapsed
+
+    def format(self):
+        '''Returns a human readable summary of the results'''
+
+        lines = [
+            "requests: %d  errors: %d  elapsed: %.2fs  throughput: %.1f req/s" % (
+                self.requests, self.errors, self.elapsed, self.throughput),
+            "%-14s" % "(ms)" + "".join("%10s" % ('p%s' % p if p < 100 else 'max')
+                                       for p in self.percentiles),
+        ]
+
+        for name, histogram in (('latency', self.latency),
+                                ('service time', self.service_time)):
+            lines.append("%-14s" % name + "".join("%10.2f" % (histogram.percentile(p) * 1000)
+                                                  for p in self.percentiles))
+
+        return "\n".join(lines)
+
+
+class LoadGenerator(object):
+    '''
+        Issues requests from a number of concurrent groutines, optionally at
+        a target rate, until a number of requests have been made or a
+        duration has passed.
+
+        :param target:      A URL to fetch via
+                            :class:`tornado.httpclient.AsyncHTTPClient`, or a
+                            function that makes a single request. The
+                            function is called from a groutine, so it may use
+                            :func:`gyield <greenado.concurrent.gyield>`, or it
+                            may return a future.
+        :param concurrency: Number of groutines issuing requests
+        :param rate:        Number of requests to schedule per second. If
+                            None, each groutine sends a new request as soon
+                            as its previous request completes.
+        :param duration:    Number of seconds to schedule requests for
+        :param requests:    Maximum number of requests to send
+
+        .. versionadded:: 0.3.0
+    '''
+
+    def __init__(self, target, concurrency=10, rate=None, duration=None,
+                 requests=None):
+
+        if duration is None and requests is None:
+            raise ValueError("duration or requests must be specified")
+
+        self.target = target
+        self.concurrency = concurrency
+        self.rate = rate
+        self.duration = duration
+        self.requests = requests
+
+    def run(self):
+        '''
+            Runs the load test, and returns a :class:`LoadReport`. This must
+            only be called from functions that either have a
+            :func:`@greenado.groutine <greenado.concurrent.groutine>`
+            decorator, or functions that are children of functions that have
+            the decorator applied.
+        '''
+
+        io_loop = IOLoop.current()
+        report = LoadReport()
+
+        target = self.target
+        if not callable(target):
+            target = partial(AsyncHTTPClient().fetch, target)
+
+        self._report = report
+        self._next = 0
+        self._start = io_loop.time()
+
+        workers = [gcall(self._worker, io_loop, target)
+                   for _ in range(self.concurrency)]
+        for worker in workers:
+            gyield(worker)
+
+        report.elapsed = io_loop.time() - self._start
+        return report
+
+    def _schedule(self, now):
+        '''Returns the time the next request should be sent, or None'''
+
+        if self.requests is not None and self._next >= self.requests:
+            return None
+
+        if self.rate:
+            scheduled = self._start + self._next / float(self.rate)
+        else:
+            scheduled = now
+
+        if self.duration is not None and scheduled >= self._start + self.duration:
+            return None
+
+        self._next += 1
+        return scheduled
+
+    def _worker(self, io_loop, target):
+        report = self._report
+
+        while True:
+            now = io_loop.time()
+            scheduled = self._schedule(now)
+            if scheduled is None:
+                break
+
+            if scheduled > now:
+                gsleep(scheduled - now)
+
+            sent = io_loop.time()
+            try:
+                result = target()
+                if is_future(result):
+                    gyield(result)
+            except Exception:
+                report.errors += 1
+
+            done = io_loop.time()
+            report.requests += 1
+            report.latency.record(done - scheduled)
+            report.service_time.record(done - sent)
+
+
+def main(argv=None):
+    '''Entry point for the greenado-loadgen command'''
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('url')
+    parser.add_argument('-c', '--concurrency', type=int, default=10,
+                        help="Number of concurrent requests (default: 10)")
+    parser.add_argument('-r', '--rate', type=float, default=None,
+                        help="Requests per second (default: unlimited)")
+    parser.add_argument('-d', '--duration', type=float, default=None,
+                        help="Number of seconds to run for")
+    parser.add_argument('-n', '--requests', type=int, default=None,
+                        help="Number of requests to send")
+
+    args = parser.parse_args(argv)
+    if args.duration is None and args.requests is None:
+        args.duration = 10
+
+    generator = LoadGenerator(args.url, concurrency=args.concurrency,
+                              rate=args.rate, duration=args.duration,
+                              requests=args.requests)
+
+    report = IOLoop.current().run_sync(partial(gcall, generator.run))
+    print(report.format())
+
+    return 1 if report.errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,329 @@
+#
+# Copyright 2014-2016 Dustin Spicuzza
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+'''
+    Streaming pipelines made of stages that each run in a pool of
+    groutines. Stages are connected by bounded queues, so when a stage
+    falls behind, the stages before it wait instead of buffering an
+    unbounded number of items::
+
+        from greenado.pipeline import Pipeline, Stage
+
+        pipeline = Pipeline(
+            parse,
+            Stage(enrich, concurrency=20, buffer=100),
+            Stage(write, concurrency=2),
+        )
+
+        @greenado.groutine
+        def ingest(lines):
+            for record in pipeline.run(lines):
+                pass
+
+            for stats in pipeline.stats():
+                print(stats)
+
+    Stage functions are called with one item and return one item, and may
+    use :func:`gyield <greenado.concurrent.gyield>`. When a stage has more
+    than one groutine, items may leave it in a different order than they
+    arrived in.
+
+    .. versionadded:: 0.3.0
+'''
+
+from collections import deque, namedtuple
+import sys
+
+from tornado.util import raise_exc_info
+
+from .concurrent import _Future, _time, gcall, gyield
+
+
+StageStats = namedtuple('StageStats', [
+    'name',
+    'processed',
+    'throughput',
+    'queue_depth',
+    'max_queue_depth',
+    'busy',
+    'utilization',
+])
+StageStats.__doc__ = '''
+    Statistics for a single stage of a :class:`Pipeline`
+
+    * ``name``: name of the stage
+    * ``processed``: number of items the stage has finished
+    * ``throughput``: items finished per second
+    * ``queue_depth``: number of items waiting for the stage
+    * ``max_queue_depth``: largest number of items that were waiting
+    * ``busy``: total number of seconds spent in the stage function
+    * ``utilization``: fraction of the time that the stage's groutines were
+      busy. A stage close to 1 with a full queue is the bottleneck.
+'''
+
+
+# returned by _Channel.get once a closed channel is empty
+_EOF = object()
+
+
+class _Channel(object):
+    '''
+        A bounded queue between two stages, for use from groutines
+    '''
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.items = deque()
+        self.closed = False
+        self.max_depth = 0
+
+        self.getters = deque()
+        self.putters = deque()
+
+    def put(self, item):
+        '''Returns False if the channel was closed'''
+        while len(self.items) >= self.capacity and not self.closed:
+            waiter = _Future()
+            self.putters.append(waiter)
+            gyield(waiter)
+
+        if self.closed:
+            return False
+
+        self.items.append(item)
+        if len(self.items) > self.max_depth:
+            self.max_depth = len(self.items)
+
+        _wake_one(self.getters)
+        return True
+
+    def get(self):
+        while not self.items:
+            if self.closed:
+                return _EOF
+            waiter = _Future()
+            self.getters.append(waiter)
+            gyield(waiter)
+
+        item = self.items.popleft()
+        _wake_one(self.putters)
+        return item
+
+    def close(self, discard=False):
+        '''
+            No more items will be put. If discard is True, the items that
+            are waiting are dropped too.
+        '''
+        self.closed = True
+        if discard:
+            self.items.clear()
+
+        for waiters in (self.getters, self.putters):
+            while waiters:
+                _wake_one(waiters)
+
+
+def _wake_one(waiters):
+    if waiters:
+        waiters.popleft().set_result(None)
+
+
+class Stage(object):
+    '''
+        A stage of a :class:`Pipeline`
+
+        :param fn:          Function called with each item, whose return
+                            value is passed to the next stage
+        :param concurrency: Number of groutines calling the function
+        :param buffer:      Maximum number of items waiting for this stage.
+                            Defaults to ``concurrency``.
+        :param name:        Name used in statistics, defaults to the name of
+                            the function
+    '''
+
+    def __init__(self, fn, concurrency=1, buffer=None, name=None):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+
+        self.fn = fn
+        self.concurrency = concurrency
+        self.buffer = buffer or concurrency
+        self.name = name or getattr(fn, '__name__', repr(fn))
+
+        self.processed = 0
+        self.busy = 0.0
+        self.input = None
+        self.active = 0
+
+
+class Pipeline(object):
+    '''
+        A sequence of stages that items stream through
+
+        :param stages: :class:`Stage` objects, or functions, which are run
+                       as a stage with the default settings
+    '''
+
+    def __init__(self, *stages):
+        if not stages:
+            raise ValueError("a pipeline needs at least one stage")
+
+        self.stages = [s if isinstance(s, Stage) else Stage(s) for s in stages]
+        self._output = None
+        self._error = None
+        self._started = False
+        self._start = None
+        self._end = None
+
+    def run(self, source):
+        '''
+            Streams the items of an iterable through the pipeline, and
+            returns an iterator over the results of the last stage. Items
+            are only read from ``source`` as the pipeline has room for them.
+
+            If a stage function raises an exception, the pipeline stops, and
+            the exception is raised by the iterator.
+
+            This must only be used from functions that either have a
+            :func:`@greenado.groutine <greenado.concurrent.groutine>`
+            decorator, or functions that are children of functions that have
+            the decorator applied.
+        '''
+        # the stages only start once the iterator is first used, so this
+        # can't be told from _start
+        if self._started:
+            raise RuntimeError("a pipeline can only be run once")
+        self._started = True
+
+        return self._results(source)
+
+    def _results(self, source):
+        self._begin(source)
+        output = self._output
+
+        try:
+            while True:
+                item = output.get()
+                if item is _EOF:
+                    break
+                yield item
+        finally:
+            if self._end is None:
+                # the caller stopped iterating early
+                self._abort()
+
+        if self._error is not None:
+            raise_exc_info(self._error)
+
+    def _begin(self, source):
+        self._start = _time()
+
+        for stage in self.stages:
+            stage.processed = 0
+            stage.busy = 0.0
+            stage.input = _Channel(stage.buffer)
+            stage.active = stage.concurrency
+
+        self._output = _Channel(self.stages[-1].concurrency)
+
+        outputs = [stage.input for stage in self.stages[1:]] + [self._output]
+        for stage, output in zip(self.stages, outputs):
+            for _ in range(stage.concurrency):
+                gcall(self._worker, stage, output)
+
+        gcall(self._feed, source)
+
+    def _feed(self, source):
+        channel = self.stages[0].input
+        try:
+            for item in source:
+                if not channel.put(item):
+                    return
+        except Exception:
+            self._fail(sys.exc_info())
+        else:
+            channel.close()
+
+    def _worker(self, stage, output):
+        fn = stage.fn
+        channel = stage.input
+
+        while True:
+            item = channel.get()
+            if item is _EOF:
+                break
+
+            start = _time()
+            try:
+                result = fn(item)
+            except Exception:
+                self._fail(sys.exc_info())
+                return
+            finally:
+                stage.busy += _time() - start
+
+            stage.processed += 1
+            if not output.put(result):
+                return
+
+        stage.active -= 1
+        if not stage.active:
+            output.close()
+            if output is self._output:
+                self._end = _time()
+
+    def _fail(self, exc_info):
+        if self._error is None:
+            self._error = exc_info
+        self._abort()
+
+    def _abort(self):
+        if self._end is None:
+            self._end = _time()
+
+        for stage in self.stages:
+            stage.input.close(discard=True)
+        self._output.close(discard=True)
+
+    def stats(self):
+        '''
+            Returns a list of :class:`StageStats`, one for each stage. This
+            can be called while the pipeline is running.
+        '''
+        if self._start is None:
+            elapsed = 0.0
+        else:
+            elapsed = (self._end or _time()) - self._start
+
+        results = []
+        for stage in self.stages:
+            channel = stage.input
+            throughput = utilization = 0.0
+            if elapsed > 0:
+                throughput = stage.processed / elapsed
+                utilization = stage.busy / (elapsed * stage.concurrency)
+
+            results.append(StageStats(
+                stage.name,
+                stage.processed,
+                throughput,
+                len(channel.items) if channel is not None else 0,
+                channel.max_depth if channel is not None else 0,
+                stage.busy,
+                utilization,
+            ))
+
+        return results
@@ -0,0 +1,176 @@
+#
+# Copyright 2014-2016 Dustin Spicuzza
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+'''
+    A sampling profiler that understands greenado greenlets.
+
+    On-CPU time is sampled using a ``SIGPROF`` timer, and each sample is
+    charged to the stack of the greenlet that was running at the time,
+    rooted at the function that the greenlet was created for. Time that
+    greenlets spend suspended in :func:`gyield <greenado.concurrent.gyield>`,
+    :func:`gsleep <greenado.concurrent.gsleep>` or
+    :func:`gmoment <greenado.concurrent.gmoment>` is measured separately,
+    and is charged to the stack that was suspended.
+
+    Both can be written in the collapsed stack format used by
+    FlameGraph and speedscope::
+
+        profiler = Profiler()
+        profiler.start()
+        ...
+        profiler.stop()
+        profiler.write_collapsed('cpu.txt')
+        profiler.write_collapsed('wait.txt', wait=True)
+
+    The profiler must be started from the main thread, and only works on
+    platforms that support :func:`signal.setitimer`.
+
+    .. versionadded:: 0.3.0
+'''
+
+from collections import defaultdict
+import os.path
+import signal
+import sys
+import time
+import weakref
+
+import greenlet
+
+from .concurrent import add_hook, GreenletHook, remove_hook, \
+                        _groutine_main, _user_frame
+
+# stacks stop at the function that gcall runs in each greenlet
+_base_code = _groutine_main.__code__
+
+
+def _label(code):
+    return '%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename),
+                           code.co_firstlineno)
+
+
+def _fn_label(fn):
+    name = getattr(fn, '__qualname__', None) or getattr(fn, '__name__', repr(fn))
+    module = getattr(fn, '__module__', None)
+    if module:
+        name = '%s.%s' % (module, name)
+    return name.replace(';', ':')
+
+
+class Profiler(GreenletHook):
+    '''
+        A sampling profiler for greenado code
+
+        :param interval: Number of seconds of CPU time between samples
+
+        .. attribute:: cpu
+
+           Maps collapsed stacks to the number of samples taken in them
+
+        .. attribute:: wait
+
+           Maps collapsed stacks to the number of seconds that greenlets were
+           suspended in them
+    '''
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.cpu = defaultdict(int)
+        self.wait = defaultdict(float)
+
+        # greenlet: label of the function it was created for
+        self._roots = weakref.WeakKeyDictionary()
+        # greenlet: (time suspended, stack)
+        self._suspended = weakref.WeakKeyDictionary()
+
+        self._old_handler = None
+        self.running = False
+
+    def start(self):
+        '''Starts profiling'''
+        if self.running:
+            return
+
+        self.running = True
+        add_hook(self)
+        self._old_handler = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        '''Stops profiling'''
+        if not self.running:
+            return
+
+        self.running = False
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self._old_handler or signal.SIG_DFL)
+        remove_hook(self)
+        self._suspended.clear()
+
+    def _stack(self, gr, frame):
+        labels = []
+        while frame is not None:
+            code = frame.f_code
+            if code is _base_code:
+                break
+            labels.append(_label(code))
+            frame = frame.f_back
+
+        if gr.parent is None:
+            root = '<main>'
+        else:
+            root = self._roots.get(gr, '<greenlet>')
+
+        labels.append(root)
+        labels.reverse()
+        return ';'.join(labels)
+
+    def _sample(self, signum, frame):
+        gr = greenlet.getcurrent()
+        self.cpu[self._stack(gr, frame)] += 1
+
+    def on_spawn(self, gr, parent, fn):
+        self._roots[gr] = _fn_label(fn)
+
+    def on_suspend(self, gr, future):
+        frame = _user_frame(sys._getframe(1))
+        self._suspended[gr] = (time.time(), self._stack(gr, frame))
+
+    def on_resume(self, gr):
+        suspended = self._suspended.pop(gr, None)
+        if suspended is not None:
+            start, stack = suspended
+            self.wait[stack] += time.time() - start
+
+    def collapsed(self, wait=False):
+        '''
+            Returns the profile in collapsed stack format
+
+            :param wait: If True, returns the time spent suspended in
+                         milliseconds, otherwise returns the number of on-CPU
+                         samples
+        '''
+        if wait:
+            items = [(stack, int(round(value * 1000))) for stack, value in self.wait.items()]
+        else:
+            items = list(self.cpu.items())
+
+        return ''.join('%s %d\n' % item for item in sorted(items) if item[1])
+
+    def write_collapsed(self, path, wait=False):
+        '''Writes the output of :meth:`collapsed` to a file'''
+        with open(path, 'w') as fp:
+            fp.write(self.collapsed(wait))
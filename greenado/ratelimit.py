@@ -0,0 +1,349 @@
+#
+# Copyright 2014-2016 Dustin Spicuzza
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+'''
+    Token bucket rate limiters for groutines.
+
+    Groutines that have to wait for tokens are suspended directly, without
+    creating a future for each of them, and are woken in the order that
+    they arrived by a single IOLoop timeout shared by all of the waiters::
+
+        limiter = greenado.RateLimiter(100, burst=20)
+
+        @greenado.groutine
+        def fetch(url):
+            limiter.acquire()
+            return greenado.gyield(client.fetch(url))
+
+    .. versionadded:: 0.3.0
+'''
+
+from collections import deque, OrderedDict
+import heapq
+
+import greenlet
+
+from tornado.ioloop import IOLoop
+from tornado.stack_context import NullContext
+
+from .concurrent import _resume, _suspend, TimeoutError
+
+
+# tokens that will be available within this many seconds are treated as
+# available, so that rounding can't leave a waiter a fraction of a token
+# short when its timer fires
+_SLACK = 1e-6
+
+class _Waiter(object):
+    __slots__ = ('gr', 'n', 'done', 'granted')
+
+    def __init__(self, gr, n):
+        self.gr = gr
+        self.n = n
+        self.done = False
+        self.granted = False
+
+
+class _SharedTimer(object):
+    '''
+        A single IOLoop timeout that calls ``_update`` on whichever limiters
+        asked to be woken up next
+    '''
+
+    def __init__(self):
+        self.heap = []
+        self.seq = 0
+        self.io_loop = None
+        self.timeout = None
+        self.deadline = None
+
+    def call_at(self, deadline, limiter):
+        self.seq += 1
+        heapq.heappush(self.heap, (deadline, self.seq, limiter))
+
+        if self.deadline is None or deadline < self.deadline:
+            self._schedule(deadline)
+
+    def _schedule(self, deadline):
+        if self.io_loop is None:
+            self.io_loop = IOLoop.current()
+        if self.timeout is not None:
+            self.io_loop.remove_timeout(self.timeout)
+
+        self.deadline = deadline
+        with NullContext():
+            self.timeout = self.io_loop.add_timeout(deadline, self._fire)
+
+    def _fire(self):
+        self.timeout = self.deadline = None
+
+        heap = self.heap
+        now = self.io_loop.time()
+        due = []
+        while heap and heap[0][0] <= now:
+            due.append(heapq.heappop(heap)[2])
+
+        # limiters that are woken may ask to be woken again
+        for limiter in due:
+            if limiter._wake_at is not None and limiter._wake_at <= now:
+                limiter._wake_at = None
+                limiter._update(now)
+
+        if heap and self.timeout is None:
+            self._schedule(heap[0][0])
+
+
+class RateLimiter(object):
+    '''
+        A token bucket that limits how often something may be done
+
+        :param rate:  Number of tokens added per second
+        :param burst: Maximum number of tokens that can be saved up, which
+                      is also the number of tokens available at first.
+                      Defaults to ``rate``, and is at least 1.
+
+        Time is measured with :meth:`IOLoop.time <tornado.ioloop.IOLoop.time>`
+        of the current IOLoop. A limiter must only be used from a single
+        IOLoop.
+    '''
+
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+
+        self.rate = float(rate)
+        self.burst = max(burst if burst is not None else rate, 1)
+
+        self.tokens = self.burst
+        self.updated = None
+
+        self._waiters = deque()
+        # (deadline, seq, waiter) for waiters with a timeout
+        self._deadlines = []
+        self._seq = 0
+
+        self._timer = _SharedTimer()
+        self._wake_at = None
+
+    def _refill(self, now):
+        if self.updated is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    @property
+    def available(self):
+        '''Number of tokens that are available right now'''
+        self._refill(IOLoop.current().time())
+        return self.tokens
+
+    @property
+    def waiting(self):
+        '''Number of groutines waiting for tokens'''
+        return sum(1 for waiter in self._waiters if not waiter.done)
+
+    def try_acquire(self, n=1):
+        '''
+            Takes ``n`` tokens if they are available right now, without
+            waiting
+
+            :returns: True if the tokens were taken
+        '''
+        self._refill(IOLoop.current().time())
+        self._skip_done()
+        if not self._waiters and self._has(n):
+            self.tokens -= n
+            return True
+        return False
+
+    def acquire(self, n=1, timeout=None):
+        '''
+            Takes ``n`` tokens, suspending the calling groutine until they
+            are available. Groutines are given tokens in the order that they
+            called this.
+
+            This must only be called from functions that either have a
+            :func:`@greenado.groutine <greenado.concurrent.groutine>`
+            decorator, or functions that are children of functions that have
+            the decorator applied.
+
+            :param n:       Number of tokens to take, at most ``burst``
+            :param timeout: Maximum number of seconds to wait
+
+            :raises: :exc:`greenado.TimeoutError` if the timeout expires
+                     before the tokens are available, in which case no
+                     tokens are taken
+        '''
+        if n > self.burst:
+            raise ValueError("Cannot acquire %s tokens, burst is %s" % (n, self.burst))
+
+        if self.try_acquire(n):
+            return
+
+        gr = greenlet.getcurrent()
+        assert gr.parent is not None, "acquire() can only be called from functions that have the @greenado.groutine decorator in the call stack."
+
+        if timeout is not None and timeout <= 0:
+            raise TimeoutError("Timeout after %s seconds" % timeout)
+
+        now = self.updated
+        waiter = _Waiter(gr, n)
+        self._waiters.append(waiter)
+
+        if timeout is not None:
+            self._seq += 1
+            heapq.heappush(self._deadlines, (now + timeout, self._seq, waiter))
+
+        self._schedule(now)
+
+        try:
+            _suspend(gr, self, timeout, lambda: waiter.done)
+        except BaseException:
+            # cancelled or killed while waiting: the tokens are given back,
+            # or will never be given out
+            if waiter.granted:
+                self.tokens = min(self.burst, self.tokens + n)
+                self._update(IOLoop.current().time())
+            waiter.done = True
+            raise
+
+        if not waiter.granted:
+            raise TimeoutError("Timeout after %s seconds" % timeout)
+
+    def _has(self, n):
+        return self.tokens + self.rate * _SLACK >= n
+
+    def _skip_done(self):
+        waiters = self._waiters
+        while waiters and waiters[0].done:
+            waiters.popleft()
+
+    def _update(self, now):
+        '''Wakes waiters that have tokens or timed out'''
+        self._refill(now)
+
+        deadlines = self._deadlines
+        while deadlines and (deadlines[0][2].done or deadlines[0][0] <= now):
+            waiter = heapq.heappop(deadlines)[2]
+            if not waiter.done:
+                waiter.done = True
+                _resume(waiter.gr)
+
+        waiters = self._waiters
+        while True:
+            self._skip_done()
+            if not waiters or not self._has(waiters[0].n):
+                break
+
+            waiter = waiters.popleft()
+            self.tokens -= waiter.n
+            waiter.done = waiter.granted = True
+            _resume(waiter.gr)
+
+        self._schedule(now)
+
+    def _schedule(self, now):
+        '''Asks the shared timer to call _update when it's next needed'''
+        self._skip_done()
+        if not self._waiters:
+            return
+
+        deadline = now + (self._waiters[0].n - self.tokens) / self.rate
+        if self._deadlines:
+            deadline = min(deadline, self._deadlines[0][0])
+
+        if self._wake_at is None or deadline < self._wake_at:
+            self._wake_at = deadline
+            self._timer.call_at(deadline, self)
+
+
+class KeyedRateLimiter(object):
+    '''
+        A separate :class:`RateLimiter` for each key, such as a tenant or a
+        backend host. Limiters are created when a key is first used, and
+        are dropped once a key has not been used for ``idle_timeout``
+        seconds, or for as long as its bucket takes to refill if that is
+        longer, so that many keys can be tracked. Keys are checked from the
+        least recently used one, and checking stops at the first key that
+        is still in use. All of the limiters share a single IOLoop timeout.
+
+        :param rate:         Number of tokens added per second, per key
+        :param burst:        Maximum number of tokens saved up per key, see
+                             :class:`RateLimiter`
+        :param idle_timeout: Number of seconds after which an unused key is
+                             forgotten
+    '''
+
+    def __init__(self, rate, burst=None, idle_timeout=60):
+        self.rate = rate
+        self.burst = burst
+        self.idle_timeout = idle_timeout
+
+        # key: limiter, least recently used first
+        self._limiters = OrderedDict()
+        self._timer = _SharedTimer()
+
+        # a bucket that hasn't been touched for this long is full
+        burst = max(burst if burst is not None else rate, 1)
+        self._idle_after = max(idle_timeout, burst / float(rate))
+
+    def __len__(self):
+        return len(self._limiters)
+
+    def __contains__(self, key):
+        return key in self._limiters
+
+    def _get(self, key):
+        # the limiter is only used by the caller before it returns, as a
+        # limiter that is kept could be dropped while a new one serves the
+        # same key
+        now = IOLoop.current().time()
+        self._evict(now)
+
+        limiters = self._limiters
+        limiter = limiters.pop(key, None)
+        if limiter is None:
+            limiter = RateLimiter(self.rate, self.burst)
+            limiter._timer = self._timer
+        limiters[key] = limiter
+        return limiter
+
+    def _evict(self, now):
+        limiters = self._limiters
+        cutoff = now - self._idle_after
+
+        # the least recently used keys come first. A limiter that wasn't
+        # updated since the cutoff has a full bucket, and one that has
+        # waiters is updated whenever they are woken, so it's in use.
+        idle = []
+        for key in limiters:
+            limiter = limiters[key]
+            if limiter.updated is not None and limiter.updated > cutoff:
+                break
+            limiter._skip_done()
+            if limiter._waiters:
+                break
+            idle.append(key)
+
+        for key in idle:
+            del limiters[key]
+
+    def try_acquire(self, key, n=1):
+        '''See :meth:`RateLimiter.try_acquire`'''
+        return self._get(key).try_acquire(n)
+
+    def acquire(self, key, n=1, timeout=None):
+        '''See :meth:`RateLimiter.acquire`'''
+        self._get(key).acquire(n, timeout)
@@ -0,0 +1,367 @@
+#
+# Copyright 2014-2016 Dustin Spicuzza
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+'''
+    Circuit breakers and retries for calls made from groutines.
+
+    A circuit breaker stops calling a backend that keeps failing, so that
+    groutines fail fast instead of piling up waiting for it, and retries
+    are limited by a budget shared by all calls, so that they can't
+    multiply the load on a backend that is already overloaded::
+
+        @greenado.circuit_breaker(failure_rate=0.5, reset_timeout=10)
+        def get_user(user_id):
+            return greenado.gyield(client.get_user(user_id), timeout=1)
+
+        @greenado.groutine
+        def handler(user_id):
+            user = greenado.retry(get_user, user_id, attempts=3)
+
+    .. versionadded:: 0.3.0
+'''
+
+from collections import deque, namedtuple
+from functools import wraps
+import random
+
+from tornado.ioloop import IOLoop
+
+from .concurrent import gsleep
+
+
+class CircuitOpenError(Exception):
+    '''
+        Raised instead of calling a function whose circuit breaker is open
+    '''
+
+
+BreakerInfo = namedtuple('BreakerInfo', ['state', 'calls', 'failures',
+                                         'failure_rate', 'rejected'])
+BreakerInfo.__doc__ = '''
+    Statistics for a function decorated with :func:`circuit_breaker`,
+    returned by its ``breaker_info()`` function
+
+    * ``state``: 'closed', 'open' or 'half_open'
+    * ``calls``: number of calls that finished within the window
+    * ``failures``: number of those calls that failed
+    * ``failure_rate``: ``failures / calls``, or 0 if there were no calls
+    * ``rejected``: total number of calls rejected while the breaker was open
+'''
+
+
+class _Window(object):
+    '''
+        Counts events over the last ``window`` seconds, in ``buckets``
+        slices that are dropped as they expire
+    '''
+
+    def __init__(self, window, fields, buckets=10):
+        self.window = window
+        self.width = window / float(buckets)
+        self.fields = fields
+        self.buckets = deque()
+
+    def _expire(self, now):
+        buckets = self.buckets
+        cutoff = now - self.window
+        while buckets and buckets[0][0] <= cutoff:
+            buckets.popleft()
+
+    def add(self, now, field):
+        self._expire(now)
+        buckets = self.buckets
+        start = now - now % self.width
+        if not buckets or buckets[-1][0] != start:
+            buckets.append([start] + [0] * len(self.fields))
+        buckets[-1][1 + field] += 1
+
+    def totals(self, now):
+        self._expire(now)
+        totals = [0] * len(self.fields)
+        for bucket in self.buckets:
+            for i in range(len(totals)):
+                totals[i] += bucket[1 + i]
+        return totals
+
+    def clear(self):
+        self.buckets.clear()
+
+
+_OK = 0
+_FAILED = 1
+
+
+class _Breaker(object):
+
+    def __init__(self, fn, failure_rate, min_calls, window, reset_timeout,
+                 half_open_calls, failures):
+        self.fn = fn
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.failures = failures
+
+        self.window = _Window(window, ('ok', 'failed'))
+        self.state = 'closed'
+        self.opened_at = None
+        self.probes = 0
+        self.rejected = 0
+
+    def call(self, args, kwargs):
+        now = IOLoop.current().time()
+
+        if self.state == 'open':
+            if now - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                raise CircuitOpenError("Circuit breaker for %s is open" %
+                                       getattr(self.fn, '__name__', self.fn))
+            self.state = 'half_open'
+            self.probes = 0
+
+        probe = self.state == 'half_open'
+        if probe:
+            if self.probes >= self.half_open_calls:
+                self.rejected += 1
+                raise CircuitOpenError("Circuit breaker for %s is half open" %
+                                       getattr(self.fn, '__name__', self.fn))
+            self.probes += 1
+
+        try:
+            result = self.fn(*args, **kwargs)
+        except self.failures:
+            self._record(False, probe)
+            raise
+        except BaseException:
+            self._record(True, probe)
+            raise
+
+        self._record(True, probe)
+        return result
+
+    def _record(self, ok, probe):
+        now = IOLoop.current().time()
+
+        if probe:
+            self.probes -= 1
+            if self.state != 'half_open':
+                # another probe already decided
+                return
+
+            if ok:
+                self.state = 'closed'
+                self.window.clear()
+            else:
+                self._open(now)
+            return
+
+        self.window.add(now, _OK if ok else _FAILED)
+
+        if not ok and self.state == 'closed':
+            succeeded, failed = self.window.totals(now)
+            calls = succeeded + failed
+            if calls >= self.min_calls and failed >= calls * self.failure_rate:
+                self._open(now)
+
+    def _open(self, now):
+        self.state = 'open'
+        self.opened_at = now
+        self.window.clear()
+
+    def info(self):
+        now = IOLoop.current().time()
+        if self.state == 'open' and now - self.opened_at >= self.reset_timeout:
+            state = 'half_open'
+        else:
+            state = self.state
+
+        succeeded, failed = self.window.totals(now)
+        calls = succeeded + failed
+        return BreakerInfo(state, calls, failed,
+                           failed / float(calls) if calls else 0.0,
+                           self.rejected)
+
+    def reset(self):
+        self.state = 'closed'
+        self.opened_at = None
+        self.window.clear()
+        self.rejected = 0
+
+
+def circuit_breaker(failure_rate=0.5, min_calls=20, window=30, reset_timeout=30,
+                    half_open_calls=1, failures=(Exception,)):
+    '''
+        A decorator that stops calling a function while it keeps failing.
+        The decorated function may use
+        :func:`gyield <greenado.concurrent.gyield>`, and must only be called
+        from functions that either have a
+        :func:`@greenado.groutine <greenado.concurrent.groutine>` decorator,
+        or functions that are children of functions that have the decorator
+        applied.
+
+        Once at least ``min_calls`` calls have finished within the last
+        ``window`` seconds, and at least ``failure_rate`` of them failed, the
+        breaker opens. Timeouts raised by ``gyield`` count as failures like
+        any other exception. While the breaker is open, calls raise
+        :exc:`CircuitOpenError` without calling the function. After
+        ``reset_timeout`` seconds the breaker is half open: up to
+        ``half_open_calls`` calls are let through at a time as probes, and
+        the breaker closes if a probe succeeds, or opens again if it fails.
+
+        The decorated function has ``breaker_info()`` and
+        ``breaker_reset()`` functions. ``breaker_info()`` returns a
+        :class:`BreakerInfo`.
+
+        Time is measured with :meth:`IOLoop.time <tornado.ioloop.IOLoop.time>`
+        of the current IOLoop.
+
+        :param failure_rate:    Fraction of calls that must fail to open the
+                                breaker
+        :param min_calls:       Minimum number of calls within the window
+                                before the breaker can open
+        :param window:          Number of seconds that calls are counted over
+        :param reset_timeout:   Number of seconds the breaker stays open
+        :param half_open_calls: Number of probes allowed at once while half
+                                open
+        :param failures:        Exception types that count as failures.
+                                Other exceptions count as successes.
+
+        .. versionadded:: 0.3.0
+    '''
+
+    def decorator(f):
+        breaker = _Breaker(f, failure_rate, min_calls, window, reset_timeout,
+                           half_open_calls, failures)
+
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            return breaker.call(args, kwargs)
+
+        wrapper.breaker_info = breaker.info
+        wrapper.breaker_reset = breaker.reset
+        return wrapper
+
+    return decorator
+
+
+class RetryBudget(object):
+    '''
+        Limits retries to a fraction of the calls made through
+        :func:`retry`, so that retries can add at most that much load to
+        a backend, no matter how many calls are failing.
+
+        Over the last ``window`` seconds, the number of retries may be at
+        most ``ratio`` times the number of calls, plus ``min_per_second``
+        retries per second, so that occasional failures can be retried
+        while there are few calls.
+
+        :param ratio:          Retries allowed per call
+        :param min_per_second: Retries per second that are always allowed
+        :param window:         Number of seconds calls and retries are
+                               counted over
+    '''
+
+    def __init__(self, ratio=0.2, min_per_second=10, window=10):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window = window
+
+        self._counts = _Window(window, ('calls', 'retries'))
+
+        #: Number of retries that were not made because of the budget
+        self.exhausted = 0
+
+    def _call(self, now):
+        self._counts.add(now, 0)
+
+    def _try_retry(self, now):
+        calls, retries = self._counts.totals(now)
+        if retries >= calls * self.ratio + self.min_per_second * self.window:
+            self.exhausted += 1
+            return False
+
+        self._counts.add(now, 1)
+        return True
+
+
+_default_budget = RetryBudget()
+
+
+def retry(fn, *args, **kwargs):
+    '''
+        Calls a function, and calls it again if it raises an exception,
+        sleeping with :func:`gsleep <greenado.concurrent.gsleep>` between
+        attempts. The delays grow exponentially, and each is chosen at random
+        between 0 and the exponential delay, so that callers that failed
+        together don't retry together::
+
+            @greenado.groutine
+            def handler():
+                user = greenado.retry(get_user, user_id, attempts=5,
+                                      retry_on=(greenado.TimeoutError,))
+
+        A retry is only made if the retry budget allows it, otherwise the
+        exception is raised. All calls share a single :class:`RetryBudget`
+        unless another one is passed. :exc:`CircuitOpenError` is never
+        retried.
+
+        This must only be called from functions that either have a
+        :func:`@greenado.groutine <greenado.concurrent.groutine>` decorator,
+        or functions that are children of functions that have the decorator
+        applied.
+
+        :param fn:          Function to call
+        :param args:        Function arguments
+        :param kwargs:      Function keyword arguments
+        :param attempts:    Keyword-only. Maximum number of calls, defaults
+                            to 3
+        :param backoff:     Keyword-only. Maximum delay before the first
+                            retry, which doubles for each retry after it.
+                            Defaults to 0.1 seconds.
+        :param max_backoff: Keyword-only. Maximum delay, defaults to 10
+                            seconds
+        :param retry_on:    Keyword-only. Exception types to retry, defaults
+                            to all exceptions
+        :param budget:      Keyword-only. :class:`RetryBudget` to use
+
+        :returns: The result of the first successful call
+
+        .. versionadded:: 0.3.0
+    '''
+
+    attempts = kwargs.pop('attempts', 3)
+    backoff = kwargs.pop('backoff', 0.1)
+    max_backoff = kwargs.pop('max_backoff', 10)
+    retry_on = kwargs.pop('retry_on', (Exception,))
+    budget = kwargs.pop('budget', None) or _default_budget
+
+    io_loop = IOLoop.current()
+    budget._call(io_loop.time())
+
+    attempt = 0
+    while True:
+        try:
+            return fn(*args, **kwargs)
+        except CircuitOpenError:
+            raise
+        except retry_on:
+            attempt += 1
+            if attempt >= attempts or not budget._try_retry(io_loop.time()):
+                raise
+
+        delay = random.uniform(0, min(max_backoff, backoff * 2 ** (attempt - 1)))
+        if delay > 0:
+            gsleep(delay)
@@ -1,13 +1,313 @@
 
 import functools
+import heapq
+import numbers
+import random
+import select
+import socket
+import sys
+import threading
+import traceback
 
 import greenado
+from greenado import concurrent
 
-from tornado.ioloop import TimeoutError
+from tornado import stack_context
+from tornado.ioloop import IOLoop, TimeoutError
 from tornado.testing import get_async_test_timeout
 
 
-def gen_test(func=None, timeout=None):
+class _VirtualTimeout(object):
+    __slots__ = ['deadline', 'callback']
+
+    def __init__(self, deadline, callback):
+        self.deadline = deadline
+        self.callback = callback
+
+
+class VirtualClock(object):
+    '''
+        Replaces the time of an IOLoop with a virtual clock. The virtual time
+        does not advance on its own: whenever the IOLoop has no work left to
+        do except for waiting on timeouts, the virtual time immediately
+        jumps forward to the next timeout and runs it. This makes code that
+        uses :func:`greenado.gsleep <greenado.concurrent.gsleep>`, the timeout
+        parameter of :func:`greenado.gyield <greenado.concurrent.gyield>`, or
+        :meth:`IOLoop.add_timeout <tornado.ioloop.IOLoop.add_timeout>` run
+        as fast as possible, and deterministically.
+
+        Only timeouts that are scheduled via the IOLoop are virtual. The
+        IOLoop is idle once no callbacks added with
+        :meth:`IOLoop.add_callback <tornado.ioloop.IOLoop.add_callback>` are
+        waiting to run, and none of the file descriptors registered with
+        :meth:`IOLoop.add_handler <tornado.ioloop.IOLoop.add_handler>` since
+        the clock was installed are ready. A reply that hasn't arrived yet
+        doesn't keep the IOLoop busy, so timeouts can expire before slow
+        network I/O completes.
+
+        Example::
+
+            with VirtualClock(io_loop):
+                io_loop.run_sync(something_that_sleeps)
+
+        :param io_loop:      The IOLoop to replace the time of
+        :param real_timeout: If the IOLoop is still running after this many
+                             real seconds, it is stopped and
+                             :attr:`timed_out` is set
+
+        .. versionadded:: 0.3.0
+    '''
+
+    # number of consecutive IOLoop iterations that must be idle before the
+    # time advances, so that callbacks scheduled directly on the event loop
+    # rather than through the IOLoop, such as by asyncio, can run first
+    idle_iterations = 2
+
+    _patched = ('time', 'add_timeout', 'call_at', 'call_later',
+                'remove_timeout', 'add_callback', 'add_handler',
+                'update_handler', 'remove_handler')
+
+    def __init__(self, io_loop, real_timeout=None):
+        self.io_loop = io_loop
+        self.real_timeout = real_timeout
+        self.installed = False
+
+        #: Set when the IOLoop was stopped because of ``real_timeout``
+        self.timed_out = False
+
+        self._timeouts = []
+        self._seq = 0
+
+    def install(self):
+        '''Starts using virtual time for the IOLoop'''
+
+        assert not self.installed
+        self.installed = True
+
+        io_loop = self.io_loop
+
+        self.now = io_loop.time()
+        self.timed_out = False
+
+        self._orig_add_callback = io_loop.add_callback
+        self._orig_remove_timeout = io_loop.remove_timeout
+        self._orig_add_handler = io_loop.add_handler
+        self._orig_update_handler = io_loop.update_handler
+        self._orig_remove_handler = io_loop.remove_handler
+
+        # callbacks added through the IOLoop that haven't run yet, which
+        # may be added from other threads
+        self._pending = 0
+        self._lock = threading.Lock()
+        # fd: events, for handlers added while installed
+        self._fds = {}
+        self._idle = 0
+        self._check_scheduled = False
+
+        io_loop.time = self.time
+        io_loop.add_timeout = self._add_timeout
+        io_loop.call_at = self._call_at
+        io_loop.call_later = self._call_later
+        io_loop.remove_timeout = self._remove_timeout
+        io_loop.add_callback = self._add_callback
+        io_loop.add_handler = self._add_handler
+        io_loop.update_handler = self._update_handler
+        io_loop.remove_handler = self._remove_handler
+
+        # the IOLoop's own timeouts use the virtual time, so the real
+        # timeout is measured by a thread
+        self._timer = None
+        if self.real_timeout is not None:
+            self._timer = threading.Timer(self.real_timeout,
+                                          self._orig_add_callback,
+                                          (self._real_timeout_expired,))
+            self._timer.daemon = True
+            self._timer.start()
+
+        self._schedule_check()
+
+    def uninstall(self):
+        '''Stops using virtual time for the IOLoop'''
+
+        if not self.installed:
+            return
+        self.installed = False
+
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        for name in self._patched:
+            delattr(self.io_loop, name)
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.uninstall()
+
+    def time(self):
+        '''Returns the current virtual time'''
+        return self.now
+
+    def advance(self, seconds):
+        '''
+            Moves the virtual time forward, and runs any timeouts that
+            expired as a result.
+        '''
+        self.now += seconds
+        self._run_expired()
+
+    def _add_timeout(self, deadline, callback, *args, **kwargs):
+        if not isinstance(deadline, numbers.Real):
+            deadline = self.now + deadline.total_seconds()
+        return self._call_at(deadline, callback, *args, **kwargs)
+
+    def _call_later(self, delay, callback, *args, **kwargs):
+        return self._call_at(self.now + delay, callback, *args, **kwargs)
+
+    def _call_at(self, deadline, callback, *args, **kwargs):
+        timeout = _VirtualTimeout(
+            deadline,
+            functools.partial(stack_context.wrap(callback), *args, **kwargs))
+
+        self._seq += 1
+        heapq.heappush(self._timeouts, (deadline, self._seq, timeout))
+
+        # this may have been called from a callback that the clock doesn't
+        # know about, so it must check whether the IOLoop is idle
+        self._activity()
+        return timeout
+
+    def _remove_timeout(self, timeout):
+        if isinstance(timeout, _VirtualTimeout):
+            timeout.callback = None
+        else:
+            self._orig_remove_timeout(timeout)
+
+    def _add_callback(self, callback, *args, **kwargs):
+        with self._lock:
+            self._pending += 1
+        self._orig_add_callback(
+            self._run,
+            functools.partial(stack_context.wrap(callback), *args, **kwargs))
+
+    def _run(self, callback):
+        try:
+            return callback()
+        finally:
+            with self._lock:
+                self._pending -= 1
+            self._activity()
+
+    def _add_handler(self, fd, handler, events):
+        self._fds[fd] = events
+        return self._orig_add_handler(fd, handler, events)
+
+    def _update_handler(self, fd, events):
+        if fd in self._fds:
+            self._fds[fd] = events
+        return self._orig_update_handler(fd, events)
+
+    def _remove_handler(self, fd):
+        self._fds.pop(fd, None)
+        return self._orig_remove_handler(fd)
+
+    def _fds_ready(self):
+        '''Whether any of the file descriptors with handlers are ready'''
+        read, write = [], []
+        for fd, events in self._fds.items():
+            if events & IOLoop.READ:
+                read.append(fd)
+            if events & IOLoop.WRITE:
+                write.append(fd)
+
+        if not read and not write:
+            return False
+
+        try:
+            readable, writable, _ = select.select(read, write, [], 0)
+        except (ValueError, select.error, socket.error):
+            # closed without removing the handler, the IOLoop will notice
+            return True
+        return bool(readable or writable)
+
+    def _run_expired(self):
+        timeouts = self._timeouts
+        while timeouts and timeouts[0][0] <= self.now:
+            timeout = heapq.heappop(timeouts)[2]
+            if timeout.callback is not None:
+                self._add_callback(timeout.callback)
+                timeout.callback = None
+
+    def _activity(self):
+        self._idle = 0
+        self._schedule_check()
+
+    def _schedule_check(self):
+        if self.installed and not self._check_scheduled:
+            self._check_scheduled = True
+            self._orig_add_callback(self._check)
+
+    def _check(self):
+        '''
+            Advances the time if the IOLoop is idle. Nothing is scheduled
+            while the IOLoop is busy or has nothing to wait for: the
+            callbacks that keep it busy, and anything that adds a timeout,
+            schedule the next check.
+        '''
+        self._check_scheduled = False
+        if not self.installed or self._pending:
+            return
+
+        timeouts = self._timeouts
+        while timeouts and timeouts[0][2].callback is None:
+            heapq.heappop(timeouts)
+        if not timeouts:
+            return
+
+        if self._fds_ready():
+            # check again once the IOLoop has handled them
+            self._activity()
+            return
+
+        self._idle += 1
+        if self._idle < self.idle_iterations:
+            self._schedule_check()
+            return
+
+        self._idle = 0
+        if timeouts[0][0] > self.now:
+            self.now = timeouts[0][0]
+        self._run_expired()
+
+    def _real_timeout_expired(self):
+        if self.installed:
+            self.timed_out = True
+            self.io_loop.stop()
+
+
+def _run_virtual(io_loop, fn, timeout):
+    '''
+        Runs fn on the IOLoop with a :class:`VirtualClock`, and raises
+        TimeoutError if it doesn't finish within timeout real seconds
+    '''
+    with VirtualClock(io_loop, real_timeout=timeout) as clock:
+        try:
+            result = io_loop.run_sync(fn)
+        except Exception:
+            # how run_sync fails when it is stopped depends on the version
+            # of tornado
+            if not clock.timed_out:
+                raise
+
+    if clock.timed_out:
+        raise TimeoutError('Operation timed out after %s seconds' % timeout)
+    return result
+
+
+def gen_test(func=None, timeout=None, virtual_time=False):
     '''
         An implementation of :func:`tornado.testing.gen_test` for
         :func:`@greenado.groutine <greenado.concurrent.groutine>`
@@ -21,19 +321,259 @@ def gen_test(func=None, timeout=None):
                 @greenado.testing.gen_test
                 def test_something(self):
                     something_that_yields()
+        
+        :param timeout:      Number of seconds the test may run for
+        :param virtual_time: If True, the test is run using a
+                             :class:`VirtualClock`. The timeout is still
+                             measured in real time.
+        
+        .. versionchanged:: 0.3.0
+           Added virtual_time parameter
     '''
     
     if func is None:
-        return functools.partial(gen_test, timeout=timeout)
+        return functools.partial(gen_test, timeout=timeout,
+                                 virtual_time=virtual_time)
     
     if timeout is None:
         timeout = get_async_test_timeout()
     
     @functools.wraps(func)
     def wrapper(self, *args, **kwargs):
-        return self.io_loop.run_sync(
-            functools.partial(greenado.gcall, func, self, *args, **kwargs),
-            timeout=timeout)
+        fn = functools.partial(greenado.gcall, func, self, *args, **kwargs)
+        
+        if not virtual_time:
+            return self.io_loop.run_sync(fn, timeout=timeout)
+        
+        return _run_virtual(self.io_loop, fn, timeout)
     
     return wrapper
-        
\ No newline at end of file
+        
+
+class InterleavingError(AssertionError):
+    '''
+        Raised by :func:`explore` when a run fails. The ``seed`` and
+        ``schedule`` attributes can be passed to :func:`replay` to run the
+        failing interleaving again, and ``run`` is the number of runs that
+        passed before it.
+        
+        .. versionadded:: 0.3.0
+    '''
+    
+    def __init__(self, message, seed, schedule, run):
+        super(InterleavingError, self).__init__(message)
+        self.seed = seed
+        self.schedule = schedule
+        self.run = run
+
+
+class _Interleaver(object):
+    '''
+        Takes the place of the run queue while :func:`explore` is running.
+        Greenlets that become ready are collected, and resumed one per
+        IOLoop iteration in an order chosen by a schedule, a random number
+        generator, or failing both, in the order they became ready.
+    '''
+    
+    def __init__(self, rng, schedule):
+        self.rng = rng
+        self.schedule = schedule or []
+        
+        # (index chosen, number of choices), for each decision with more
+        # than one ready greenlet
+        self.choices = []
+        
+        self.ready = []
+        self.scheduled = False
+    
+    def push(self, gr):
+        if gr in self.ready:
+            return
+        
+        self.ready.append(gr)
+        if not self.scheduled:
+            self.scheduled = True
+            IOLoop.current().add_callback(self._step)
+    
+    def _choose(self, count):
+        pos = len(self.choices)
+        if pos < len(self.schedule):
+            index = self.schedule[pos]
+            if index >= count:
+                raise RuntimeError("Schedule diverged at decision %d: %d greenlets "
+                                   "are ready, expected more than %d" % (pos, count, index))
+        elif self.rng is not None:
+            index = self.rng.randrange(count)
+        else:
+            index = 0
+        
+        self.choices.append((index, count))
+        return index
+    
+    def _step(self):
+        self.scheduled = False
+        ready = self.ready
+        
+        if len(ready) > 1:
+            gr = ready.pop(self._choose(len(ready)))
+        else:
+            gr = ready.pop()
+        
+        # greenlets that become ready while this one runs join the others
+        if ready and not self.scheduled:
+            self.scheduled = True
+            IOLoop.current().add_callback(self._step)
+        
+        if not gr.dead:
+            gr.switch()
+
+
+def _next_schedule(choices):
+    '''
+        Returns the schedule that explores the next interleaving after the
+        one that made these choices, depth first, or None once they have all
+        been explored
+    '''
+    for pos in range(len(choices) - 1, -1, -1):
+        index, count = choices[pos]
+        if index + 1 < count:
+            return [c[0] for c in choices[:pos]] + [index + 1]
+    return None
+
+
+def _current_io_loop():
+    '''
+        Returns the current IOLoop, or None if there isn't one. Before
+        tornado 4.3, which added the ``instance`` argument, the global
+        instance is returned instead of None.
+    '''
+    try:
+        return IOLoop.current(instance=False)
+    except TypeError:
+        return IOLoop.current()
+
+
+def _run_interleaved(fn, interleaver, virtual_time, timeout):
+    if timeout is None:
+        timeout = get_async_test_timeout()
+    
+    old_io_loop = _current_io_loop()
+    io_loop = IOLoop()
+    io_loop.make_current()
+    concurrent._scheduler = interleaver
+    
+    try:
+        if not virtual_time:
+            io_loop.run_sync(functools.partial(greenado.gcall, fn), timeout=timeout)
+        else:
+            _run_virtual(io_loop, functools.partial(greenado.gcall, fn), timeout)
+    finally:
+        concurrent._scheduler = None
+        if old_io_loop is None:
+            io_loop.clear_current()
+        else:
+            old_io_loop.make_current()
+        io_loop.close(all_fds=True)
+
+
+def explore(fn, runs=100, seed=0, systematic=False, virtual_time=True,
+            timeout=None):
+    '''
+        Runs a function many times, each time resuming groutines in a
+        different order, to find race conditions that only show up under
+        some interleavings.
+        
+        Whenever more than one greenlet is ready to be resumed after
+        :func:`gyield <greenado.concurrent.gyield>`,
+        :func:`gmoment <greenado.concurrent.gmoment>`,
+        :func:`gsleep <greenado.concurrent.gsleep>` or any other wait, the
+        one that is resumed next is chosen at random, using a random number
+        generator seeded with ``seed + run``. If ``systematic`` is True, the
+        choices are instead enumerated depth first, so that every distinct
+        interleaving is tried once, up to ``runs`` of them.
+        
+        Each run calls ``fn`` in a groutine on a new IOLoop, which must
+        wait for any groutines that it starts. A run fails if ``fn`` raises
+        an exception or doesn't finish within ``timeout`` seconds, such as
+        when the groutines deadlock. The failing interleaving is reported
+        by an :exc:`InterleavingError` and can be repeated with
+        :func:`replay`::
+        
+            def scenario():
+                account = Account(balance=0)
+                futures = [greenado.gcall(account.deposit, 50)
+                           for _ in range(2)]
+                for future in futures:
+                    greenado.gyield(future)
+                assert account.balance == 100
+            
+            def test_deposit():
+                greenado.testing.explore(scenario, runs=200)
+        
+        Greenlets are only reordered relative to each other: ``fn`` should
+        not depend on anything else that varies between runs, such as real
+        time or network I/O.
+        
+        :param fn:           Function to run
+        :param runs:         Maximum number of runs
+        :param seed:         Seed of the first random run
+        :param systematic:   Enumerate interleavings instead of choosing
+                             them at random
+        :param virtual_time: Run each run with a :class:`VirtualClock`, so
+                             that timeouts are fast and fire in a
+                             deterministic order
+        :param timeout:      Number of real seconds each run may take,
+                             defaults to the timeout of :func:`gen_test`
+        
+        :returns: Number of runs made, which is smaller than ``runs`` if
+                  ``systematic`` is True and every interleaving was tried
+        :raises: :exc:`InterleavingError` if a run fails
+        
+        .. versionadded:: 0.3.0
+    '''
+    
+    schedule = []
+    for run in range(runs):
+        if systematic:
+            run_seed = None
+            interleaver = _Interleaver(None, schedule)
+        else:
+            run_seed = seed + run
+            interleaver = _Interleaver(random.Random(run_seed), None)
+        
+        try:
+            _run_interleaved(fn, interleaver, virtual_time, timeout)
+        except Exception:
+            failure = ''.join(traceback.format_exception(*sys.exc_info()))
+            schedule = [index for index, _ in interleaver.choices]
+            raise InterleavingError(
+                "Run %d failed, replay with seed=%r, schedule=%r\n\n%s" %
+                (run, run_seed, schedule, failure), run_seed, schedule, run)
+        
+        if systematic:
+            schedule = _next_schedule(interleaver.choices)
+            if schedule is None:
+                return run + 1
+    
+    return runs
+
+
+def replay(fn, seed=None, schedule=None, virtual_time=True, timeout=None):
+    '''
+        Runs a function once under the interleaving reported by an
+        :exc:`InterleavingError`. Exceptions raised by the function are
+        raised as is.
+        
+        :param fn:       Function to run
+        :param seed:     ``seed`` of the error, for random runs
+        :param schedule: ``schedule`` of the error. Choices that aren't in
+                         the schedule are made at random if ``seed`` is
+                         set, and otherwise resume the greenlet that became
+                         ready first.
+        
+        The other parameters are the same as for :func:`explore`.
+        
+        .. versionadded:: 0.3.0
+    '''
+    rng = random.Random(seed) if seed is not None else None
+    _run_interleaved(fn, _Interleaver(rng, schedule), virtual_time, timeout)
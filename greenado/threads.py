@@ -0,0 +1,290 @@
+#
+# Copyright 2014-2016 Dustin Spicuzza
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+'''
+    Utilities for interacting with groutines from other threads.
+'''
+
+from __future__ import absolute_import
+
+from concurrent.futures import Future as ConcurrentFuture
+from functools import partial
+import sys
+import threading
+import weakref
+
+from tornado.ioloop import IOLoop
+
+from .concurrent import gcall
+
+
+class _Inbox(object):
+    '''
+        Collects work submitted from other threads for a single IOLoop. Only
+        the first submission after the inbox is drained wakes up the IOLoop,
+        the rest of a burst is picked up by the same callback.
+    '''
+
+    def __init__(self, io_loop):
+        self.io_loop = io_loop
+        self.lock = threading.Lock()
+        self.items = []
+        self.scheduled = False
+
+    def put(self, item):
+        with self.lock:
+            self.items.append(item)
+            if self.scheduled:
+                return
+            self.scheduled = True
+
+        self.io_loop.add_callback(self.drain)
+
+    def drain(self):
+        with self.lock:
+            items, self.items = self.items, []
+            self.scheduled = False
+
+        for cfuture, fn, args, kwargs in items:
+            if not cfuture.set_running_or_notify_cancel():
+                continue
+
+            future = gcall(fn, *args, **kwargs)
+            self.io_loop.add_future(future, partial(_copy_result, cfuture))
+
+
+def _copy_result(cfuture, future):
+    # LoopGroup.stop() may have failed it already
+    if cfuture.done():
+        return
+    try:
+        result = future.result()
+    except Exception:
+        cfuture.set_exception(sys.exc_info()[1])
+    else:
+        cfuture.set_result(result)
+
+
+_inboxes = weakref.WeakKeyDictionary()
+_inboxes_lock = threading.Lock()
+
+def _get_inbox(io_loop):
+    with _inboxes_lock:
+        inbox = _inboxes.get(io_loop)
+        if inbox is None:
+            inbox = _inboxes[io_loop] = _Inbox(io_loop)
+        return inbox
+
+
+def submit_threadsafe(fn, *args, **kwargs):
+    '''
+        Runs a function as a groutine on an IOLoop from any thread, and
+        returns a :class:`concurrent.futures.Future` that can be waited on
+        from the calling thread. The function may use
+        :func:`gyield <greenado.concurrent.gyield>` just as if it had been
+        called via :func:`gcall <greenado.concurrent.gcall>`.
+
+        Submissions are batched: if several functions are submitted before
+        the IOLoop gets around to running them, the IOLoop is only woken up
+        once to run all of them.
+
+        :param fn:      Function to call
+        :param args:    Function arguments
+        :param kwargs:  Function keyword arguments
+        :param io_loop: Keyword-only. The IOLoop to run the function on,
+                        defaults to :meth:`IOLoop.current() <tornado.ioloop.IOLoop.current>`.
+                        As of Tornado 5.0 there is no global IOLoop instance,
+                        so callers in other threads should always specify
+                        this.
+
+        :returns: :class:`concurrent.futures.Future`
+
+        .. versionadded:: 0.3.0
+    '''
+
+    io_loop = kwargs.pop('io_loop', None)
+    if io_loop is None:
+        io_loop = IOLoop.current()
+
+    cfuture = ConcurrentFuture()
+    _get_inbox(io_loop).put((cfuture, fn, args, kwargs))
+    return cfuture
+
+
+class LoopGroup(object):
+    '''
+        Runs a number of IOLoops, each in its own thread, and runs functions
+        as groutines on them. Functions are sent to the IOLoop with the least
+        outstanding work, or when a key is given, always to the same IOLoop
+        for that key, so state for the key can be kept on that IOLoop
+        without locking.
+
+        Because of the GIL, this only helps workloads that spend much of
+        their time in code that releases it, such as C extensions or
+        blocking IO in other libraries.
+
+        Example::
+
+            with LoopGroup(4) as group:
+                cfuture = group.submit(handle_request, request, key=user_id)
+                result = cfuture.result()
+
+        :param n:    Number of IOLoops
+        :param name: Prefix of the names of the threads
+
+        .. versionadded:: 0.3.0
+    '''
+
+    def __init__(self, n, name='greenado-loop'):
+        if n < 1:
+            raise ValueError("n must be at least 1")
+
+        self.n = n
+        self.name = name
+        self.loops = []
+        self._threads = []
+        self._outstanding = [0] * n
+        self._pending = set()
+        self._stopped = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        '''Starts the IOLoop threads, and waits until they are running'''
+        if self._threads:
+            return
+
+        ready = threading.Semaphore(0)
+        loops = [None] * self.n
+
+        def _run(idx):
+            io_loop = IOLoop()
+            io_loop.make_current()
+            loops[idx] = io_loop
+            io_loop.add_callback(ready.release)
+            try:
+                io_loop.start()
+            finally:
+                io_loop.close(all_fds=False)
+
+        for idx in range(self.n):
+            thread = threading.Thread(target=_run, args=(idx,),
+                                      name='%s-%d' % (self.name, idx))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+        for _ in range(self.n):
+            ready.acquire()
+
+        with self._lock:
+            self.loops = loops
+            self._stopped = False
+
+    def stop(self, timeout=None):
+        '''
+            Stops the IOLoops, and waits for their threads to exit. The
+            futures of functions that haven't finished yet, or that are
+            submitted while the group is stopping, fail with
+            :exc:`RuntimeError`.
+        '''
+        # functions submitted from now on fail, even if submit() already
+        # picked an IOLoop
+        with self._lock:
+            loops = self.loops
+            self.loops = []
+            self._stopped = True
+
+        for io_loop in loops:
+            io_loop.add_callback(io_loop.stop)
+
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+        with self._lock:
+            pending, self._pending = self._pending, set()
+
+        for cfuture in pending:
+            self._fail(cfuture)
+
+    def _fail(self, cfuture):
+        if cfuture.done():
+            return
+        try:
+            cfuture.set_exception(RuntimeError(
+                "LoopGroup was stopped before the function finished"))
+        except Exception:
+            # finished by its IOLoop in the meantime
+            pass
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def load(self):
+        '''Returns the number of outstanding functions on each IOLoop'''
+        with self._lock:
+            return list(self._outstanding)
+
+    def submit(self, fn, *args, **kwargs):
+        '''
+            Runs a function as a groutine on one of the IOLoops, and returns
+            a :class:`concurrent.futures.Future` for its result. This may be
+            called from any thread.
+
+            :param fn:      Function to call
+            :param args:    Function arguments
+            :param kwargs:  Function keyword arguments
+            :param key:     Keyword-only. If given, functions submitted with
+                            the same key always run on the same IOLoop.
+                            Otherwise the least loaded IOLoop is used.
+
+            :returns: :class:`concurrent.futures.Future`
+        '''
+
+        key = kwargs.pop('key', None)
+
+        with self._lock:
+            loops = self.loops
+            if not loops:
+                raise RuntimeError("LoopGroup is not running")
+
+            outstanding = self._outstanding
+            if key is not None:
+                idx = hash(key) % self.n
+            else:
+                idx = outstanding.index(min(outstanding))
+            outstanding[idx] += 1
+
+        kwargs['io_loop'] = loops[idx]
+        cfuture = submit_threadsafe(fn, *args, **kwargs)
+        with self._lock:
+            stopped = self._stopped
+            if not stopped:
+                self._pending.add(cfuture)
+        if stopped:
+            # stop() may already have failed the functions it knew about
+            self._fail(cfuture)
+        cfuture.add_done_callback(partial(self._on_done, idx))
+        return cfuture
+
+    def _on_done(self, idx, cfuture):
+        with self._lock:
+            self._outstanding[idx] -= 1
+            self._pending.discard(cfuture)
@@ -0,0 +1,257 @@
+#
+# Copyright 2014-2016 Dustin Spicuzza
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+'''
+    Lightweight tracing that follows greenlet switches. Each greenlet has its
+    own current span, and greenlets created by
+    :func:`gcall <greenado.concurrent.gcall>` or a
+    :func:`groutine <greenado.concurrent.groutine>` start out with the
+    current span of the greenlet that created them. Spans record an event
+    each time their greenlet is suspended and resumed.
+
+    Example::
+
+        from greenado import tracing
+
+        tracing.enable(tracing.JsonLinesExporter('/tmp/spans.jsonl'))
+
+        @greenado.groutine
+        def handle_request():
+            with tracing.span('handle_request', path='/'):
+                greenado.gyield(fetch_something())
+
+    .. versionadded:: 0.3.0
+'''
+
+from contextlib import contextmanager
+import json
+import random
+import time
+import weakref
+
+import greenlet
+
+from .concurrent import add_hook, GreenletHook, remove_hook
+
+
+class Span(object):
+    '''
+        A single traced operation. Spans are created by :func:`span`.
+    '''
+
+    def __init__(self, name, trace_id, parent_id, tags):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = '%016x' % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.tags = tags
+        self.events = []
+        self.start = time.time()
+        self.end = None
+
+    def set_tag(self, key, value):
+        '''Sets a tag on the span'''
+        self.tags[key] = value
+
+    def add_event(self, name, **attrs):
+        '''Records a timestamped event on the span'''
+        self.events.append((time.time(), name, attrs))
+
+    def to_dict(self):
+        '''Returns a JSON serializable representation of the span'''
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start': self.start,
+            'end': self.end,
+            'tags': self.tags,
+            'events': [dict(attrs, name=name, time=t) for t, name, attrs in self.events],
+        }
+
+    def __repr__(self):
+        return '<Span %s %s/%s>' % (self.name, self.trace_id, self.span_id)
+
+
+class SpanExporter(object):
+    '''
+        Base class for span exporters. Subclasses must implement
+        :meth:`export`.
+    '''
+
+    def export(self, span):
+        '''Called when a span has finished'''
+        raise NotImplementedError()
+
+    def flush(self):
+        '''Writes out any buffered spans'''
+
+    def close(self):
+        '''Flushes the exporter and releases its resources'''
+        self.flush()
+
+
+class InMemoryExporter(SpanExporter):
+    '''
+        Keeps finished spans in a list, useful for testing
+
+        .. attribute:: spans
+
+           List of finished spans
+    '''
+
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span)
+
+
+class JsonLinesExporter(SpanExporter):
+    '''
+        Writes finished spans to a file, one JSON object per line. Spans are
+        buffered, and are written once ``buffer_size`` spans have finished
+        or when :meth:`flush` is called.
+
+        :param path:        File to append spans to
+        :param buffer_size: Number of spans to buffer before writing
+    '''
+
+    def __init__(self, path, buffer_size=100):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.buffer = []
+
+    def export(self, span):
+        self.buffer.append(span)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+
+        buffer, self.buffer = self.buffer, []
+        with open(self.path, 'a') as fp:
+            for span in buffer:
+                fp.write(json.dumps(span.to_dict(), default=repr))
+                fp.write('\n')
+
+
+# greenlet: current span
+_current = weakref.WeakKeyDictionary()
+
+_exporter = None
+_hook = None
+
+
+class _TracingHook(GreenletHook):
+
+    def on_spawn(self, gr, parent, fn):
+        span = _current.get(parent)
+        if span is not None:
+            _current[gr] = span
+
+    def on_suspend(self, gr, future):
+        span = _current.get(gr)
+        if span is not None:
+            if future is None:
+                span.add_event('suspend')
+            else:
+                span.add_event('suspend', future=repr(future))
+
+    def on_resume(self, gr):
+        span = _current.get(gr)
+        if span is not None:
+            span.add_event('resume')
+
+
+def enable(exporter):
+    '''
+        Starts recording spans, and sends finished spans to an exporter
+
+        :param exporter: A :class:`SpanExporter`
+    '''
+    global _exporter, _hook
+
+    if _hook is None:
+        _hook = _TracingHook()
+        add_hook(_hook)
+
+    _exporter = exporter
+
+
+def disable():
+    '''
+        Stops recording spans, and closes the exporter
+    '''
+    global _exporter, _hook
+
+    if _hook is not None:
+        remove_hook(_hook)
+        _hook = None
+
+    if _exporter is not None:
+        _exporter.close()
+        _exporter = None
+
+
+def current_span():
+    '''Returns the current span of the current greenlet, or None'''
+    return _current.get(greenlet.getcurrent())
+
+
+@contextmanager
+def span(name, **tags):
+    '''
+        A context manager that records a span, which is a child of the
+        current span of the current greenlet. Within the context, the new
+        span is the current span, and greenlets created within the context
+        inherit it. If tracing is not enabled, this yields None.
+
+        :param name: Name of the span
+        :param tags: Tags to set on the span
+    '''
+
+    if _hook is None:
+        yield None
+        return
+
+    gr = greenlet.getcurrent()
+    parent = _current.get(gr)
+
+    if parent is None:
+        new_span = Span(name, '%032x' % random.getrandbits(128), None, tags)
+    else:
+        new_span = Span(name, parent.trace_id, parent.span_id, tags)
+
+    _current[gr] = new_span
+    try:
+        yield new_span
+    except Exception as e:
+        new_span.set_tag('error', repr(e))
+        raise
+    finally:
+        new_span.end = time.time()
+
+        if parent is None:
+            _current.pop(gr, None)
+        else:
+            _current[gr] = parent
+
+        if _exporter is not None:
+            _exporter.export(new_span)
@@ -1,7 +1,10 @@
 #!/usr/bin/env python
 
 from os.path import join, dirname
-from distutils.core import setup
+try:
+    from setuptools import setup
+except ImportError:
+    from distutils.core import setup
 
 setup_dir = dirname(__file__)
 exec(compile(open(join(setup_dir, 'greenado', 'version.py')).read(), 'version.py', 'exec'), {}, globals())        
@@ -17,7 +20,17 @@ setup(
     license="Apache 2.0",
     url='https://github.com/virtuald/greenado',
     packages=['greenado'],
-    install_requires=['greenlet', 'tornado'],
+    install_requires=[
+        'greenlet',
+        'tornado',
+        # concurrent.futures, used by greenado.threads
+        'futures; python_version<"3"',
+    ],
+    entry_points={
+        'console_scripts': [
+            'greenado-loadgen = greenado.loadgen:main',
+        ],
+    },
     classifiers = [
         "Development Status :: 5 - Production/Stable",
         "License :: OSI Approved :: Apache Software License",
@@ -0,0 +1,94 @@
+import socket
+import sys
+import time
+
+import greenado
+from greenado.blocking import BlockingCallError, BlockingDetector
+
+import pytest
+
+from tornado.ioloop import IOLoop
+
+
+def _sleeper():
+    time.sleep(0)
+
+
+def test_count_only_in_groutines():
+
+    with BlockingDetector(mode='count') as detector:
+        time.sleep(0)
+        IOLoop.current().run_sync(greenado.groutine(_sleeper))
+
+    assert dict(detector.counts) == {('_sleeper', 'time.sleep'): 1}
+
+    # stopped detectors don't count anything
+    IOLoop.current().run_sync(greenado.groutine(_sleeper))
+    assert detector.counts[('_sleeper', 'time.sleep')] == 1
+
+
+def test_raise():
+
+    with BlockingDetector(mode='raise'):
+        with pytest.raises(BlockingCallError):
+            IOLoop.current().run_sync(greenado.groutine(_sleeper))
+
+
+def test_warn(caplog):
+
+    with BlockingDetector(mode='warn'):
+        for _ in range(2):
+            IOLoop.current().run_sync(greenado.groutine(_sleeper))
+
+    messages = [r.getMessage() for r in caplog.records
+                if 'Blocking call' in r.getMessage()]
+
+    # warned once per call site
+    assert len(messages) == 1
+    assert 'time.sleep' in messages[0]
+    assert 'groutine _sleeper' in messages[0]
+    assert 'test_blocking.py' in messages[0]
+
+
+def test_socket_connect():
+
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(2)
+    address = listener.getsockname()
+
+    def _connect(blocking):
+        sock = socket.socket()
+        sock.setblocking(blocking)
+        try:
+            sock.connect(address)
+        except socket.error:
+            pass
+        finally:
+            sock.close()
+
+    try:
+        with BlockingDetector(mode='count') as detector:
+            IOLoop.current().run_sync(lambda: greenado.gcall(_connect, True))
+            IOLoop.current().run_sync(lambda: greenado.gcall(_connect, False))
+    finally:
+        listener.close()
+
+    connects = [n for (name, event), n in detector.counts.items()
+                if event == 'socket.connect']
+    assert connects == [1]
+
+
+@pytest.mark.skipif(sys.version_info < (3, 8), reason="requires audit hooks")
+def test_open(tmpdir):
+
+    path = str(tmpdir.join('data'))
+
+    def _write():
+        with open(path, 'w') as fp:
+            fp.write('data')
+
+    with BlockingDetector(mode='count', events=['open']) as detector:
+        IOLoop.current().run_sync(lambda: greenado.gcall(_write))
+
+    assert sum(detector.counts.values()) == 1
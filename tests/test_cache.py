@@ -0,0 +1,120 @@
+import greenado
+
+import pytest
+
+from tornado.ioloop import IOLoop
+
+
+class DummyException(Exception):
+    pass
+
+
+def test_cached_hit():
+
+    calls = []
+
+    @greenado.cached(maxsize=2)
+    def _lookup(key):
+        calls.append(key)
+        greenado.gmoment()
+        return key * 2
+
+    @greenado.groutine
+    def _main():
+        assert _lookup(1) == 2
+        assert _lookup(1) == 2
+        assert _lookup(2) == 4
+        assert _lookup(3) == 6
+
+        # 1 is least recently used, and was evicted
+        assert _lookup(1) == 2
+        return _lookup.cache_info()
+
+    info = IOLoop.current().run_sync(_main)
+    assert calls == [1, 2, 3, 1]
+    assert info.hits == 1
+    assert info.misses == 4
+    assert info.currsize == 2
+
+
+def test_cached_coalesced():
+
+    calls = []
+
+    @greenado.cached()
+    def _lookup(key, extra=None):
+        calls.append(key)
+        greenado.gsleep(0.01)
+        return key
+
+    @greenado.groutine
+    def _main():
+        futures = [greenado.gcall(_lookup, 1) for _ in range(5)]
+        futures.append(greenado.gcall(_lookup, 1, extra=1))
+        return [greenado.gyield(f) for f in futures]
+
+    assert IOLoop.current().run_sync(_main) == [1] * 6
+    assert calls == [1, 1]
+
+    info = _lookup.cache_info()
+    assert info.misses == 2
+    assert info.coalesced == 4
+
+
+def test_cached_error():
+
+    calls = []
+
+    @greenado.cached()
+    def _lookup():
+        calls.append(True)
+        greenado.gmoment()
+        raise DummyException()
+
+    @greenado.groutine
+    def _main():
+        f1 = greenado.gcall(_lookup)
+        f2 = greenado.gcall(_lookup)
+        for f in (f1, f2):
+            with pytest.raises(DummyException):
+                greenado.gyield(f)
+
+        # errors are not cached
+        with pytest.raises(DummyException):
+            _lookup()
+
+        return True
+
+    assert IOLoop.current().run_sync(_main) == True
+    assert len(calls) == 2
+
+
+def test_cached_ttl():
+
+    calls = []
+
+    @greenado.cached(ttl=0.05, stale_ttl=1)
+    def _lookup():
+        calls.append(True)
+        greenado.gmoment()
+        return len(calls)
+
+    @greenado.groutine
+    def _main():
+        assert _lookup() == 1
+        assert _lookup() == 1
+
+        greenado.gsleep(0.1)
+
+        # stale result is returned, and refreshed in the background
+        assert _lookup() == 1
+        greenado.gsleep(0.01)
+        assert _lookup() == 2
+        assert _lookup.cache_info().stale == 1
+
+        _lookup.cache_clear()
+        assert _lookup() == 3
+        return True
+
+    assert IOLoop.current().run_sync(_main) == True
+    assert _lookup.cache_info().stale == 0
@@ -0,0 +1,89 @@
+import os
+import signal
+
+import greenado
+from greenado import debug
+
+import pytest
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+
+def _waiter(future, timeout):
+    return greenado.gyield(future, timeout=timeout)
+
+
+def test_groutines():
+
+    @greenado.groutine
+    def _main():
+        f1 = gen.Future()
+        f2 = gen.Future()
+
+        g1 = greenado.gcall(_waiter, f1, None)
+        greenado.gsleep(0.05)
+        g2 = greenado.gcall(_waiter, f2, 10)
+
+        infos = [info for info in debug.groutines() if info.fn is _waiter]
+        assert [info.waiting_on for info in infos] == [f1, f2]
+        assert infos[0].wait_age >= 0.05
+        assert infos[0].timeout_remaining is None
+        assert 9 < infos[1].timeout_remaining <= 10
+        assert infos[0].stack[-1][2] == 'gyield'
+        assert infos[0].stack[-2][2] == '_waiter'
+
+        running = [info for info in debug.groutines() if info.fn.__name__ == '_main']
+        assert running[0].waiting_on is None
+        assert running[0].stack[-1][2] == '_main'
+
+        output = debug.format_groutines()
+        assert 'Groutine _waiter waiting on' in output
+        assert '(timeout in ' in output
+        assert 'Groutine _main (running)' in output
+
+        f1.set_result(1)
+        f2.set_result(2)
+        return greenado.gyield(g1) + greenado.gyield(g2)
+
+    assert IOLoop.current().run_sync(_main) == 3
+
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGUSR1'), reason="requires SIGUSR1")
+def test_signal_handler(tmpdir):
+
+    path = str(tmpdir.join('dump.txt'))
+
+    @greenado.groutine
+    def _main():
+        with open(path, 'w') as fp:
+            old = debug.install_signal_handler(file=fp)
+            try:
+                os.kill(os.getpid(), signal.SIGUSR1)
+                greenado.gsleep(0.01)
+            finally:
+                signal.signal(signal.SIGUSR1, old)
+
+    IOLoop.current().run_sync(_main)
+
+    with open(path) as fp:
+        assert 'Groutine _main (running)' in fp.read()
+
+
+def test_dump_while_spawning(tmpdir):
+
+    from greenado import concurrent
+
+    path = str(tmpdir.join('dump.txt'))
+
+    @greenado.groutine
+    def _main():
+        # a signal handler can interrupt gcall() while it holds the lock
+        with open(path, 'w') as fp:
+            with concurrent._live_lock:
+                debug.dump_groutines(fp)
+
+    IOLoop.current().run_sync(_main)
+
+    with open(path) as fp:
+        assert 'Groutine _main (running)' in fp.read()
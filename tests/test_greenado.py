@@ -1,12 +1,18 @@
 
 from contextlib import contextmanager
+import gc
 import greenado
+from greenado.testing import VirtualClock
+import greenlet
 
 import pytest
 
 from tornado import gen, concurrent, stack_context
 from tornado.ioloop import IOLoop
+import sys
 import time
+import traceback
+import weakref
 
 
 class DummyException(Exception):
@@ -129,6 +135,76 @@ def test_generator_retval_3():
     assert main_retval == 1235
 
 
+def test_generator_multi_list():
+    '''Ensure a list of futures can be yielded'''
+
+    future1 = concurrent.Future()
+    future2 = concurrent.Future()
+
+    def callback():
+        future2.set_result(2)
+        future1.set_result(1)
+
+    @greenado.groutine
+    @greenado.generator
+    def _main():
+        IOLoop.current().add_callback(callback)
+        done = concurrent.Future()
+        done.set_result(3)
+
+        retval = yield [future1, future2, done]
+        raise gen.Return(retval)
+
+    main_retval = IOLoop.current().run_sync(_main)
+    assert main_retval == [1, 2, 3]
+
+
+def test_generator_multi_dict():
+    '''Ensure a dict of futures can be yielded'''
+
+    future1 = concurrent.Future()
+
+    @greenado.groutine
+    @greenado.generator
+    def _main():
+        IOLoop.current().add_callback(future1.set_result, 1)
+
+        retval = yield {'a': future1, 'b': gen.maybe_future(2)}
+        assert (yield {}) == {}
+        assert (yield []) == []
+        raise gen.Return(retval)
+
+    main_retval = IOLoop.current().run_sync(_main)
+    assert main_retval == {'a': 1, 'b': 2}
+
+
+def test_generator_multi_error():
+    '''Ensure errors in a yielded list are propagated'''
+
+    future1 = concurrent.Future()
+    future2 = concurrent.Future()
+
+    def callback():
+        future1.set_exception(DummyException())
+
+    @greenado.groutine
+    @greenado.generator
+    def _main():
+        IOLoop.current().add_callback(callback)
+
+        with pytest.raises(DummyException):
+            yield [future1, future2]
+
+        with pytest.raises(gen.BadYieldError):
+            yield [1234]
+
+        future2.set_result(True)
+        raise gen.Return(True)
+
+    main_retval = IOLoop.current().run_sync(_main)
+    assert main_retval == True
+
+
 def test_gyield_error():
     '''Ensure errors are propagated to the gyield caller'''
     
@@ -191,6 +267,81 @@ def test_gyield_timeout_success():
     main_retval = IOLoop.current().run_sync(_main)
     assert main_retval == 1236
 
+def test_gyield_timeout_cancel_groutine():
+
+    events = []
+
+    def _child():
+        try:
+            greenado.gsleep(5)
+        except greenado.CancelledError:
+            events.append('cancelled')
+            raise
+
+    @greenado.groutine
+    def _main():
+        child = greenado.gcall(_child)
+        with pytest.raises(greenado.TimeoutError):
+            greenado.gyield(child, timeout=0.01, cancel_on_timeout=True)
+
+        assert events == ['cancelled']
+        assert child.done()
+        with pytest.raises(greenado.CancelledError):
+            child.result()
+        return True
+
+    assert IOLoop.current().run_sync(_main) == True
+
+
+def test_gyield_timeout_cancel_other_groutine():
+
+    events = []
+
+    def _child():
+        greenado.gsleep(0.05)
+        events.append('finished')
+        return 1
+
+    @greenado.groutine
+    def _main():
+        # started by another greenlet, which may still want the result
+        started = []
+        IOLoop.current().add_callback(lambda: started.append(greenado.gcall(_child)))
+        greenado.gmoment()
+        child = started[0]
+
+        with pytest.raises(greenado.TimeoutError):
+            greenado.gyield(child, timeout=0.01, cancel_on_timeout=True)
+
+        assert not child.done()
+        assert greenado.gyield(child) == 1
+        return events
+
+    assert IOLoop.current().run_sync(_main) == ['finished']
+
+
+def test_gyield_timeout_cancel_future(caplog):
+
+    cleaned_up = []
+    future = concurrent.Future()
+
+    @greenado.groutine
+    def _main():
+        with pytest.raises(greenado.TimeoutError):
+            greenado.gyield(future, timeout=0.01,
+                            cancel_on_timeout=cleaned_up.append)
+
+        # errors from a cancelled operation are not logged
+        if not future.done():
+            future.set_exception(ValueError())
+        greenado.gmoment()
+        return True
+
+    assert IOLoop.current().run_sync(_main) == True
+    assert cleaned_up == [future]
+    assert 'timeout expired' not in caplog.text
+
+
 def test_generator_error():
     '''Ensure errors are propagated to the yield caller'''
     
@@ -679,3 +830,400 @@ def test_sc_correctness_gcall2():
     assert main_retval == True
 
 
+
+
+def test_hooks():
+
+    events = []
+
+    class _Hook(greenado.GreenletHook):
+        def on_spawn(self, gr, parent, fn):
+            events.append(('spawn', fn.__name__))
+        def on_suspend(self, gr, future):
+            events.append(('suspend', future is not None))
+        def on_resume(self, gr):
+            events.append(('resume',))
+        def on_finish(self, gr):
+            events.append(('finish',))
+
+    @greenado.groutine
+    def _main():
+        greenado.gmoment()
+        greenado.gyield(gen.sleep(0.01))
+        greenado.gsleep(0.01)
+
+    hook = _Hook()
+    greenado.add_hook(hook)
+    try:
+        IOLoop.current().run_sync(_main)
+    finally:
+        greenado.remove_hook(hook)
+
+    assert events == [
+        ('spawn', '_main'),
+        ('suspend', False), ('resume',),
+        ('suspend', True), ('resume',),
+        ('suspend', False), ('resume',),
+        ('finish',),
+    ]
+
+
+def _resume_order():
+
+    order = []
+    futures = [concurrent.Future(), concurrent.Future()]
+
+    def _waiter(name, future):
+        greenado.gyield(future)
+        order.append(name)
+
+    @greenado.groutine
+    def _main():
+        low = greenado.gcall_priority(_waiter, greenado.PRIORITY_LOW, 'low', futures[0])
+        high = greenado.gcall_priority(_waiter, greenado.PRIORITY_HIGH, 'high', futures[1])
+
+        # both become ready in the same IOLoop iteration
+        futures[0].set_result(None)
+        futures[1].set_result(None)
+
+        greenado.gyield(low)
+        greenado.gyield(high)
+
+    try:
+        IOLoop.current().run_sync(_main)
+    finally:
+        greenado.configure_priorities(enabled=False)
+    return order
+
+
+def test_priority_order():
+    assert _resume_order() == ['high', 'low']
+
+
+def test_priority_aging():
+    greenado.configure_priorities(aging=0)
+    try:
+        assert _resume_order() == ['low', 'high']
+    finally:
+        greenado.configure_priorities(aging=0.05)
+
+
+def test_priority_inherited():
+
+    @greenado.groutine(priority=greenado.PRIORITY_HIGH)
+    def _main():
+        child = greenado.gcall(lambda: greenlet.getcurrent().priority)
+        return greenlet.getcurrent().priority, greenado.gyield(child)
+
+    try:
+        assert IOLoop.current().run_sync(_main) == (greenado.PRIORITY_HIGH,
+                                                    greenado.PRIORITY_HIGH)
+    finally:
+        greenado.configure_priorities(enabled=False)
+
+
+def test_priority_kwarg_passed_through():
+
+    def _fn(priority):
+        return priority
+
+    @greenado.groutine
+    def _main():
+        return greenado.gyield(greenado.gcall(_fn, priority='mine'))
+
+    assert IOLoop.current().run_sync(_main) == 'mine'
+    assert not greenado.concurrent._prioritized
+
+
+def test_checkpoint():
+
+    ticks = [0]
+    running = [True]
+
+    def _ticker():
+        while running[0]:
+            ticks[0] += 1
+            greenado.gmoment()
+
+    def _busy(ms):
+        end = time.time() + ms / 1000.0
+        while time.time() < end:
+            pass
+        return ms
+
+    @greenado.groutine
+    def _main():
+        ticker = greenado.gcall(_ticker)
+
+        # doesn't yield if the time slice hasn't been used
+        greenado.gmoment()
+        before = ticks[0]
+        greenado.checkpoint(time_slice=10)
+        assert ticks[0] == before
+
+        # a zero time slice always yields
+        greenado.checkpoint(time_slice=0)
+        assert ticks[0] == before + 1
+        before = ticks[0]
+
+        # yields regularly in a long loop
+        results = list(greenado.gmap(_busy, [2] * 20))
+        assert results == [2] * 20
+        middle = ticks[0]
+        assert middle - before >= 5
+
+        for _ in greenado.giter(range(20), time_slice=0.001):
+            _busy(2)
+        assert ticks[0] - middle >= 10
+
+        running[0] = False
+        greenado.gyield(ticker)
+
+    greenado.set_time_slice(0.005)
+    try:
+        IOLoop.current().run_sync(_main)
+    finally:
+        greenado.set_time_slice(0.01)
+
+
+class _Local(object):
+    pass
+
+def _failing_groutine(ref):
+    local = _Local()
+    ref.append(weakref.ref(local))
+    raise ValueError("failed")
+
+@pytest.mark.skipif(sys.version_info < (3, 4), reason="requires frame.clear()")
+@pytest.mark.parametrize('mode', ['full', 'clear_locals', 'compact'])
+def test_traceback_mode(mode):
+
+    ref = []
+
+    greenado.set_traceback_mode(mode)
+    try:
+        future = greenado.gcall(_failing_groutine, ref)
+    finally:
+        greenado.set_traceback_mode('full')
+
+    exc = future.exception()
+    assert isinstance(exc, ValueError)
+    gc.collect()
+
+    if mode == 'full':
+        assert ref[0]() is not None
+        assert '_failing_groutine' in ''.join(traceback.format_tb(exc.__traceback__))
+    elif mode == 'clear_locals':
+        assert ref[0]() is None
+        assert '_failing_groutine' in ''.join(traceback.format_tb(exc.__traceback__))
+    else:
+        assert ref[0]() is None
+        assert exc.__traceback__ is None
+        assert '_failing_groutine' in exc.greenado_traceback
+
+
+def _run_periodic(fn_delay, skip_missed, stop_after):
+
+    calls = []
+
+    @greenado.groutine
+    def _main():
+        io_loop = IOLoop.current()
+        start = io_loop.time()
+
+        def _fn():
+            calls.append(io_loop.time() - start)
+            if fn_delay:
+                greenado.gsleep(fn_delay)
+
+        periodic = greenado.gperiodic(1, _fn, skip_missed=skip_missed)
+        greenado.gsleep(stop_after)
+        periodic.stop()
+        greenado.gyield(periodic.future)
+        return periodic
+
+    with VirtualClock(IOLoop.current()):
+        periodic = IOLoop.current().run_sync(_main)
+
+    return periodic, [round(c, 3) for c in calls]
+
+
+def test_gperiodic_fixed_rate():
+    periodic, calls = _run_periodic(0.25, True, 4.5)
+    assert calls == [1, 2, 3, 4]
+    assert periodic.ticks == 4
+    assert periodic.missed == 0
+    assert periodic.max_lag < 0.01
+
+
+def test_gperiodic_skip_missed():
+    periodic, calls = _run_periodic(1.5, True, 6.5)
+    assert calls == [1, 3, 5]
+    assert periodic.missed == 3
+
+    periodic, calls = _run_periodic(1.5, False, 6.5)
+    assert calls == [1, 2.5, 4, 5.5]
+    assert periodic.missed == 0
+    assert round(periodic.max_lag, 3) == 1.5
+
+
+def test_stack_usage():
+
+    futures = [concurrent.Future() for _ in range(10)]
+
+    def _recurse(future, depth):
+        if depth:
+            return _recurse(future, depth - 1)
+        return greenado.gyield(future)
+
+    @greenado.groutine
+    def _main():
+        children = [greenado.gcall(_recurse, f, 50) for f in futures]
+        usage = greenado.stack_usage()
+
+        from greenado.debug import groutines
+        infos = [i for i in groutines() if i.fn is _recurse]
+
+        for f in futures:
+            f.set_result(None)
+        for child in children:
+            greenado.gyield(child)
+        return usage, infos
+
+    usage, infos = IOLoop.current().run_sync(_main)
+    assert usage > 0
+    assert len(infos) == 10
+    assert sum(i.stack_bytes for i in infos) > 0
+
+
+def test_stack_budget_reject():
+
+    future = concurrent.Future()
+
+    @greenado.groutine
+    def _main():
+        parked = greenado.gcall(greenado.gyield, future)
+        greenado.set_stack_budget(0, wait=False)
+        try:
+            rejected = greenado.gcall(lambda: 1)
+        finally:
+            greenado.set_stack_budget(None)
+
+        future.set_result(None)
+        greenado.gyield(parked)
+        return rejected
+
+    rejected = IOLoop.current().run_sync(_main)
+    with pytest.raises(greenado.StackBudgetExceeded):
+        rejected.result()
+
+
+def test_stack_budget_wait():
+
+    calls = []
+
+    @greenado.groutine
+    def _main():
+        greenado.set_stack_budget(0, interval=0.01)
+        try:
+            deferred = greenado.gcall(calls.append, 1)
+            assert not deferred.done()
+            assert calls == []
+
+            # removing the budget starts the waiting calls
+            greenado.set_stack_budget(None)
+            greenado.gyield(deferred)
+        finally:
+            greenado.set_stack_budget(None)
+
+    IOLoop.current().run_sync(_main)
+    assert calls == [1]
+
+
+def test_prewarm():
+
+    greenlets = []
+
+    def _work(x):
+        greenlets.append(greenlet.getcurrent())
+        greenado.gmoment()
+        return x * 2
+
+    @greenado.groutine
+    def _main():
+        results = []
+        for x in range(3):
+            results.append(greenado.gyield(greenado.gcall(_work, x)))
+
+        # a child that finishes after its pooled parent went back to the pool
+        child = []
+        def _spawner():
+            child.append(greenado.gcall(greenado.gsleep, 0.01))
+        greenado.gyield(greenado.gcall(_spawner))
+        greenado.gyield(child[0])
+        results.append(greenado.gyield(greenado.gcall(_work, 3)))
+        return results
+
+    greenado.prewarm(2)
+    try:
+        assert IOLoop.current().run_sync(_main) == [0, 2, 4, 6]
+    finally:
+        greenado.prewarm(0)
+
+    # the same pooled greenlet ran each call
+    assert greenlets[0] is greenlets[1] is greenlets[2]
+
+
+def test_prewarm_nested_parking():
+
+    future = concurrent.Future()
+    children = []
+
+    def _child():
+        greenado.gyield(future)
+        # the greenlet that ran _spawner must not be handed out as a child
+        # of this one, since it is this one's parent
+        return greenado.gyield(greenado.gcall(lambda: 5))
+
+    def _spawner():
+        children.append(greenado.gcall(_child))
+
+    @greenado.groutine
+    def _main():
+        greenado.gyield(greenado.gcall(_spawner))
+        future.set_result(None)
+        return greenado.gyield(children[0])
+
+    greenado.prewarm(2)
+    try:
+        assert IOLoop.current().run_sync(_main) == 5
+    finally:
+        greenado.prewarm(0)
+
+
+def test_prewarm_raw_descendant():
+
+    results = []
+
+    @greenado.groutine
+    def _main():
+        # a plain greenlet whose parent is a pooled greenlet calls gcall
+        # after that greenlet has gone back to the pool
+        raw = []
+
+        def _make_raw():
+            raw.append(greenlet.greenlet(
+                lambda: results.append(greenado.gyield(greenado.gcall(lambda: 7)))))
+
+        greenado.gyield(greenado.gcall(_make_raw))
+        raw[0].switch()
+        while len(results) < 1:
+            greenado.gmoment()
+
+    greenado.prewarm(2)
+    try:
+        IOLoop.current().run_sync(_main)
+    finally:
+        greenado.prewarm(0)
+
+    assert results == [7]
@@ -0,0 +1,143 @@
+import gc
+
+import greenado
+from greenado.hedging import hedge_clear, hedge_info
+
+import pytest
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+
+class _Backend(object):
+    '''Returns futures that resolve after the next delay in a list'''
+
+    def __init__(self, delays, fail=()):
+        self.delays = list(delays)
+        self.fail = fail
+        self.calls = 0
+
+    @greenado.groutine
+    def fetch(self, value):
+        n = self.calls
+        self.calls += 1
+        greenado.gsleep(self.delays[n])
+        if n in self.fail:
+            raise ValueError(n)
+        return '%s-%d' % (value, n)
+
+
+def test_hedged_win():
+
+    backend = _Backend([0.5, 0.01])
+
+    @greenado.groutine
+    def _main():
+        return greenado.hedged(backend.fetch, 'x', delay=0.05)
+
+    try:
+        assert IOLoop.current().run_sync(_main) == 'x-1'
+        assert backend.calls == 2
+
+        info = hedge_info(backend.fetch)
+        assert (info.calls, info.hedges, info.wins, info.losses) == (1, 1, 1, 0)
+    finally:
+        hedge_clear()
+
+
+def test_hedged_not_needed():
+
+    backend = _Backend([0.01])
+
+    @greenado.groutine
+    def _main():
+        return greenado.hedged(backend.fetch, 'x', delay=0.05)
+
+    try:
+        assert IOLoop.current().run_sync(_main) == 'x-0'
+        assert backend.calls == 1
+        assert hedge_info(backend.fetch).hedges == 0
+    finally:
+        hedge_clear()
+
+
+def test_hedged_adaptive():
+
+    backend = _Backend([0.001] * 20 + [0.5, 0.001])
+
+    @greenado.groutine
+    def _main():
+        # no hedging until there are enough samples
+        for _ in range(20):
+            greenado.hedged(backend.fetch, 'x')
+        assert backend.calls == 20
+        assert hedge_info(backend.fetch).delay is not None
+
+        return greenado.hedged(backend.fetch, 'x')
+
+    try:
+        assert IOLoop.current().run_sync(_main) == 'x-21'
+        assert hedge_info(backend.fetch).wins == 1
+    finally:
+        hedge_clear()
+
+
+def test_hedged_errors():
+
+    backend = _Backend([0.1, 0.01, 0.2], fail=(0, 1))
+
+    @greenado.groutine
+    def _main():
+        return greenado.hedged(backend.fetch, 'x', delay=0.02, max_hedges=2)
+
+    try:
+        # the first call to fail doesn't fail the whole call, the third wins
+        assert IOLoop.current().run_sync(_main) == 'x-2'
+
+        backend.calls = 0
+        backend.delays = [0.01]
+        with pytest.raises(ValueError):
+            IOLoop.current().run_sync(_main)
+    finally:
+        hedge_clear()
+
+
+def test_tracker_dropped_with_function():
+
+    from greenado import hedging
+
+    count = len(hedging._trackers)
+    fn = lambda: gen.moment
+    assert hedge_info(fn).calls == 0
+    assert len(hedging._trackers) == count + 1
+
+    del fn
+    gc.collect()
+    assert len(hedging._trackers) == count
+
+
+def test_tracker_per_instance():
+
+    from greenado import hedging
+
+    first = _Backend([0.01] * 20)
+    second = _Backend([0.01] * 20)
+
+    @greenado.groutine
+    def _main():
+        for _ in range(3):
+            greenado.hedged(first.fetch, 'x')
+        greenado.hedged(second.fetch, 'x')
+
+    try:
+        IOLoop.current().run_sync(_main)
+        assert hedge_info(first.fetch).calls == 3
+        assert hedge_info(second.fetch).calls == 1
+
+        # dropped along with the instance
+        count = len(hedging._method_trackers)
+        del first
+        gc.collect()
+        assert len(hedging._method_trackers) == count - 1
+    finally:
+        hedge_clear()
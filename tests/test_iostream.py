@@ -0,0 +1,188 @@
+import socket
+import struct
+
+import greenado
+from greenado.iostream import GreenStream
+
+import pytest
+
+from tornado.ioloop import IOLoop
+from tornado.iostream import IOStream, StreamClosedError, UnsatisfiableReadError
+
+
+def _stream_pair():
+    a, b = socket.socketpair()
+    return IOStream(a), IOStream(b)
+
+
+def test_read_buffered():
+
+    @greenado.groutine
+    def _main():
+        left, right = _stream_pair()
+        stream = GreenStream(right)
+
+        reads = [0]
+        read_bytes = right.read_bytes
+        def _counting_read_bytes(*args, **kwargs):
+            reads[0] += 1
+            return read_bytes(*args, **kwargs)
+        right.read_bytes = _counting_read_bytes
+
+        frames = [b'hello', b'', b'world' * 100]
+        greenado.gyield(left.write(b''.join(struct.pack('>I', len(f)) + f for f in frames)))
+
+        results = []
+        for _ in frames:
+            length = struct.unpack('>I', stream.read_exactly(4))[0]
+            data = stream.read_exactly(length)
+            assert isinstance(data, memoryview)
+            results.append(data.tobytes())
+
+        assert results == frames
+        assert stream.buffered == 0
+
+        # everything was read from the stream at once
+        assert reads[0] == 1
+
+        left.close()
+        with pytest.raises(StreamClosedError):
+            stream.read_exactly(1)
+
+        return True
+
+    assert IOLoop.current().run_sync(_main) == True
+
+
+def test_read_until():
+
+    @greenado.groutine
+    def _main():
+        left, right = _stream_pair()
+        stream = GreenStream(right, read_chunk_size=4)
+
+        left.write(b'first line\r\nsecond line\nthird')
+        assert stream.read_until(b'\r\n').tobytes() == b'first line\r\n'
+        assert stream.readline().tobytes() == b'second line\n'
+
+        left.write(b' line without an end')
+        with pytest.raises(UnsatisfiableReadError):
+            stream.readline(max_bytes=10)
+
+        left.close()
+        right.close()
+        return True
+
+    assert IOLoop.current().run_sync(_main) == True
+
+
+def test_write_coalesced():
+
+    @greenado.groutine
+    def _main():
+        left, right = _stream_pair()
+        stream = GreenStream(left, write_buffer_size=10)
+
+        writes = []
+        write = left.write
+        def _recording_write(data, *args, **kwargs):
+            writes.append(data)
+            return write(data, *args, **kwargs)
+        left.write = _recording_write
+
+        for c in b'abc':
+            stream.write(struct.pack('B', c))
+
+        # written at the end of the IOLoop iteration
+        assert writes == []
+        greenado.gmoment()
+        assert writes == [b'abc']
+
+        stream.write(b'd' * 5)
+        stream.write(b'e' * 5)
+        assert writes == [b'abc', b'dddddeeeee']
+
+        stream.write(b'f')
+        stream.flush()
+        assert writes[-1] == b'f'
+
+        data = greenado.gyield(right.read_bytes(14))
+        assert data == b'abcdddddeeeeef'
+
+        stream.close()
+        right.close()
+        return True
+
+    assert IOLoop.current().run_sync(_main) == True
+
+
+def test_read_across_chunks():
+
+    @greenado.groutine
+    def _main():
+        left, right = _stream_pair()
+        stream = GreenStream(right, read_chunk_size=3)
+
+        greenado.gyield(left.write(b'abcdefgh--ijklmnop\r\n\r\nqrs'))
+
+        assert stream.read_exactly(2).tobytes() == b'ab'
+        # spans several chunks
+        assert stream.read_exactly(6).tobytes() == b'cdefgh'
+        assert stream.read_until(b'--').tobytes() == b'--'
+        # the delimiter is split between chunks
+        assert stream.read_until(b'\r\n\r\n').tobytes() == b'ijklmnop\r\n\r\n'
+        assert stream.read_exactly(3).tobytes() == b'qrs'
+        assert stream.buffered == 0
+
+        left.close()
+        right.close()
+        return True
+
+    assert IOLoop.current().run_sync(_main) == True
+
+
+def test_write_error():
+
+    @greenado.groutine
+    def _main():
+        left, right = _stream_pair()
+        stream = GreenStream(left)
+        left.close()
+
+        # sent from an IOLoop callback, the error is kept for the caller
+        stream.write(b'lost')
+        greenado.gmoment()
+        with pytest.raises(StreamClosedError):
+            stream.write(b'more')
+
+        stream = GreenStream(left)
+        stream.write(b'lost')
+        with pytest.raises(StreamClosedError):
+            stream.flush()
+
+        right.close()
+        return True
+
+    assert IOLoop.current().run_sync(_main) == True
+
+
+def test_close_sends_pending_writes():
+
+    @greenado.groutine
+    def _main():
+        left, right = _stream_pair()
+        stream = GreenStream(left)
+
+        # larger than the socket buffer, so most of it is still queued in
+        # the IOStream when close() is called
+        payload = b'x' * (8 * 1024 * 1024)
+        reader = right.read_until_close()
+
+        stream.write(payload)
+        stream.close()
+
+        data = greenado.gyield(reader)
+        right.close()
+        return len(data) == len(payload)
+
+    assert IOLoop.current().run_sync(_main) == True
@@ -0,0 +1,277 @@
+import sys
+import textwrap
+
+import greenado
+
+import pytest
+
+import tornado
+from tornado import concurrent, gen
+from tornado.ioloop import IOLoop
+
+pytestmark = pytest.mark.skipif(sys.version_info < (3, 5),
+                                reason="async iterators require Python 3.5")
+
+
+class DummyException(Exception):
+    pass
+
+
+if sys.version_info >= (3, 6):
+    exec(textwrap.dedent('''
+        async def _agen(n, burst=None):
+            for i in range(n):
+                if burst and i and i % burst == 0:
+                    future = concurrent.Future()
+                    IOLoop.current().add_callback(future.set_result, None)
+                    await future
+                yield i
+
+        async def _async_for(ait):
+            return [item async for item in ait]
+
+        async def _agen_tasks(n):
+            for i in range(n):
+                await asyncio.sleep(0)
+                yield _current_task() is not None
+
+        async def _agen_cancelled():
+            yield 0
+            future = asyncio.Future()
+            future.cancel()
+            await future
+
+        async def _agen_closed(log):
+            try:
+                for i in range(10):
+                    await asyncio.sleep(0)
+                    yield i
+            finally:
+                log.append('closed')
+    '''))
+
+    import asyncio
+    _current_task = getattr(asyncio, 'current_task', None) or asyncio.Task.current_task
+
+_needs_asyncio = pytest.mark.skipif(sys.version_info < (3, 6) or tornado.version_info < (5,),
+                                    reason="requires async generators on asyncio")
+
+
+@gen.coroutine
+def _consume(ait):
+    '''Equivalent of an async for loop'''
+    items = []
+    ait = ait.__aiter__()
+    while True:
+        try:
+            item = yield ait.__anext__()
+        except StopAsyncIteration:
+            break
+        items.append(item)
+    raise gen.Return(items)
+
+
+def test_aiter_from():
+
+    produced = []
+
+    def _gen(n):
+        for i in range(n):
+            if i % 3 == 0:
+                greenado.gmoment()
+            produced.append(i)
+            yield i
+
+    ait = greenado.aiter_from(_gen, 10, max_buffer=2)
+
+    @gen.coroutine
+    def _main():
+        ait_ = ait.__aiter__()
+        first = yield ait_.__anext__()
+
+        # the generator is suspended once it is max_buffer items ahead
+        for _ in range(5):
+            yield gen.moment
+        assert len(produced) <= 1 + 2 + 1
+
+        rest = yield _consume(ait_)
+        raise gen.Return([first] + rest)
+
+    assert IOLoop.current().run_sync(_main) == list(range(10))
+
+
+def test_aiter_from_error():
+
+    def _gen():
+        yield 1
+        greenado.gmoment()
+        raise DummyException()
+
+    @gen.coroutine
+    def _main():
+        ait = greenado.aiter_from(_gen).__aiter__()
+        assert (yield ait.__anext__()) == 1
+        with pytest.raises(DummyException):
+            yield ait.__anext__()
+
+    IOLoop.current().run_sync(_main)
+
+
+class _AsyncRange(object):
+    '''An async iterator that produces items in bursts'''
+
+    def __init__(self, n, burst):
+        self.n = n
+        self.burst = burst
+        self.i = 0
+        self.fail = False
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        future = concurrent.Future()
+        i = self.i
+        self.i += 1
+
+        if i >= self.n:
+            if self.fail:
+                future.set_exception(DummyException())
+            else:
+                future.set_exception(StopAsyncIteration())
+        elif i % self.burst == 0:
+            IOLoop.current().add_callback(future.set_result, i)
+        else:
+            future.set_result(i)
+        return future
+
+
+def test_iter_from():
+
+    switches = []
+
+    class _Hook(greenado.GreenletHook):
+        def on_suspend(self, gr, future):
+            switches.append(future)
+
+    @greenado.groutine
+    def _main():
+        hook = _Hook()
+        greenado.add_hook(hook)
+        try:
+            return list(greenado.iter_from(_AsyncRange(100, 10)))
+        finally:
+            greenado.remove_hook(hook)
+
+    assert IOLoop.current().run_sync(_main) == list(range(100))
+    # one switch per burst, not per item
+    assert 5 <= len(switches) <= 11
+
+
+def test_iter_from_error():
+
+    @greenado.groutine
+    def _main():
+        source = _AsyncRange(5, 2)
+        source.fail = True
+
+        items = []
+        with pytest.raises(DummyException):
+            for item in greenado.iter_from(source):
+                items.append(item)
+        return items
+
+    assert IOLoop.current().run_sync(_main) == list(range(5))
+
+
+def _count_switches(fn):
+
+    switches = []
+
+    class _Hook(greenado.GreenletHook):
+        def on_suspend(self, gr, future):
+            switches.append(future)
+
+    @greenado.groutine
+    def _main():
+        hook = _Hook()
+        greenado.add_hook(hook)
+        try:
+            return fn()
+        finally:
+            greenado.remove_hook(hook)
+
+    return IOLoop.current().run_sync(_main), len(switches)
+
+
+@pytest.mark.skipif(sys.version_info < (3, 6), reason="requires async generators")
+def test_iter_from_async_generator():
+
+    items, switches = _count_switches(lambda: list(greenado.iter_from(_agen(100))))
+    assert items == list(range(100))
+
+    items, switches = _count_switches(lambda: list(greenado.iter_from(_agen(100, 25))))
+    assert items == list(range(100))
+
+
+@_needs_asyncio
+def test_iter_from_runs_in_task():
+
+    # each item is read in a task, like async for does
+    items, switches = _count_switches(lambda: list(greenado.iter_from(_agen_tasks(5))))
+    assert items == [True] * 5
+
+
+@_needs_asyncio
+def test_iter_from_cancelled():
+
+    @greenado.groutine
+    def _main():
+        items = []
+        with pytest.raises(asyncio.CancelledError):
+            for item in greenado.iter_from(_agen_cancelled()):
+                items.append(item)
+        return items
+
+    assert IOLoop.current().run_sync(_main, timeout=5) == [0]
+
+
+@_needs_asyncio
+def test_iter_from_early_break():
+
+    log = []
+
+    @greenado.groutine
+    def _main():
+        it = greenado.iter_from(_agen_closed(log))
+        assert next(it) == 0
+        it.close()
+        greenado.gsleep(0.01)
+        assert log == ['closed']
+
+        # abandoning the iterator closes the source too
+        for item in greenado.iter_from(_agen_closed(log)):
+            break
+        greenado.gsleep(0.01)
+        assert log == ['closed', 'closed']
+
+    IOLoop.current().run_sync(_main, timeout=5)
+
+
+@pytest.mark.skipif(sys.version_info < (3, 6), reason="requires async generators")
+def test_aiter_from_async_for():
+
+    def _gen(n):
+        for i in range(n):
+            if i % 3 == 0:
+                greenado.gmoment()
+            yield i
+
+    items = IOLoop.current().run_sync(
+        lambda: _async_for(greenado.aiter_from(_gen, 10, max_buffer=2)))
+    assert items == list(range(10))
+
+    # and the other way around
+    items, _ = _count_switches(
+        lambda: list(greenado.iter_from(greenado.aiter_from(_gen, 100))))
+    assert items == list(range(100))
@@ -0,0 +1,98 @@
+import greenado
+from greenado.leaks import LeakDetector, LeakError
+
+import pytest
+
+from tornado import concurrent
+from tornado.ioloop import IOLoop
+
+
+def _wait_forever(future=None):
+    if future is None:
+        future = concurrent.Future()
+    greenado.gyield(future)
+
+
+def _own(leaks):
+    # other tests may have left greenlets suspended
+    return [leak for leak in leaks if leak.fn is _wait_forever]
+
+
+def test_leak_age():
+
+    held = concurrent.Future()
+    detector = LeakDetector(max_age=0.05, unreachable_age=None)
+
+    @greenado.groutine
+    def _main():
+        detector.start()
+        try:
+            leaked = greenado.gcall(_wait_forever, held)
+            greenado.gsleep(0.1)
+            leaks = _own(detector.check())
+        finally:
+            detector.stop()
+
+        assert len(leaks) == 1
+        leak = leaks[0]
+        assert leak.fn is _wait_forever
+        assert leak.reason == 'age'
+        assert leak.waiting_on is held
+        assert leak.wait_age >= 0.05
+        assert leak.spawn_stack[-1][2] == '_main'
+        assert leak.stack[-1][2] == 'gyield'
+        assert '_wait_forever' in detector.format(leaks)
+
+        held.set_result(None)
+        greenado.gyield(leaked)
+        return True
+
+    assert IOLoop.current().run_sync(_main) == True
+
+
+def test_leak_unreachable():
+
+    held = concurrent.Future()
+    detector = LeakDetector(max_age=None, unreachable_age=0, kill=True)
+
+    @greenado.groutine
+    def _main():
+        reachable = greenado.gcall(_wait_forever, held)
+        leaked = greenado.gcall(_wait_forever)
+
+        leaks = _own(detector.check())
+        assert [leak.reason for leak in leaks] == ['unreachable']
+        assert leaks[0].waiting_on is not held
+        with pytest.raises(LeakError):
+            leaked.result()
+
+        held.set_result(None)
+        greenado.gyield(reachable)
+        return True
+
+    assert IOLoop.current().run_sync(_main) == True
+
+
+def test_leak_kill():
+
+    reports = []
+    detector = LeakDetector(max_age=None, unreachable_age=0, interval=0.01,
+                            kill=True, report=reports.append)
+
+    @greenado.groutine
+    def _main():
+        detector.start()
+        try:
+            leaked = greenado.gcall(_wait_forever)
+            greenado.gsleep(0.05)
+        finally:
+            detector.stop()
+
+        leaks = _own(reports[0])
+        assert len(leaks) == 1
+        assert leaks[0].greenlet.dead
+        with pytest.raises(LeakError):
+            greenado.gyield(leaked)
+        return True
+
+    assert IOLoop.current().run_sync(_main) == True
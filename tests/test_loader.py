@@ -0,0 +1,92 @@
+import greenado
+from greenado.loader import BatchLoader
+
+import pytest
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+
+class DummyException(Exception):
+    pass
+
+
+def test_batch_loader():
+
+    batches = []
+
+    def _batch_fn(keys):
+        batches.append(keys)
+        greenado.gmoment()
+        return [key * 2 for key in keys]
+
+    loader = BatchLoader(_batch_fn)
+
+    @greenado.groutine
+    def _load(key):
+        return loader.load(key)
+
+    @greenado.groutine
+    def _main():
+        futures = [_load(i) for i in range(5)] + [_load(1)]
+        results = [greenado.gyield(f) for f in futures]
+
+        # cached
+        assert loader.load(3) == 6
+        return results
+
+    assert IOLoop.current().run_sync(_main) == [0, 2, 4, 6, 8, 2]
+    assert batches == [[0, 1, 2, 3, 4]]
+    assert loader.batch_sizes == {5: 1}
+    assert loader.cache_hits == 2
+
+
+def test_batch_loader_max_batch_size():
+
+    batches = []
+
+    @gen.coroutine
+    def _batch_fn(keys):
+        batches.append(keys)
+        raise gen.Return(keys)
+
+    loader = BatchLoader(_batch_fn, max_batch_size=2, max_delay=0.01, cache=False)
+
+    @greenado.groutine
+    def _main():
+        return loader.load_many([1, 2, 3, 2])
+
+    assert IOLoop.current().run_sync(_main) == [1, 2, 3, 2]
+    assert batches == [[1, 2], [3, 2]]
+    assert loader.batch_sizes == {2: 2}
+
+
+def test_batch_loader_errors():
+
+    def _batch_fn(keys):
+        if keys == ['fail']:
+            raise DummyException()
+        return [KeyError(key) if key == 'missing' else key for key in keys]
+
+    loader = BatchLoader(_batch_fn)
+
+    @greenado.groutine
+    def _main():
+        f1 = greenado.gcall(loader.load, 'ok')
+        f2 = greenado.gcall(loader.load, 'missing')
+        assert greenado.gyield(f1) == 'ok'
+        with pytest.raises(KeyError):
+            greenado.gyield(f2)
+
+        with pytest.raises(DummyException):
+            loader.load('fail')
+
+        # errors are not cached
+        assert 'missing' not in loader._futures
+        assert 'fail' not in loader._futures
+
+        loader.prime('primed', 1234)
+        assert loader.load('primed') == 1234
+        return True
+
+    assert IOLoop.current().run_sync(_main) == True
@@ -0,0 +1,63 @@
+import greenado
+from greenado.loadgen import Histogram, LoadGenerator
+from greenado.testing import gen_test
+
+from tornado.testing import AsyncHTTPTestCase
+from tornado.web import Application, RequestHandler
+
+
+class DummyException(Exception):
+    pass
+
+
+class HelloHandler(RequestHandler):
+    def get(self):
+        self.write("Hello")
+
+
+class LoadGeneratorTests(AsyncHTTPTestCase):
+
+    def get_app(self):
+        return Application([('/', HelloHandler)])
+
+    @gen_test
+    def test_url(self):
+        generator = LoadGenerator(self.get_url('/'), concurrency=4,
+                                  rate=500, requests=50)
+        report = generator.run()
+
+        assert report.requests == 50
+        assert report.errors == 0
+        assert report.throughput > 0
+        assert report.latency.count == 50
+        assert 0 < report.latency.percentile(50) <= report.latency.percentile(100)
+        assert 'throughput' in report.format()
+
+    @gen_test
+    def test_callable(self):
+        calls = []
+
+        def _request():
+            calls.append(True)
+            fail = len(calls) % 2
+            greenado.gmoment()
+            if fail:
+                raise DummyException()
+
+        report = LoadGenerator(_request, concurrency=2, duration=0.1).run()
+
+        assert report.requests == len(calls)
+        assert report.errors == (len(calls) + 1) // 2
+        assert report.elapsed >= 0.1
+
+
+def test_histogram():
+    histogram = Histogram()
+    for i in range(1, 1001):
+        histogram.record(i / 1000.0)
+
+    assert histogram.count == 1000
+    assert abs(histogram.mean() - 0.5005) < 0.001
+    assert abs(histogram.percentile(50) - 0.5) < 0.005
+    assert abs(histogram.percentile(99) - 0.99) < 0.01
+    assert histogram.percentile(100) == 1.0
@@ -0,0 +1,106 @@
+import greenado
+from greenado.pipeline import Pipeline, Stage
+
+import pytest
+
+from tornado.ioloop import IOLoop
+
+
+class DummyException(Exception):
+    pass
+
+
+def _enrich(item):
+    greenado.gsleep(0.001 * (item % 3 + 1))
+    return item + 1
+
+
+def test_pipeline_results():
+
+    pipeline = Pipeline(
+        int,
+        Stage(_enrich, concurrency=5, buffer=10),
+        Stage(lambda item: item * 2, name='double'),
+    )
+
+    @greenado.groutine
+    def _main():
+        return list(pipeline.run(str(i) for i in range(50)))
+
+    results = IOLoop.current().run_sync(_main)
+    assert sorted(results) == [(i + 1) * 2 for i in range(50)]
+
+    stats = pipeline.stats()
+    assert [s.name for s in stats] == ['int', '_enrich', 'double']
+    assert [s.processed for s in stats] == [50, 50, 50]
+    assert all(s.queue_depth == 0 for s in stats)
+    assert stats[1].max_queue_depth <= 10
+    assert stats[1].busy > 0
+    assert 0 < stats[1].utilization <= 1
+
+
+def test_pipeline_run_once():
+
+    pipeline = Pipeline(int)
+    pipeline.run(['1'])
+
+    # even though the first run hasn't been iterated yet
+    with pytest.raises(RuntimeError):
+        pipeline.run(['2'])
+
+
+def test_pipeline_backpressure():
+
+    read = [0]
+
+    def _source():
+        for i in range(1000):
+            read[0] += 1
+            yield i
+
+    def _slow(item):
+        greenado.gsleep(0.01)
+        return item
+
+    pipeline = Pipeline(Stage(lambda item: item, buffer=5),
+                        Stage(_slow, concurrency=2, buffer=3))
+
+    @greenado.groutine
+    def _main():
+        results = pipeline.run(_source())
+        for i, _ in enumerate(results):
+            if i == 5:
+                break
+
+        # only the buffers and the items being processed were read ahead
+        assert read[0] <= 20
+        greenado.gmoment()
+        return read[0]
+
+    # stopping early stops reading from the source
+    assert IOLoop.current().run_sync(_main) <= 20
+
+
+def test_pipeline_error():
+
+    def _fail(item):
+        if item == 7:
+            raise DummyException()
+        return item
+
+    pipeline = Pipeline(Stage(_fail, concurrency=3))
+
+    @greenado.groutine
+    def _main():
+        results = []
+        with pytest.raises(DummyException):
+            for item in pipeline.run(range(100)):
+                results.append(item)
+        return results
+
+    results = IOLoop.current().run_sync(_main)
+    assert 7 not in results
+    assert len(results) < 100
+
+    with pytest.raises(RuntimeError):
+        pipeline.run([])
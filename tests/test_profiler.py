@@ -0,0 +1,62 @@
+import signal
+import time
+
+import greenado
+from greenado.profiler import Profiler
+
+import pytest
+
+from tornado.ioloop import IOLoop
+
+
+pytestmark = pytest.mark.skipif(not hasattr(signal, 'setitimer'),
+                                reason="requires signal.setitimer")
+
+
+def _busy(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        sum(range(100))
+
+
+@greenado.groutine
+def _cpu_groutine():
+    _busy(0.2)
+
+
+@greenado.groutine
+def _waiting_groutine():
+    greenado.gsleep(0.2)
+
+
+def test_profiler(tmpdir):
+
+    @greenado.groutine
+    def _main():
+        f = _waiting_groutine()
+        greenado.gyield(_cpu_groutine())
+        greenado.gyield(f)
+
+    profiler = Profiler(interval=0.001)
+    profiler.start()
+    try:
+        IOLoop.current().run_sync(_main)
+    finally:
+        profiler.stop()
+
+    cpu = profiler.collapsed()
+    busy = [line for line in cpu.splitlines() if '_busy' in line]
+    assert busy
+    for line in busy:
+        assert line.startswith('test_profiler._cpu_groutine;_cpu_groutine (test_profiler.py:')
+
+    waits = dict(line.rsplit(' ', 1) for line in profiler.collapsed(wait=True).splitlines())
+    sleeping = [stack for stack in waits if stack.startswith('test_profiler._waiting_groutine;')]
+    assert len(sleeping) == 1
+    assert sleeping[0].endswith(';gsleep (concurrent.py:%d)' % greenado.gsleep.__code__.co_firstlineno)
+    assert int(waits[sleeping[0]]) >= 150
+
+    path = str(tmpdir.join('cpu.txt'))
+    profiler.write_collapsed(path)
+    with open(path) as fp:
+        assert fp.read() == cpu
@@ -0,0 +1,134 @@
+import greenado
+from greenado.ratelimit import KeyedRateLimiter, RateLimiter
+from greenado.testing import VirtualClock
+
+import pytest
+
+from tornado.ioloop import IOLoop
+
+
+def _run(fn):
+    io_loop = IOLoop.current()
+    with VirtualClock(io_loop):
+        return io_loop.run_sync(greenado.groutine(fn))
+
+
+def _times(limiter, count, acquire=None):
+    io_loop = IOLoop.current()
+    start = io_loop.time()
+    times = []
+
+    def _acquire(name):
+        (acquire or limiter.acquire)()
+        times.append((name, round(io_loop.time() - start, 3)))
+
+    futures = [greenado.gcall(_acquire, i) for i in range(count)]
+    for future in futures:
+        greenado.gyield(future)
+    return times
+
+
+def test_acquire():
+    limiter = RateLimiter(10, burst=2)
+
+    def _main():
+        return _times(limiter, 5)
+
+    # waiters get tokens in the order they arrived
+    assert _run(_main) == [(0, 0), (1, 0), (2, 0.1), (3, 0.2), (4, 0.3)]
+
+
+def test_shared_timer():
+    limiter = RateLimiter(10, burst=1)
+
+    def _main():
+        future = greenado.gcall(_times, limiter, 10)
+        # one entry for the limiter, not one per waiter
+        counts = len(limiter._timer.heap), limiter.waiting
+        greenado.gyield(future)
+        return counts
+
+    assert _run(_main) == (1, 9)
+
+
+def test_acquire_timeout():
+    limiter = RateLimiter(1, burst=1)
+
+    def _main():
+        io_loop = IOLoop.current()
+        start = io_loop.time()
+
+        limiter.acquire()
+        with pytest.raises(greenado.TimeoutError):
+            limiter.acquire(timeout=0.5)
+        assert round(io_loop.time() - start, 3) == 0.5
+
+        # the waiter that timed out didn't take any tokens
+        limiter.acquire()
+        return round(io_loop.time() - start, 3)
+
+    assert _run(_main) == 1
+
+
+def test_try_acquire():
+    limiter = RateLimiter(1, burst=2)
+
+    def _main():
+        assert limiter.try_acquire(2)
+        assert not limiter.try_acquire()
+        greenado.gsleep(1)
+        assert limiter.try_acquire()
+
+    _run(_main)
+
+    with pytest.raises(ValueError):
+        limiter.acquire(3)
+
+
+def test_keyed():
+    limiter = KeyedRateLimiter(10, burst=1, idle_timeout=5)
+
+    def _main():
+        io_loop = IOLoop.current()
+        start = io_loop.time()
+
+        times = {}
+        def _acquire(key):
+            limiter.acquire(key)
+            times.setdefault(key, []).append(round(io_loop.time() - start, 3))
+
+        futures = [greenado.gcall(_acquire, key) for key in 'aabb']
+        for future in futures:
+            greenado.gyield(future)
+
+        assert len(limiter) == 2
+
+        # idle keys are dropped when the limiter is next used
+        greenado.gsleep(10)
+        limiter.try_acquire('c')
+        return times, sorted(limiter._limiters)
+
+    times, keys = _run(_main)
+    assert times == {'a': [0, 0.1], 'b': [0, 0.1]}
+    assert keys == ['c']
+
+
+def test_keyed_slow_refill():
+    # buckets take longer than idle_timeout to refill
+    limiter = KeyedRateLimiter(0.1, burst=1, idle_timeout=5)
+
+    def _main():
+        limiter.try_acquire('a')
+        limiter.try_acquire('b')
+        updated = limiter._limiters['a'].updated
+
+        # checking for idle keys doesn't refill the ones that are kept
+        greenado.gsleep(6)
+        limiter.try_acquire('c')
+        assert limiter._limiters['a'].updated == updated
+
+        greenado.gsleep(5)
+        limiter.try_acquire('d')
+        return sorted(limiter._limiters)
+
+    assert _run(_main) == ['c', 'd']
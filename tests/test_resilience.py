@@ -0,0 +1,187 @@
+import greenado
+from greenado.resilience import circuit_breaker, CircuitOpenError, retry, RetryBudget
+from greenado.testing import VirtualClock
+
+import pytest
+
+from tornado.ioloop import IOLoop
+
+
+class BackendError(Exception):
+    pass
+
+
+def _run(fn):
+    io_loop = IOLoop.current()
+    with VirtualClock(io_loop):
+        return io_loop.run_sync(greenado.groutine(fn))
+
+
+def _call(fn):
+    try:
+        fn()
+    except CircuitOpenError:
+        return 'open'
+    except BackendError:
+        return 'failed'
+    return 'ok'
+
+
+def test_circuit_breaker():
+
+    healthy = [False]
+    calls = []
+
+    @circuit_breaker(failure_rate=0.5, min_calls=4, window=10, reset_timeout=5)
+    def backend():
+        calls.append(IOLoop.current().time())
+        greenado.gsleep(0.1)
+        if not healthy[0]:
+            raise BackendError()
+
+    def _main():
+        results = [_call(backend) for _ in range(6)]
+        assert backend.breaker_info().state == 'open'
+
+        # half open after the reset timeout, and the probe fails
+        greenado.gsleep(5)
+        assert backend.breaker_info().state == 'half_open'
+        results.append(_call(backend))
+        results.append(_call(backend))
+
+        # the next probe succeeds, and the breaker closes
+        greenado.gsleep(5)
+        healthy[0] = True
+        results.append(_call(backend))
+        results.append(_call(backend))
+        return results
+
+    results = _run(_main)
+    assert results == ['failed'] * 4 + ['open'] * 2 + \
+                      ['failed', 'open'] + ['ok', 'ok']
+    assert len(calls) == 7
+
+    info = backend.breaker_info()
+    assert info.state == 'closed'
+    assert info.rejected == 3
+
+    backend.breaker_reset()
+    assert backend.breaker_info().rejected == 0
+
+
+def test_circuit_breaker_half_open_probes():
+
+    @circuit_breaker(min_calls=1, reset_timeout=1)
+    def backend(fail):
+        greenado.gsleep(0.5)
+        if fail:
+            raise BackendError()
+
+    def _main():
+        _call(lambda: backend(True))
+        greenado.gsleep(1)
+
+        # only one probe at a time
+        probe = greenado.gcall(backend, False)
+        assert _call(lambda: backend(False)) == 'open'
+        greenado.gyield(probe)
+        assert _call(lambda: backend(False)) == 'ok'
+
+    _run(_main)
+
+
+def test_circuit_breaker_ignored_exceptions():
+
+    @circuit_breaker(min_calls=1, failures=(BackendError,))
+    def backend():
+        raise KeyError()
+
+    def _main():
+        for _ in range(3):
+            with pytest.raises(KeyError):
+                backend()
+        return backend.breaker_info()
+
+    info = _run(_main)
+    assert info.state == 'closed'
+    assert info.failures == 0
+
+
+def test_circuit_breaker_ignored_exception_probe():
+
+    @circuit_breaker(min_calls=1, reset_timeout=1, failures=(BackendError,))
+    def backend(error):
+        raise error()
+
+    def _main():
+        _call(lambda: backend(BackendError))
+        greenado.gsleep(1)
+
+        # a probe that raises an ignored exception closes the breaker
+        with pytest.raises(KeyError):
+            backend(KeyError)
+        return backend.breaker_info()
+
+    assert _run(_main).state == 'closed'
+
+
+def test_retry():
+
+    attempts = []
+
+    def flaky():
+        attempts.append(IOLoop.current().time())
+        if len(attempts) < 3:
+            raise BackendError()
+        return 42
+
+    def _main():
+        return retry(flaky, attempts=3, backoff=1, budget=RetryBudget())
+
+    assert _run(_main) == 42
+    assert len(attempts) == 3
+
+    # the delays are jittered, but never longer than the exponential backoff
+    assert 0 <= attempts[1] - attempts[0] <= 1
+    assert 0 <= attempts[2] - attempts[1] <= 2
+
+
+def test_retry_gives_up():
+
+    attempts = []
+
+    def failing():
+        attempts.append(1)
+        raise BackendError()
+
+    def _main():
+        with pytest.raises(BackendError):
+            retry(failing, attempts=2, budget=RetryBudget())
+
+        # other exceptions aren't retried
+        with pytest.raises(BackendError):
+            retry(failing, attempts=5, retry_on=(KeyError,), budget=RetryBudget())
+
+    _run(_main)
+    assert len(attempts) == 3
+
+
+def test_retry_budget():
+
+    budget = RetryBudget(ratio=0.5, min_per_second=0, window=10)
+    attempts = []
+
+    def failing():
+        attempts.append(1)
+        raise BackendError()
+
+    def _main():
+        for _ in range(4):
+            with pytest.raises(BackendError):
+                retry(failing, attempts=10, backoff=0, budget=budget)
+
+    _run(_main)
+
+    # 4 calls may make 2 retries between them
+    assert len(attempts) == 6
+    assert budget.exhausted == 4
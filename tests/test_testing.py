@@ -1,10 +1,19 @@
 
+from datetime import timedelta
+import socket
+import threading
+import time
+
 import greenado
 
-from greenado.testing import gen_test
+from greenado.testing import explore, gen_test, InterleavingError, replay
 from tornado.testing import AsyncTestCase
 
 from tornado import gen
+from tornado.ioloop import TimeoutError
+from tornado.iostream import IOStream
+
+import pytest
 
 @gen.coroutine
 def coroutine():
@@ -31,3 +40,161 @@ class GreenadoTests(AsyncTestCase):
     def test_with_timeout2(self):
         assert (yield coroutine()) == 1234
     
+
+
+class VirtualTimeTests(AsyncTestCase):
+
+    @gen_test(virtual_time=True)
+    def test_gsleep(self):
+        start_real = time.time()
+        start = self.io_loop.time()
+
+        greenado.gsleep(30)
+
+        assert self.io_loop.time() - start >= 30
+        assert time.time() - start_real < 5
+
+    @gen_test(virtual_time=True)
+    def test_gyield_timeout(self):
+        start = self.io_loop.time()
+
+        with pytest.raises(greenado.TimeoutError):
+            greenado.gyield(gen.Future(), timeout=30)
+
+        assert self.io_loop.time() - start == 30
+
+    @gen_test(virtual_time=True)
+    def test_ordering(self):
+        order = []
+
+        def _sleeper(n):
+            greenado.gsleep(n)
+            order.append(n)
+
+        futures = [greenado.gcall(_sleeper, n) for n in (3, 1, 2)]
+        self.io_loop.add_timeout(timedelta(seconds=1.5), order.append, 1.5)
+        for f in futures:
+            greenado.gyield(f)
+
+        assert order == [1, 1.5, 2, 3]
+
+    def test_real_timeout(self):
+
+        @gen_test(timeout=0.1, virtual_time=True)
+        def _hang(self):
+            greenado.gyield(gen.Future())
+
+        with pytest.raises(TimeoutError):
+            _hang(self)
+
+        # the virtual clock was removed
+        assert 'time' not in self.io_loop.__dict__
+
+    @pytest.mark.skipif(not hasattr(time, 'process_time'),
+                        reason="requires time.process_time")
+    @gen_test(virtual_time=True)
+    def test_idle_without_spinning(self):
+        a, b = socket.socketpair()
+        stream = IOStream(a)
+
+        def _write():
+            time.sleep(0.3)
+            b.send(b'x')
+
+        threading.Thread(target=_write).start()
+        start = time.process_time()
+        try:
+            assert greenado.gyield(stream.read_bytes(1)) == b'x'
+        finally:
+            stream.close()
+            b.close()
+
+        # waiting on the socket doesn't keep the CPU busy
+        assert time.process_time() - start < 0.15
+
+
+def _two_groutines(events):
+
+    def _worker(name):
+        greenado.gmoment()
+        events.append(name)
+
+    def scenario():
+        del events[:]
+        futures = [greenado.gcall(_worker, 'a'), greenado.gcall(_worker, 'b')]
+        for future in futures:
+            greenado.gyield(future)
+
+    return scenario
+
+
+def test_explore_finds_race():
+    events = []
+
+    def scenario():
+        _two_groutines(events)()
+        assert events == ['a', 'b']
+
+    with pytest.raises(InterleavingError) as excinfo:
+        explore(scenario, runs=50)
+
+    error = excinfo.value
+    assert error.seed is not None
+
+    # the failing interleaving can be replayed by seed or by schedule
+    with pytest.raises(AssertionError):
+        replay(scenario, seed=error.seed)
+    assert events == ['b', 'a']
+
+    with pytest.raises(AssertionError):
+        replay(scenario, schedule=error.schedule)
+    assert events == ['b', 'a']
+
+
+def test_explore_random_is_deterministic():
+    events = []
+    scenario = _two_groutines(events)
+
+    def _orders():
+        orders = []
+        for seed in range(10):
+            replay(scenario, seed=seed)
+            orders.append(list(events))
+        return orders
+
+    orders = _orders()
+    assert _orders() == orders
+    assert ['a', 'b'] in orders and ['b', 'a'] in orders
+
+
+def test_explore_systematic():
+    seen = []
+
+    def scenario():
+        events = []
+        _two_groutines(events)()
+        seen.append(tuple(events))
+
+    assert explore(scenario, runs=100, systematic=True) == 2
+    assert sorted(seen) == [('a', 'b'), ('b', 'a')]
+
+
+def test_explore_deadlock():
+
+    def scenario():
+        greenado.gyield(gen.Future())
+
+    with pytest.raises(InterleavingError) as excinfo:
+        explore(scenario, runs=1, timeout=0.5)
+    assert 'TimeoutError' in str(excinfo.value)
+
+
+
+def test_current_io_loop_old_tornado(monkeypatch):
+    from greenado import testing
+    from tornado.ioloop import IOLoop
+
+    # before tornado 4.3, IOLoop.current() had no instance argument
+    io_loop = IOLoop.current()
+    monkeypatch.setattr(IOLoop, 'current', staticmethod(lambda: io_loop))
+    assert testing._current_io_loop() is io_loop
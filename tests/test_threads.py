@@ -0,0 +1,190 @@
+import threading
+
+import greenado
+
+import pytest
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+
+class DummyException(Exception):
+    pass
+
+
+def _in_thread(fn):
+    '''Runs fn in another thread, returns a future for its result'''
+
+    future = gen.Future()
+    io_loop = IOLoop.current()
+
+    def _run():
+        try:
+            result = fn()
+        except Exception as e:
+            io_loop.add_callback(future.set_exception, e)
+        else:
+            io_loop.add_callback(future.set_result, result)
+
+    threading.Thread(target=_run).start()
+    return future
+
+
+def test_submit_threadsafe_result():
+
+    def _fn(x):
+        greenado.gmoment()
+        return x + 1
+
+    @greenado.groutine
+    def _main():
+        io_loop = IOLoop.current()
+
+        def _worker():
+            cf = greenado.submit_threadsafe(_fn, 1, io_loop=io_loop)
+            return cf.result(timeout=5)
+
+        return greenado.gyield(_in_thread(_worker))
+
+    assert IOLoop.current().run_sync(_main) == 2
+
+
+def test_submit_threadsafe_error():
+
+    def _fn():
+        greenado.gmoment()
+        raise DummyException()
+
+    @greenado.groutine
+    def _main():
+        io_loop = IOLoop.current()
+
+        def _worker():
+            cf = greenado.submit_threadsafe(_fn, io_loop=io_loop)
+            with pytest.raises(DummyException):
+                cf.result(timeout=5)
+            return True
+
+        return greenado.gyield(_in_thread(_worker))
+
+    assert IOLoop.current().run_sync(_main) == True
+
+
+def test_submit_threadsafe_batched():
+    '''A burst of submissions only wakes up the IOLoop once'''
+
+    @greenado.groutine
+    def _main():
+        io_loop = IOLoop.current()
+        wakeups = [0]
+
+        add_callback = io_loop.add_callback
+        def _counting_add_callback(*args, **kwargs):
+            wakeups[0] += 1
+            return add_callback(*args, **kwargs)
+
+        io_loop.add_callback = _counting_add_callback
+        try:
+            def _worker():
+                cfs = [greenado.submit_threadsafe(lambda i=i: i, io_loop=io_loop)
+                       for i in range(100)]
+                return [cf.result(timeout=5) for cf in cfs]
+
+            # the loop is blocked until the burst has been submitted
+            cfs = [greenado.submit_threadsafe(lambda i=i: i) for i in range(100)]
+            assert wakeups[0] == 1
+
+            assert greenado.gyield(_in_thread(_worker)) == list(range(100))
+            assert [cf.result() for cf in cfs] == list(range(100))
+        finally:
+            del io_loop.add_callback
+
+        return True
+
+    assert IOLoop.current().run_sync(_main) == True
+
+
+def _thread_name(delay=None):
+    if delay:
+        greenado.gsleep(delay)
+    return threading.current_thread().name
+
+
+def test_loop_group_key():
+
+    with greenado.LoopGroup(3, name='test-group') as group:
+        names = [group.submit(_thread_name, key=key).result(timeout=5)
+                 for key in (1, 2, 3, 1, 2, 3)]
+
+    assert names[:3] == names[3:]
+    assert len(set(names)) == 3
+    assert all(name.startswith('test-group-') for name in names)
+
+
+def test_loop_group_least_loaded():
+
+    with greenado.LoopGroup(2) as group:
+        cfutures = [group.submit(_thread_name, 0.1) for _ in range(4)]
+        assert group.load() == [2, 2]
+
+        names = [cf.result(timeout=5) for cf in cfutures]
+        assert sorted(set(names)) == ['greenado-loop-0', 'greenado-loop-1']
+
+    with pytest.raises(RuntimeError):
+        group.submit(_thread_name)
+
+
+def test_loop_group_stop_fails_pending():
+
+    group = greenado.LoopGroup(2)
+    group.start()
+    try:
+        cfutures = [group.submit(_thread_name, 30) for _ in range(4)]
+    finally:
+        group.stop(timeout=5)
+
+    for cf in cfutures:
+        with pytest.raises(RuntimeError):
+            cf.result(timeout=5)
+
+
+def test_loop_group_inspect_while_spawning():
+    '''Live groutines can be listed while other threads create them'''
+
+    from greenado import debug
+
+    def _spawner(n):
+        futures = [greenado.gcall(_thread_name, 0.001) for _ in range(n)]
+        for future in futures:
+            greenado.gyield(future)
+
+    with greenado.LoopGroup(4) as group:
+        cfutures = [group.submit(_spawner, 500) for _ in range(40)]
+        while not all(cf.done() for cf in cfutures):
+            debug.groutines()
+            greenado.stack_usage()
+
+        for cf in cfutures:
+            cf.result(timeout=5)
+
+
+def test_loop_group_stop_during_submit(monkeypatch):
+
+    from greenado import threads
+
+    group = greenado.LoopGroup(1)
+    group.start()
+
+    # the group is stopped after submit() picked an IOLoop
+    submit_threadsafe = threads.submit_threadsafe
+    def _stopping_submit(*args, **kwargs):
+        group.stop(timeout=5)
+        return submit_threadsafe(*args, **kwargs)
+    monkeypatch.setattr(threads, 'submit_threadsafe', _stopping_submit)
+
+    cfuture = group.submit(_thread_name, 0)
+    with pytest.raises(RuntimeError):
+        cfuture.result(timeout=5)
+
+    with pytest.raises(RuntimeError):
+        group.submit(_thread_name, 0)
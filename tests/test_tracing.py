@@ -0,0 +1,101 @@
+import json
+
+import greenado
+from greenado import tracing
+
+import pytest
+
+from tornado.ioloop import IOLoop
+
+
+@pytest.fixture
+def exporter():
+    exporter = tracing.InMemoryExporter()
+    tracing.enable(exporter)
+    yield exporter
+    tracing.disable()
+
+
+def test_span_per_greenlet(exporter):
+
+    @greenado.groutine
+    def _child(name):
+        assert tracing.current_span().name == 'parent'
+        with tracing.span(name):
+            greenado.gmoment()
+            assert tracing.current_span().name == name
+        return tracing.current_span().name
+
+    @greenado.groutine
+    def _main():
+        with tracing.span('parent', tag=1) as parent:
+            f1 = _child('child1')
+            f2 = _child('child2')
+
+            # switching back from the children doesn't change our span
+            assert tracing.current_span() is parent
+
+            assert greenado.gyield(f1) == 'parent'
+            assert greenado.gyield(f2) == 'parent'
+
+        assert tracing.current_span() is None
+        return parent
+
+    parent = IOLoop.current().run_sync(_main)
+
+    spans = dict((span.name, span) for span in exporter.spans)
+    assert sorted(spans) == ['child1', 'child2', 'parent']
+    assert spans['parent'].tags == {'tag': 1}
+    assert spans['parent'].parent_id is None
+
+    for name in ('child1', 'child2'):
+        span = spans[name]
+        assert span.trace_id == parent.trace_id
+        assert span.parent_id == parent.span_id
+        assert [e[1] for e in span.events] == ['suspend', 'resume']
+        assert span.end >= span.start
+
+    assert [e[1] for e in parent.events] == ['suspend', 'resume', 'suspend', 'resume']
+
+
+def test_span_error(exporter):
+
+    @greenado.groutine
+    def _main():
+        with tracing.span('failing'):
+            raise ValueError()
+
+    with pytest.raises(ValueError):
+        IOLoop.current().run_sync(_main)
+
+    assert exporter.spans[0].tags['error'] == 'ValueError()'
+
+
+def test_disabled():
+    with tracing.span('nothing') as span:
+        assert span is None
+
+
+def test_json_lines_exporter(tmpdir):
+    path = str(tmpdir.join('spans.jsonl'))
+    tracing.enable(tracing.JsonLinesExporter(path, buffer_size=2))
+
+    try:
+        @greenado.groutine
+        def _main():
+            for i in range(3):
+                with tracing.span('span%d' % i):
+                    greenado.gsleep(0.001)
+
+        IOLoop.current().run_sync(_main)
+
+        with open(path) as fp:
+            assert len(fp.readlines()) == 2
+    finally:
+        tracing.disable()
+
+    with open(path) as fp:
+        spans = [json.loads(line) for line in fp]
+
+    assert [span['name'] for span in spans] == ['span0', 'span1', 'span2']
+    assert [e['name'] for e in spans[0]['events']] == ['suspend', 'resume']